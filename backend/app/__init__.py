@@ -1,7 +1,7 @@
 """
 MoneyLab Flask Application Factory
 """
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
@@ -10,7 +10,7 @@ import os
 db = SQLAlchemy()
 jwt = JWTManager()
 
-def create_app():
+def create_app(test_config=None):
     """Application factory pattern"""
     app = Flask(__name__)
     
@@ -29,33 +29,106 @@ def create_app():
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = False  # For development
     app.config['JWT_ALGORITHM'] = 'HS256'
     
+    # Market quotes
+    app.config['QUOTE_PROVIDER'] = os.environ.get('QUOTE_PROVIDER', 'yahoo')
+    app.config['QUOTE_CACHE_TTL'] = float(os.environ.get('QUOTE_CACHE_TTL', 60))
+    app.config['QUOTE_CACHE_SIZE'] = int(os.environ.get('QUOTE_CACHE_SIZE', 5000))
+    
+    # Price history files (one memory-mapped file per symbol)
+    app.config['PRICE_HISTORY_DIR'] = os.environ.get(
+        'PRICE_HISTORY_DIR',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'price_history')
+    )
+    
+    # Rebalancing result cache: 'memory' (per process), 'sqlite' (shared file) or 'none'
+    app.config['REBALANCE_CACHE_BACKEND'] = os.environ.get('REBALANCE_CACHE_BACKEND', 'memory')
+    app.config['REBALANCE_CACHE_SIZE'] = int(os.environ.get('REBALANCE_CACHE_SIZE', 1024))
+    app.config['REBALANCE_CACHE_TTL'] = float(os.environ.get('REBALANCE_CACHE_TTL', 300))
+    app.config['REBALANCE_CACHE_PATH'] = os.environ.get(
+        'REBALANCE_CACHE_PATH',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'rebalance.sqlite3')
+    )
+    
+    # Record a value snapshot whenever a portfolio total changes
+    app.config['PORTFOLIO_SNAPSHOTS'] = os.environ.get('PORTFOLIO_SNAPSHOTS', 'true').lower() == 'true'
+    
+    # Per-worker database pool (see app.utils.pooling; serve.py sizes it from the thread count)
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    app.config['DB_POOL_SATURATION_LIMIT'] = float(os.environ.get('DB_POOL_SATURATION_LIMIT', 0.9))
+    
+    # Drift monitor band around target allocations, in percentage points (monitor_drift.py)
+    app.config['DRIFT_BAND'] = float(os.environ.get('DRIFT_BAND', 5))
+    
+    # Background jobs (app.services.jobs, run by worker.py)
+    app.config['JOB_WORKER_PROCESSES'] = int(os.environ.get('JOB_WORKER_PROCESSES', os.cpu_count() or 2))
+    app.config['JOB_USER_CONCURRENCY'] = int(os.environ.get('JOB_USER_CONCURRENCY', 2))
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    app.config['JOB_RETRY_BACKOFF'] = float(os.environ.get('JOB_RETRY_BACKOFF', 30))
+    # Seconds a running job's lease lasts without renewal; a dead worker's jobs are requeued after it
+    app.config['JOB_TIMEOUT'] = float(os.environ.get('JOB_TIMEOUT', 900))
+    app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+    
+    # Metrics on /api/metrics (optionally behind a bearer token) and hot-path log sampling
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN') or None
+    app.config['LOG_SAMPLE_EVERY'] = int(os.environ.get('LOG_SAMPLE_EVERY', 100))
+    
+    # X-SQL-Query-Count / X-SQL-Query-Time-Ms response headers (on by default in development, like run.py's debug)
+    app.config['SQL_DEBUG_HEADERS'] = os.environ.get(
+        'SQL_DEBUG_HEADERS', str(os.environ.get('FLASK_ENV') == 'development')
+    ).lower() == 'true'
+    
+    if test_config:
+        app.config.update(test_config)
+    
+    from app.utils.pooling import engine_options
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    
     # Log JWT config (without exposing the actual secret)
-    logging.info(f"JWT_SECRET_KEY is set: {bool(jwt_secret)}")
-    logging.info(f"JWT_SECRET_KEY length: {len(jwt_secret) if jwt_secret else 0}")
+    logging.info("JWT_SECRET_KEY is set: %s", bool(jwt_secret))
+    logging.info("JWT_SECRET_KEY length: %d", len(jwt_secret) if jwt_secret else 0)
     
     # Initialize extensions
     db.init_app(app)
     jwt.init_app(app)
-    CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}}, supports_credentials=True)
     
-    # JWT error handlers
+    from app.utils.query_stats import init_query_stats
+    init_query_stats(app)
+    
+    from app.utils.metrics import init_metrics
+    init_metrics(app)
+    
+    # Registers the snapshot flush listeners
+    from app.utils import snapshots  # noqa: F401
+    
+    # Decrypted values must not outlive the request that read them
+    @app.teardown_appcontext
+    def clear_decrypted_values(exc):
+        from app.models.portfolio import clear_plaintext
+        if db.session.registry.has():
+            for obj in list(db.session.identity_map.values()):
+                clear_plaintext(obj)
+    # Custom response headers are hidden from cross-origin scripts unless exposed
+    CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}}, supports_credentials=True,
+         expose_headers=['X-Next-Cursor', 'X-Cache'])
+    
+    # JWT error handlers (rejections can arrive on every request, so their logging is sampled)
+    from app.utils.log_sampling import SampledLogger
+    auth_log = SampledLogger(logging.getLogger('app.auth'), every=app.config['LOG_SAMPLE_EVERY'])
+    
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
         return jsonify({'error': 'Token has expired'}), 401
     
     @jwt.invalid_token_loader
     def invalid_token_callback(error):
-        from flask import request
-        import logging
-        import traceback
-        logging.error(f"Invalid token error: {str(error)}")
-        logging.error(f"Traceback: {traceback.format_exc()}")
-        # Log the Authorization header if available
-        auth_header = request.headers.get('Authorization', 'Not provided')
-        logging.error(f"Authorization header present: {auth_header != 'Not provided'}")
-        if auth_header != 'Not provided':
-            logging.error(f"Authorization header prefix: {auth_header[:20]}")
-            logging.error(f"Authorization header length: {len(auth_header)}")
+        auth_header = request.headers.get('Authorization', '')
+        auth_log.warning("Invalid token on %s: %s (Authorization header length %d)",
+                         request.path, error, len(auth_header))
         return jsonify({
             'error': 'Invalid token', 
             'details': str(error),
@@ -64,10 +137,7 @@ def create_app():
     
     @jwt.unauthorized_loader
     def missing_token_callback(error):
-        import logging
-        logging.error(f"Missing token error: {str(error)}")
-        auth_header = request.headers.get('Authorization', 'Not provided')
-        logging.error(f"Authorization header: {auth_header[:50] if auth_header != 'Not provided' else 'Not provided'}")
+        auth_log.warning("Missing token on %s: %s", request.path, error)
         return jsonify({
             'error': 'Authorization token is missing', 
             'details': str(error),
@@ -78,14 +148,47 @@ def create_app():
     from app.routes.auth import auth_bp
     from app.routes.portfolio import portfolio_bp
     from app.routes.assets import assets_bp
+    from app.routes.quotes import quotes_bp
+    from app.routes.jobs import jobs_bp
+    from app.routes.export import export_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(portfolio_bp, url_prefix='/api/portfolio')
     app.register_blueprint(assets_bp, url_prefix='/api/assets')
+    app.register_blueprint(quotes_bp, url_prefix='/api/quotes')
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
+    app.register_blueprint(export_bp, url_prefix='/api/export')
+    
+    # Process-wide quote cache shared by all requests
+    from app.services.quotes import create_quote_service
+    app.extensions['quote_service'] = create_quote_service(app.config)
+    
+    from app.utils.price_history import PriceHistoryStore
+    app.extensions['price_history'] = PriceHistoryStore(app.config['PRICE_HISTORY_DIR'])
+    
+    from app.services.rebalance_cache import create_rebalance_cache
+    app.extensions['rebalance_cache'] = create_rebalance_cache(app.config)
+    
+    from app.utils.metrics import REGISTRY
+    REGISTRY.gauge('moneylab_cache_lookups', 'Cache hits and misses since start', lambda: {
+        (('cache', name), ('result', result)): stats[result]
+        for name, stats in _cache_stats(app).items() for result in ('hits', 'misses')
+    })
     
     # Health check endpoint
     @app.route('/api/health')
     def health_check():
-        return {'status': 'healthy', 'message': 'MoneyLab API is running'}, 200
+        return {'status': 'healthy', 'message': 'MoneyLab API is running', 'caches': _cache_stats(app)}, 200
+    
+    # Readiness check with pool saturation (/api/health/ready)
+    from app.utils.pooling import init_pool_health
+    init_pool_health(app)
     
     return app
+
+def _cache_stats(app):
+    """Stats of the process-wide caches that are enabled"""
+    caches = {'quotes': app.extensions['quote_service'].stats()}
+    if app.extensions['rebalance_cache'] is not None:
+        caches['rebalancing'] = app.extensions['rebalance_cache'].stats()
+    return caches
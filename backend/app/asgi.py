@@ -0,0 +1,270 @@
+"""
+ASGI entry point with async read endpoints
+
+The hot read endpoints are served on async SQLAlchemy sessions so a worker
+waiting on the database keeps serving other requests; decryption and
+serialization run in a thread pool so they don't block the event loop.
+Everything else, including every request the fast path can't answer
+exactly as the Flask app would (writes, query strings, conditional GETs,
+missing or invalid tokens), is passed through to the Flask app unchanged.
+
+Async routes:
+    GET /api/portfolio
+    GET /api/portfolio/<id>
+    GET /api/portfolio/<id>/rebalance
+    GET /api/assets/portfolio/<id>/assets
+    GET /api/assets/portfolio/<id>/allocations
+"""
+import asyncio
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from app.models.portfolio import Portfolio, Asset, AssetAllocation
+from app.routes.portfolio import portfolio_detail, rebalancing_result
+from app.utils.etags import portfolio_etag
+from app.utils.metrics import REQUEST_DURATION
+
+# Sync drivers in DATABASE_URI and their asyncio counterparts
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+def async_database_uri(uri: str) -> str:
+    """Map a sync database URI to the matching asyncio driver"""
+    url = make_url(uri)
+    drivername = ASYNC_DRIVERS.get(url.drivername)
+    if drivername is None:
+        raise ValueError(f"No async driver known for '{url.drivername}'; set ASYNC_DATABASE_URI")
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+# Distinct (route, Origin) pairs whose CORS headers are kept (Origin is client-controlled)
+CORS_CACHE_SIZE = 256
+
+class Response:
+    """A complete JSON response"""
+    __slots__ = ('status', 'body', 'headers')
+
+    def __init__(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+class AsyncReadApp:
+    """
+    ASGI application serving the read endpoints asynchronously
+
+    Args:
+        flask_app: The app from create_app(); its config, JSON provider, JWT
+            settings and rebalancing cache are shared, and it answers every
+            request not handled here
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        uri = config.get('ASYNC_DATABASE_URI') or async_database_uri(config['SQLALCHEMY_DATABASE_URI'])
+        self.engine = create_async_engine(uri, **config.get('ASYNC_ENGINE_OPTIONS', {}))
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(config.get('DECRYPT_THREADS', 4)), thread_name_prefix='decrypt'
+        )
+        self.wsgi = WsgiToAsgi(flask_app)
+        # Flask-CORS's after_request hook, so fast-path responses carry the CORS headers Flask would add
+        self.cors = next(
+            (f for f in flask_app.after_request_funcs.get(None, []) if f.__name__ == 'cors_after_request'), None
+        )
+        self._cors_cache: Dict[Tuple[str, str], Dict[str, str]] = {}
+        self.routes: List[Tuple[re.Pattern, str, Callable]] = [
+            (re.compile(r'^/api/portfolio/?$'), '/api/portfolio', self.list_portfolios),
+            (re.compile(r'^/api/portfolio/(\d+)$'), '/api/portfolio/<int:portfolio_id>', self.get_portfolio),
+            (re.compile(r'^/api/portfolio/(\d+)/rebalance$'), '/api/portfolio/<int:portfolio_id>/rebalance',
+             self.get_rebalancing),
+            (re.compile(r'^/api/assets/portfolio/(\d+)/assets$'), '/api/assets/portfolio/<int:portfolio_id>/assets',
+             self.get_assets),
+            (re.compile(r'^/api/assets/portfolio/(\d+)/allocations$'),
+             '/api/assets/portfolio/<int:portfolio_id>/allocations', self.get_allocations),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        route = self._match(scope) if scope['type'] == 'http' else None
+        user_id = self._user_id(scope) if route is not None else None
+        if user_id is None:
+            return await self.wsgi(scope, receive, send)
+
+        started = time.perf_counter()
+        pattern, rule, handler = route
+        args = [int(g) for g in pattern.match(scope['path']).groups()]
+        response = await handler(user_id, *args)
+        response.headers.update(self._cors_headers(scope, rule))
+        REQUEST_DURATION.observe(time.perf_counter() - started, 'GET', rule, str(response.status))
+        await self._send(send, response)
+
+    def _match(self, scope):
+        """The async route for a plain GET, or None to defer to Flask"""
+        if scope['method'] != 'GET' or scope.get('query_string'):
+            return None
+        if any(name == b'if-none-match' for name, _ in scope['headers']):
+            return None
+        for route in self.routes:
+            if route[0].match(scope['path']):
+                return route
+        return None
+
+    def _cors_headers(self, scope, rule: str) -> Dict[str, str]:
+        """CORS headers (origin check, credentials, exposed headers) Flask-CORS sets for this request"""
+        if self.cors is None:
+            return {}
+        origin = next((v for k, v in scope['headers'] if k == b'origin'), b'').decode('latin-1')
+        # GET responses only depend on the route and Origin, so the hook runs once per pair
+        key = (rule, origin)
+        headers = self._cors_cache.get(key)
+        if headers is None:
+            request_headers = {'Origin': origin} if origin else {}
+            with self.flask_app.test_request_context(scope['path'], headers=request_headers):
+                response = self.cors(self.flask_app.response_class())
+            headers = {k: v for k, v in response.headers.items() if k.startswith('Access-Control-') or k == 'Vary'}
+            if len(self._cors_cache) < CORS_CACHE_SIZE:
+                self._cors_cache[key] = headers
+        return headers
+
+    def _user_id(self, scope) -> Optional[int]:
+        """User id from a valid bearer token; None lets Flask report the auth error"""
+        header = next((v for k, v in scope['headers'] if k == b'authorization'), b'').decode('latin-1')
+        if not header.startswith('Bearer '):
+            return None
+        try:
+            with self.flask_app.app_context():
+                claims = decode_token(header[len('Bearer '):])
+            return int(claims[self.flask_app.config['JWT_IDENTITY_CLAIM']])
+        except Exception:
+            return None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def close(self):
+        """Release pooled connections and decryption threads"""
+        await self.engine.dispose()
+        self.executor.shutdown(wait=False)
+
+    async def _offload(self, fn, *args):
+        """Run blocking work (decryption, serialization, cache I/O) in the thread pool"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _json(self, payload, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+        body = (self.flask_app.json.dumps(payload, separators=(',', ':')) + '\n').encode('utf-8')
+        return Response(status, body, headers)
+
+    async def _send(self, send, response: Response):
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(response.body)).encode())]
+        headers += [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers.items()]
+        await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': response.body})
+
+    @staticmethod
+    def _etag_headers(kind: str, portfolio_id: int, version: int) -> Dict[str, str]:
+        return {
+            'ETag': f'"{portfolio_etag(kind, portfolio_id, version, query_string=b"")}"',
+            'Cache-Control': 'private, no-cache',
+        }
+
+    async def list_portfolios(self, user_id: int) -> Response:
+        async with self.sessions() as session:
+            result = await session.execute(
+                select(Portfolio).where(Portfolio.user_id == user_id).order_by(Portfolio.id)
+            )
+            portfolios = result.scalars().all()
+        return self._json(await self._offload(Portfolio.bulk_to_dict, portfolios))
+
+    async def _with_holdings(self, session, portfolio_id: int, user_id: int) -> Optional[Portfolio]:
+        result = await session.execute(
+            select(Portfolio)
+            .options(selectinload(Portfolio.assets), selectinload(Portfolio.allocations))
+            .where(Portfolio.id == portfolio_id, Portfolio.user_id == user_id)
+        )
+        return result.scalars().first()
+
+    async def get_portfolio(self, user_id: int, portfolio_id: int) -> Response:
+        async with self.sessions() as session:
+            portfolio = await self._with_holdings(session, portfolio_id, user_id)
+        if portfolio is None:
+            return self._json({'error': 'Portfolio not found'}, 404)
+        body = await self._offload(portfolio_detail, portfolio)
+        return self._json(body, headers=self._etag_headers('portfolio', portfolio.id, portfolio.version))
+
+    async def get_rebalancing(self, user_id: int, portfolio_id: int) -> Response:
+        cache = self.flask_app.extensions.get('rebalance_cache')
+        async with self.sessions() as session:
+            if cache is not None:
+                version = (await session.execute(
+                    select(Portfolio.version).where(Portfolio.id == portfolio_id, Portfolio.user_id == user_id)
+                )).scalar()
+                if version is None:
+                    return self._json({'error': 'Portfolio not found'}, 404)
+                cached = await self._offload(cache.get, portfolio_id, version)
+                if cached is not None:
+                    return self._json(cached, headers={'X-Cache': 'HIT'})
+            portfolio = await self._with_holdings(session, portfolio_id, user_id)
+
+        if portfolio is None:
+            return self._json({'error': 'Portfolio not found'}, 404)
+        result = await self._offload(rebalancing_result, portfolio)
+        if result is None:
+            return self._json({'error': 'No target allocations set'}, 400)
+        if cache is None:
+            return self._json(result)
+        await self._offload(cache.set, portfolio.id, portfolio.version, result)
+        return self._json(result, headers={'X-Cache': 'MISS'})
+
+    async def _owned_children(self, model, portfolio_id: int, user_id: int):
+        """(portfolio version, children) in one statement, or None if not the user's"""
+        async with self.sessions() as session:
+            rows = (await session.execute(
+                select(Portfolio.version, model)
+                .outerjoin(model, model.portfolio_id == Portfolio.id)
+                .where(Portfolio.id == portfolio_id, Portfolio.user_id == user_id)
+                .order_by(model.id)
+            )).all()
+        if not rows:
+            return None
+        return rows[0][0], [child for _, child in rows if child is not None]
+
+    async def _children(self, model, portfolio_id: int, user_id: int, serialize) -> Response:
+        owned = await self._owned_children(model, portfolio_id, user_id)
+        if owned is None:
+            return self._json({'error': 'Portfolio not found'}, 404)
+        version, children = owned
+        body = await self._offload(serialize, children)
+        return self._json(body, headers=self._etag_headers(model.__tablename__, portfolio_id, version))
+
+    async def get_assets(self, user_id: int, portfolio_id: int) -> Response:
+        return await self._children(Asset, portfolio_id, user_id, Asset.bulk_to_dict)
+
+    async def get_allocations(self, user_id: int, portfolio_id: int) -> Response:
+        return await self._children(
+            AssetAllocation, portfolio_id, user_id, lambda allocations: [a.to_dict() for a in allocations]
+        )
+
+def create_asgi_app(flask_app) -> AsyncReadApp:
+    """Wrap a Flask app from create_app() with the async read endpoints"""
+    return AsyncReadApp(flask_app)
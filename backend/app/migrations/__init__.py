@@ -0,0 +1,100 @@
+"""
+Versioned schema migrations
+
+Each module vNNNN_<name>.py in this package defines VERSION, DESCRIPTION and
+upgrade(connection). migrate() applies every version above the one recorded
+in the schema_version table, in order, each in its own transaction, and
+records it. Migrations inspect the schema before changing it, so databases
+created by an older setup_db.py (create_all plus ad-hoc ALTERs, without a
+schema_version table) are brought up to date the same way as new ones.
+
+Usage: python setup_db.py (from the backend folder)
+"""
+import importlib
+import pkgutil
+import re
+from datetime import datetime
+from typing import Callable, List, Optional
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+# Serializes concurrent runs on PostgreSQL (any constant shared by all deploys)
+ADVISORY_LOCK_ID = 4_221_007
+
+schema_version = Table(
+    'schema_version', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+def discover() -> List:
+    """Migration modules of this package, ordered by VERSION"""
+    modules = []
+    for info in pkgutil.iter_modules(__path__):
+        if re.match(r'v\d{4}_', info.name):
+            modules.append(importlib.import_module(f'{__name__}.{info.name}'))
+    modules.sort(key=lambda m: m.VERSION)
+    versions = [m.VERSION for m in modules]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions: {versions}")
+    return modules
+
+def current_version(connection) -> int:
+    """Highest applied version (0 for a database without schema_version)"""
+    if not inspect(connection).has_table('schema_version'):
+        return 0
+    return connection.execute(select(schema_version.c.version).order_by(schema_version.c.version.desc())
+                              .limit(1)).scalar() or 0
+
+def migrate(engine, target: Optional[int] = None, log: Callable = print) -> List[int]:
+    """
+    Apply pending migrations up to `target` (default: the latest)
+
+    Returns:
+        Versions applied by this run
+    """
+    applied = []
+    with engine.begin() as connection:
+        schema_version.create(connection, checkfirst=True)
+    for module in discover():
+        if target is not None and module.VERSION > target:
+            break
+        with engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': ADVISORY_LOCK_ID})
+            # Re-read under the lock: another process may have applied it meanwhile
+            if module.VERSION <= current_version(connection):
+                continue
+            module.upgrade(connection)
+            connection.execute(schema_version.insert().values(
+                version=module.VERSION, description=module.DESCRIPTION, applied_at=datetime.utcnow()
+            ))
+        log(f"Applied migration {module.VERSION:04d}: {module.DESCRIPTION}")
+        applied.append(module.VERSION)
+    return applied
+
+# Helpers for idempotent upgrade() functions
+
+def has_column(connection, table: str, column: str) -> bool:
+    return column in {c['name'] for c in inspect(connection).get_columns(table)}
+
+def has_index(connection, table: str, index: str) -> bool:
+    return index in {i['name'] for i in inspect(connection).get_indexes(table)}
+
+def add_column(connection, table, column: str) -> bool:
+    """Add a model column to an existing table if it's missing"""
+    if has_column(connection, table.name, column):
+        return False
+    col = table.c[column]
+    ddl = f'ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(dialect=connection.dialect)}'
+    if not col.nullable:
+        ddl += f' NOT NULL DEFAULT {col.server_default.arg}'
+    connection.execute(text(ddl))
+    return True
+
+def create_index(connection, index) -> bool:
+    """Create a model-declared index if it's missing"""
+    if has_index(connection, index.table.name, index.name):
+        return False
+    index.create(connection)
+    return True
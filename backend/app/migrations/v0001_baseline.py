@@ -0,0 +1,15 @@
+"""
+Tables as they were before versioned migrations
+"""
+VERSION = 1
+DESCRIPTION = 'Baseline tables'
+
+BASELINE_TABLES = (
+    'users', 'portfolios', 'assets', 'asset_allocations', 'portfolio_snapshots', 'portfolio_value_buckets',
+)
+
+def upgrade(connection):
+    from app import db
+    import app.models  # noqa: F401  (registers the tables)
+    # Existing tables are left alone; later migrations bring them up to date
+    db.metadata.create_all(connection, tables=[db.metadata.tables[name] for name in BASELINE_TABLES])
@@ -0,0 +1,11 @@
+"""
+Portfolio.version for ETags and version-keyed caches
+"""
+from app.migrations import add_column
+
+VERSION = 2
+DESCRIPTION = 'Add portfolios.version'
+
+def upgrade(connection):
+    from app.models import Portfolio
+    add_column(connection, Portfolio.__table__, 'version')
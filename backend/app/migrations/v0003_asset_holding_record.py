@@ -0,0 +1,11 @@
+"""
+Packed encrypted holding records (rows are converted by migrate_asset_records.py)
+"""
+from app.migrations import add_column
+
+VERSION = 3
+DESCRIPTION = 'Add assets.holding_encrypted'
+
+def upgrade(connection):
+    from app.models import Asset
+    add_column(connection, Asset.__table__, 'holding_encrypted')
@@ -0,0 +1,20 @@
+"""
+One allocation per (portfolio, symbol), the conflict target of bulk upserts
+"""
+from sqlalchemy import text
+from app.migrations import has_index
+
+VERSION = 4
+DESCRIPTION = 'Unique index on asset_allocations (portfolio_id, symbol)'
+
+def upgrade(connection):
+    from app.models import AssetAllocation
+    index = next(i for i in AssetAllocation.__table__.indexes if i.name == 'uq_asset_allocations_portfolio_symbol')
+    if has_index(connection, 'asset_allocations', index.name):
+        return
+    # Duplicates from before the index keep their newest row
+    connection.execute(text(
+        'DELETE FROM asset_allocations WHERE id NOT IN '
+        '(SELECT MAX(id) FROM asset_allocations GROUP BY portfolio_id, symbol)'
+    ))
+    index.create(connection)
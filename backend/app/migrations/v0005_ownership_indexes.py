@@ -0,0 +1,15 @@
+"""
+Indexes for the ownership and foreign-key lookups every route makes
+
+portfolios are filtered by user_id, assets by portfolio_id; allocation
+lookups by portfolio_id use the leading column of the unique index above.
+"""
+from app.migrations import create_index
+
+VERSION = 5
+DESCRIPTION = 'Index portfolios.user_id and assets.portfolio_id'
+
+def upgrade(connection):
+    from app.models import Asset, Portfolio
+    for table, name in ((Portfolio.__table__, 'ix_portfolios_user_id'), (Asset.__table__, 'ix_assets_portfolio_id')):
+        create_index(connection, next(i for i in table.indexes if i.name == name))
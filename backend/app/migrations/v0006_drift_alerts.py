@@ -0,0 +1,10 @@
+"""
+Alerts raised by the drift monitor
+"""
+VERSION = 6
+DESCRIPTION = 'Create drift_alerts'
+
+def upgrade(connection):
+    from app.models import DriftAlert
+    # Creates the table with its index; an existing table is left alone
+    DriftAlert.__table__.create(connection, checkfirst=True)
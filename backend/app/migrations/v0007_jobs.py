@@ -0,0 +1,10 @@
+"""
+Background job queue
+"""
+VERSION = 7
+DESCRIPTION = 'Create jobs'
+
+def upgrade(connection):
+    from app.models import Job
+    # Creates the table with its indexes (including the partial dedupe index)
+    Job.__table__.create(connection, checkfirst=True)
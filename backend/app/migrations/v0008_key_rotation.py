@@ -0,0 +1,9 @@
+"""
+Checkpoints of the online encryption key rotation (rotate_key.py)
+"""
+VERSION = 8
+DESCRIPTION = 'Create key_rotation_checkpoints'
+
+def upgrade(connection):
+    from app.models import KeyRotationCheckpoint
+    KeyRotationCheckpoint.__table__.create(connection, checkfirst=True)
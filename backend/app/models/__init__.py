@@ -3,5 +3,19 @@ Database models
 """
 from app.models.user import User
 from app.models.portfolio import Portfolio, Asset, AssetAllocation
+from app.models.snapshot import PortfolioSnapshot, PortfolioValueBucket
+from app.models.alert import DriftAlert
+from app.models.job import Job
+from app.models.rotation import KeyRotationCheckpoint
 
-__all__ = ['User', 'Portfolio', 'Asset', 'AssetAllocation']
+__all__ = [
+    'User',
+    'Portfolio',
+    'Asset',
+    'AssetAllocation',
+    'PortfolioSnapshot',
+    'PortfolioValueBucket',
+    'DriftAlert',
+    'Job',
+    'KeyRotationCheckpoint',
+]
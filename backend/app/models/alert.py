@@ -0,0 +1,52 @@
+"""
+Drift alert model
+"""
+from app import db
+from app.models.portfolio import Portfolio
+from datetime import datetime
+from sqlalchemy import delete, event
+
+class DriftAlert(db.Model):
+    """
+    A holding whose weight left its target band
+
+    Raised by the drift monitor when the weight first moves further than
+    `band` percentage points from the target, and resolved (resolved_at set)
+    when it comes back inside; a sustained breach is a single open alert.
+    """
+    __tablename__ = 'drift_alerts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id', ondelete='CASCADE'), nullable=False)
+    symbol = db.Column(db.String(20), nullable=False)
+    target_percentage = db.Column(db.Float, nullable=False)  # 0-100
+    actual_percentage = db.Column(db.Float, nullable=False)  # weight when the breach was detected
+    band = db.Column(db.Float, nullable=False)
+    triggered_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    resolved_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_drift_alerts_portfolio_symbol', 'portfolio_id', 'symbol'),
+    )
+
+    def to_dict(self):
+        """Convert alert to dictionary"""
+        return {
+            'id': self.id,
+            'portfolio_id': self.portfolio_id,
+            'symbol': self.symbol,
+            'target_percentage': self.target_percentage,
+            'actual_percentage': self.actual_percentage,
+            'drift': self.actual_percentage - self.target_percentage,
+            'band': self.band,
+            'triggered_at': self.triggered_at.isoformat() if self.triggered_at else None,
+            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None,
+        }
+
+    def __repr__(self):
+        return f'<DriftAlert {self.portfolio_id} {self.symbol}: {self.actual_percentage:.2f}%>'
+
+@event.listens_for(Portfolio, 'before_delete')
+def _delete_portfolio_alerts(mapper, connection, target):
+    """Remove a portfolio's alerts before the portfolio row"""
+    connection.execute(delete(DriftAlert.__table__).where(DriftAlert.__table__.c.portfolio_id == target.id))
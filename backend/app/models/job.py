@@ -0,0 +1,92 @@
+"""
+Background job model
+"""
+import json
+from app import db
+from app.models.user import User
+from app.utils.encryption import decrypt_data, encrypt_data
+from datetime import datetime
+from sqlalchemy import delete, event, text
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+class Job(db.Model):
+    """
+    A unit of background work, claimed and run by worker.py
+
+    Payloads and results can hold holdings or amounts, so both are stored
+    encrypted (JSON in the text format of Portfolio.total_value).
+    """
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))  # None for system jobs
+    kind = db.Column(db.String(50), nullable=False)
+    # Jobs with the same key aren't queued twice while one is queued or running
+    dedupe_key = db.Column(db.String(255))
+    status = db.Column(db.String(20), nullable=False, default='queued')
+
+    _payload_encrypted = db.Column(db.Text, name='payload_encrypted')
+    _result_encrypted = db.Column(db.Text, name='result_encrypted')
+    error = db.Column(db.Text)
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(255))
+    locked_at = db.Column(db.DateTime)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+        db.Index('ix_jobs_user_status', 'user_id', 'status'),
+        db.Index('uq_jobs_active_dedupe_key', 'dedupe_key', unique=True,
+                 postgresql_where=text("status IN ('queued', 'running')"),
+                 sqlite_where=text("status IN ('queued', 'running')")),
+    )
+
+    @property
+    def payload(self):
+        """Get decrypted payload"""
+        return json.loads(decrypt_data(self._payload_encrypted)) if self._payload_encrypted else {}
+
+    @payload.setter
+    def payload(self, value):
+        """Set encrypted payload"""
+        self._payload_encrypted = encrypt_data(json.dumps(value or {}))
+
+    @property
+    def result(self):
+        """Get decrypted result"""
+        return json.loads(decrypt_data(self._result_encrypted)) if self._result_encrypted else None
+
+    @result.setter
+    def result(self, value):
+        """Set encrypted result"""
+        self._result_encrypted = encrypt_data(json.dumps(value)) if value is not None else None
+
+    def to_dict(self):
+        """Convert job to dictionary (the result only once it succeeded)"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'dedupe_key': self.dedupe_key,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'result': self.result if self.status == 'succeeded' else None,
+            'error': self.error,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind}: {self.status}>'
+
+@event.listens_for(User, 'before_delete')
+def _delete_user_jobs(mapper, connection, target):
+    """Remove a user's jobs before the user row"""
+    connection.execute(delete(Job.__table__).where(Job.__table__.c.user_id == target.id))
@@ -2,58 +2,201 @@
 Portfolio and asset models
 """
 from app import db
-from app.utils.encryption import encrypt_data, decrypt_data
+from app.utils.encryption import encrypt_data, decrypt_data, decrypt_many, encrypt_record, decrypt_records
 from datetime import datetime
+import weakref
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session, selectinload
+
+# Decrypted values are memoized per instance, keyed by the ciphertext they came
+# from, so repeated property reads within a request decrypt once. The memo is
+# held outside the instance (never flushed, pickled or part of repr()), is
+# dropped whenever SQLAlchemy expires or refreshes the row, and is cleared for
+# everything in the session when the request ends.
+_plaintext = weakref.WeakKeyDictionary()
+
+def _memo_get(obj, source):
+    memo = _plaintext.get(obj)
+    if memo is not None and memo[0] == source:
+        return memo[1]
+    return None
+
+def _memo_set(obj, source, plaintext):
+    _plaintext[obj] = (source, plaintext)
+
+def clear_plaintext(obj, *args):
+    """Drop any memoized plaintext held for a model instance"""
+    # Expire events can fire for instances that were already garbage collected
+    if obj is not None:
+        _plaintext.pop(obj, None)
+
+def _decrypt_floats(values):
+    """
+    Batch-decrypt encrypted numeric columns to floats
+
+    Mirrors the single-value properties: missing or unreadable values become 0.0.
+    """
+    values = list(values)
+    try:
+        decrypted = decrypt_many(values)
+    except Exception:
+        # Fall back to per-value decryption so one bad row doesn't poison the batch
+        decrypted = []
+        for v in values:
+            try:
+                decrypted.append(decrypt_data(v))
+            except Exception:
+                decrypted.append(None)
+    floats = []
+    for d in decrypted:
+        try:
+            floats.append(float(d) if d else 0.0)
+        except ValueError:
+            floats.append(0.0)
+    return floats
+
+def _decrypt_records(blobs):
+    """Batch-decrypt packed records; unreadable records become None"""
+    blobs = list(blobs)
+    try:
+        return decrypt_records(blobs)
+    except Exception:
+        records = []
+        for b in blobs:
+            try:
+                records.append(decrypt_records([b])[0])
+            except Exception:
+                records.append(None)
+        return records
 
 class Portfolio(db.Model):
     """Portfolio model"""
     __tablename__ = 'portfolios'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     name = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
     
     # Encrypted total value
     _total_value_encrypted = db.Column(db.Text, name='total_value_encrypted')
     
+    # Bumped by every write to the portfolio, its assets or its allocations (see ETags)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    assets = db.relationship('Asset', backref='portfolio', lazy=True, cascade='all, delete-orphan')
-    allocations = db.relationship('AssetAllocation', backref='portfolio', lazy=True, cascade='all, delete-orphan')
+    # Ordered by id so holdings and targets keep insertion order whatever index the database reads them through
+    assets = db.relationship('Asset', backref='portfolio', lazy=True, cascade='all, delete-orphan',
+                             order_by='Asset.id')
+    allocations = db.relationship('AssetAllocation', backref='portfolio', lazy=True, cascade='all, delete-orphan',
+                                  order_by='AssetAllocation.id')
     
     @property
     def total_value(self):
         """Get decrypted total value"""
-        if self._total_value_encrypted:
-            try:
-                return float(decrypt_data(self._total_value_encrypted))
-            except:
-                return 0.0
-        return 0.0
+        if not self._total_value_encrypted:
+            return 0.0
+        cached = _memo_get(self, self._total_value_encrypted)
+        if cached is None:
+            cached = _decrypt_floats([self._total_value_encrypted])[0]
+            _memo_set(self, self._total_value_encrypted, cached)
+        return cached
     
     @total_value.setter
     def total_value(self, value):
         """Set encrypted total value"""
         if value is not None:
             self._total_value_encrypted = encrypt_data(str(value))
+            try:
+                _memo_set(self, self._total_value_encrypted, float(value))
+            except ValueError:
+                clear_plaintext(self)
         else:
             self._total_value_encrypted = None
+            clear_plaintext(self)
     
-    def to_dict(self):
+    def apply_value_delta(self, old_value, new_value):
+        """
+        Adjust the stored total for one holding changing from old_value to new_value
+        
+        Callers should hold the portfolio row lock (see locked_for_user) so
+        concurrent writes to the same portfolio apply their deltas in turn.
+        """
+        delta = (new_value or 0.0) - (old_value or 0.0)
+        if delta:
+            self.total_value = self.total_value + delta
+    
+    @classmethod
+    def version_for_user(cls, portfolio_id, user_id):
+        """
+        Get a user's portfolio version without loading or decrypting the row
+        
+        Returns None if the portfolio doesn't exist or belongs to another user.
+        """
+        return db.session.query(cls.version).filter_by(id=portfolio_id, user_id=user_id).scalar()
+    
+    @classmethod
+    def with_holdings_for_user(cls, portfolio_id, user_id):
+        """
+        Fetch a user's portfolio with assets and allocations eagerly loaded
+        
+        Always three statements (portfolio, assets, allocations) however many
+        holdings there are, instead of lazy loads on first attribute access.
+        """
+        return cls.query.options(
+            selectinload(cls.assets),
+            selectinload(cls.allocations)
+        ).filter_by(id=portfolio_id, user_id=user_id).first()
+    
+    @classmethod
+    def all_with_holdings_for_user(cls, user_id, portfolio_ids=None):
+        """Fetch all (or the given) portfolios of a user with holdings eagerly loaded"""
+        query = cls.query.options(
+            selectinload(cls.assets),
+            selectinload(cls.allocations)
+        ).filter_by(user_id=user_id)
+        if portfolio_ids is not None:
+            query = query.filter(cls.id.in_(portfolio_ids))
+        return query.order_by(cls.id).all()
+    
+    @classmethod
+    def locked_for_user(cls, portfolio_id, user_id):
+        """Fetch a user's portfolio with a row lock for the rest of the transaction"""
+        return cls.query.filter_by(id=portfolio_id, user_id=user_id).with_for_update().first()
+    
+    def to_dict(self, total_value=None):
         """Convert portfolio to dictionary"""
         return {
             'id': self.id,
             'user_id': self.user_id,
             'name': self.name,
             'description': self.description,
-            'total_value': self.total_value,
+            'total_value': self.total_value if total_value is None else total_value,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
     
+    @classmethod
+    def bulk_to_dict(cls, portfolios):
+        """Convert many portfolios to dictionaries with one batch decryption"""
+        portfolios = list(portfolios)
+        return [p.to_dict(total_value=t) for p, t in zip(portfolios, cls.bulk_total_values(portfolios))]
+    
+    @classmethod
+    def bulk_total_values(cls, portfolios):
+        """Decrypt total values for many portfolios in one batch"""
+        portfolios = list(portfolios)
+        missing = [
+            p for p in portfolios
+            if p._total_value_encrypted and _memo_get(p, p._total_value_encrypted) is None
+        ]
+        for p, total in zip(missing, _decrypt_floats(p._total_value_encrypted for p in missing)):
+            _memo_set(p, p._total_value_encrypted, total)
+        return [p.total_value for p in portfolios]
+    
     def __repr__(self):
         return f'<Portfolio {self.name}>'
 
@@ -63,12 +206,15 @@ class Asset(db.Model):
     __tablename__ = 'assets'
     
     id = db.Column(db.Integer, primary_key=True)
-    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False, index=True)
     symbol = db.Column(db.String(20), nullable=False)
     name = db.Column(db.String(255))
     asset_type = db.Column(db.String(50))  # e.g., 'stock', 'bond', 'crypto', 'etf'
     
-    # Encrypted values
+    # Encrypted values: (quantity, price, value) packed into one authenticated record
+    _holding_encrypted = db.Column(db.LargeBinary, name='holding_encrypted')
+    
+    # Legacy per-field ciphertexts, read until migrate_asset_records.py converts the row
     _quantity_encrypted = db.Column(db.Text, name='quantity_encrypted')
     _price_encrypted = db.Column(db.Text, name='price_encrypted')
     _value_encrypted = db.Column(db.Text, name='value_encrypted')
@@ -76,75 +222,113 @@ class Asset(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    def __init__(self, quantity=None, price=None, value=None, **kwargs):
+        super().__init__(**kwargs)
+        # Encrypt the three fields together instead of once per setter
+        if quantity is not None or price is not None or value is not None:
+            self.set_holding(quantity, price, value)
+    
+    @property
+    def holding(self):
+        """Get decrypted (quantity, price, value)"""
+        return Asset.bulk_decrypt([self])[0]
+    
+    def set_holding(self, quantity, price, value):
+        """Set (quantity, price, value) as one encrypted record"""
+        holding = tuple(float(v) if v is not None else 0.0 for v in (quantity, price, value))
+        self._holding_encrypted = encrypt_record(holding)
+        self._quantity_encrypted = None
+        self._price_encrypted = None
+        self._value_encrypted = None
+        _memo_set(self, self._holding_encrypted, holding)
+    
+    def _ciphertext(self):
+        """The stored ciphertext(s) the holding is decrypted from"""
+        if self._holding_encrypted:
+            return self._holding_encrypted
+        return (self._quantity_encrypted, self._price_encrypted, self._value_encrypted)
+    
     @property
     def quantity(self):
         """Get decrypted quantity"""
-        if self._quantity_encrypted:
-            try:
-                return float(decrypt_data(self._quantity_encrypted))
-            except:
-                return 0.0
-        return 0.0
+        return self.holding[0]
     
     @quantity.setter
     def quantity(self, value):
         """Set encrypted quantity"""
-        if value is not None:
-            self._quantity_encrypted = encrypt_data(str(value))
-        else:
-            self._quantity_encrypted = None
+        _, price, val = self.holding
+        self.set_holding(value, price, val)
     
     @property
     def price(self):
         """Get decrypted price"""
-        if self._price_encrypted:
-            try:
-                return float(decrypt_data(self._price_encrypted))
-            except:
-                return 0.0
-        return 0.0
+        return self.holding[1]
     
     @price.setter
     def price(self, value):
         """Set encrypted price"""
-        if value is not None:
-            self._price_encrypted = encrypt_data(str(value))
-        else:
-            self._price_encrypted = None
+        quantity, _, val = self.holding
+        self.set_holding(quantity, value, val)
     
     @property
     def value(self):
         """Get decrypted value"""
-        if self._value_encrypted:
-            try:
-                return float(decrypt_data(self._value_encrypted))
-            except:
-                return 0.0
-        return 0.0
+        return self.holding[2]
     
     @value.setter
     def value(self, val):
         """Set encrypted value"""
-        if val is not None:
-            self._value_encrypted = encrypt_data(str(val))
-        else:
-            self._value_encrypted = None
+        quantity, price, _ = self.holding
+        self.set_holding(quantity, price, val)
     
-    def to_dict(self):
+    def to_dict(self, decrypted=None):
         """Convert asset to dictionary"""
+        quantity, price, value = decrypted if decrypted is not None else self.holding
         return {
             'id': self.id,
             'portfolio_id': self.portfolio_id,
             'symbol': self.symbol,
             'name': self.name,
             'asset_type': self.asset_type,
-            'quantity': self.quantity,
-            'price': self.price,
-            'value': self.value,
+            'quantity': quantity,
+            'price': price,
+            'value': value,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
     
+    @classmethod
+    def bulk_decrypt(cls, assets):
+        """
+        Decrypt (quantity, price, value) for many assets in one batch
+        
+        Packed rows cost one record decryption each; rows not yet migrated fall
+        back to their three legacy columns. Unreadable values become 0.0.
+        Results are memoized, so assets already read in this session are free.
+        """
+        assets = list(assets)
+        sources = [a._ciphertext() for a in assets]
+        results = [_memo_get(a, source) for a, source in zip(assets, sources)]
+        
+        packed = [i for i, r in enumerate(results) if r is None and assets[i]._holding_encrypted]
+        for i, record in zip(packed, _decrypt_records([sources[i] for i in packed])):
+            results[i] = record if record is not None else (0.0, 0.0, 0.0)
+        
+        legacy = [i for i, r in enumerate(results) if r is None]
+        floats = _decrypt_floats(f for i in legacy for f in sources[i])
+        for n, i in enumerate(legacy):
+            results[i] = tuple(floats[3 * n:3 * n + 3])
+        
+        for i in packed + legacy:
+            _memo_set(assets[i], sources[i], results[i])
+        return results
+    
+    @classmethod
+    def bulk_to_dict(cls, assets):
+        """Convert many assets to dictionaries with one batch decryption"""
+        assets = list(assets)
+        return [a.to_dict(decrypted=d) for a, d in zip(assets, cls.bulk_decrypt(assets))]
+    
     def __repr__(self):
         return f'<Asset {self.symbol}>'
 
@@ -162,6 +346,11 @@ class AssetAllocation(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # One target per symbol; also the conflict target of bulk upserts
+    __table_args__ = (
+        db.Index('uq_asset_allocations_portfolio_symbol', 'portfolio_id', 'symbol', unique=True),
+    )
+    
     def to_dict(self):
         """Convert allocation to dictionary"""
         return {
@@ -176,3 +365,41 @@ class AssetAllocation(db.Model):
     
     def __repr__(self):
         return f'<AssetAllocation {self.symbol}: {self.target_percentage}%>'
+
+
+# Memoized plaintext must never outlive the row state it was decrypted from
+for _model in (Portfolio, Asset):
+    event.listen(_model, 'expire', clear_plaintext)
+    event.listen(_model, 'refresh', clear_plaintext)
+
+@event.listens_for(Session, 'after_flush')
+def _bump_portfolio_versions(session, flush_context):
+    """Increment the version of every portfolio this flush wrote to"""
+    touched = set()
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, (Asset, AssetAllocation)):
+            if obj in session.new or obj in session.deleted or session.is_modified(obj, include_collections=False):
+                touched.add(obj.portfolio_id)
+        elif isinstance(obj, Portfolio) and obj in session.dirty and obj not in session.deleted:
+            if session.is_modified(obj, include_collections=False):
+                touched.add(obj.id)
+    touched.discard(None)
+    if touched:
+        bump_versions(session, touched)
+
+def bump_versions(session, portfolio_ids):
+    """
+    Increment portfolio versions in the session's transaction
+    
+    Flushes bump versions automatically; call this after writing children
+    with Core statements (e.g. bulk upserts), which bypass the flush.
+    """
+    session.connection().execute(
+        update(Portfolio.__table__)
+        .where(Portfolio.__table__.c.id.in_(portfolio_ids))
+        .values(version=Portfolio.__table__.c.version + 1)
+    )
+    # Loaded portfolios re-read their version on next access
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Portfolio) and obj.id in portfolio_ids:
+            session.expire(obj, ['version'])
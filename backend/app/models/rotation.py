@@ -0,0 +1,32 @@
+"""
+Key rotation checkpoint model
+"""
+from app import db
+from datetime import datetime
+
+class KeyRotationCheckpoint(db.Model):
+    """
+    Progress of re-encrypting one table under one key
+
+    last_id is the highest primary key already walked, so an interrupted
+    rotation resumes after it; finished_at is set once the whole table is done.
+    """
+    __tablename__ = 'key_rotation_checkpoints'
+
+    key_id = db.Column(db.Integer, primary_key=True)  # key the table is being rotated to
+    table_name = db.Column(db.String(64), primary_key=True)
+    last_id = db.Column(db.Integer, default=0, nullable=False)
+    rows_rotated = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """Convert checkpoint to dictionary"""
+        return {
+            'key_id': self.key_id,
+            'table': self.table_name,
+            'last_id': self.last_id,
+            'rows_rotated': self.rows_rotated,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
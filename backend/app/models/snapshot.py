@@ -0,0 +1,49 @@
+"""
+Portfolio value history models
+"""
+from app import db
+from datetime import datetime
+
+class PortfolioSnapshot(db.Model):
+    """A portfolio's total value at the moment it changed"""
+    __tablename__ = 'portfolio_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id', ondelete='CASCADE'), nullable=False)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Encrypted value (same text format as Portfolio.total_value)
+    _value_encrypted = db.Column(db.Text, name='value_encrypted', nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_portfolio_snapshots_portfolio_recorded', 'portfolio_id', 'recorded_at'),
+    )
+
+    def __repr__(self):
+        return f'<PortfolioSnapshot {self.portfolio_id} @ {self.recorded_at}>'
+
+class PortfolioValueBucket(db.Model):
+    """
+    Open/high/low/close of a portfolio's value over one day, week or month
+
+    Maintained incrementally as snapshots are recorded, so history queries
+    read one row per bucket instead of every snapshot.
+    """
+    __tablename__ = 'portfolio_value_buckets'
+
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id', ondelete='CASCADE'), nullable=False)
+    period = db.Column(db.String(10), nullable=False)  # 'day', 'week' or 'month'
+    bucket_start = db.Column(db.Date, nullable=False)
+
+    # Encrypted (open, high, low, close) packed record
+    _ohlc_encrypted = db.Column(db.LargeBinary, name='ohlc_encrypted', nullable=False)
+    snapshot_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('portfolio_id', 'period', 'bucket_start', name='uq_portfolio_value_bucket'),
+    )
+
+    def __repr__(self):
+        return f'<PortfolioValueBucket {self.portfolio_id} {self.period} {self.bucket_start}>'
@@ -3,37 +3,95 @@ Asset management routes
 """
 from flask import Blueprint, request, jsonify
 from app import db
-from app.models.portfolio import Portfolio, Asset, AssetAllocation
+from app.models.portfolio import Portfolio, Asset, AssetAllocation, bump_versions
+from app.utils.importer import iter_rows, import_holdings, normalize_symbol
+from app.utils.pagination import page_args, stream_format, keyset_page, page_response, stream_response
+from app.utils.etags import not_modified, portfolio_etag, with_etag
+from app.services.rebalance_cache import invalidate_rebalancing
+from app.utils.upsert import upsert
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import delete, select
+from datetime import datetime
+import csv
 
 assets_bp = Blueprint('assets', __name__)
 
+def _owned_children(model, portfolio_id, user_id):
+    """
+    Fetch a portfolio's assets/allocations and check ownership in one statement
+    
+    Returns:
+        (portfolio version, children), or None if the portfolio doesn't exist
+        or belongs to another user
+    """
+    rows = db.session.query(Portfolio.version, model).outerjoin(
+        model, model.portfolio_id == Portfolio.id
+    ).filter(
+        Portfolio.id == portfolio_id,
+        Portfolio.user_id == user_id
+    ).order_by(model.id).all()
+    
+    if not rows:
+        return None
+    return rows[0][0], [child for _, child in rows if child is not None]
+
+def _list_children(model, portfolio_id, user_id, serialize):
+    """
+    Respond with a portfolio's assets/allocations, whole, paged or streamed
+    
+    ?limit/?after return one keyset page, ?stream=json|ndjson streams every
+    row in chunks, and neither returns the full list as before.
+    """
+    try:
+        fmt = stream_format(request.args)
+        page = page_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    kind = model.__tablename__
+    unchanged = not_modified(kind, portfolio_id, user_id)
+    if unchanged is not None:
+        return unchanged
+    
+    if fmt is None and page is None:
+        owned = _owned_children(model, portfolio_id, user_id)
+        if owned is None:
+            return jsonify({'error': 'Portfolio not found'}), 404
+        version, children = owned
+        return with_etag(jsonify(serialize(children)), portfolio_etag(kind, portfolio_id, version)), 200
+    
+    version = Portfolio.version_for_user(portfolio_id, user_id)
+    if version is None:
+        return jsonify({'error': 'Portfolio not found'}), 404
+    etag = portfolio_etag(kind, portfolio_id, version)
+    
+    statement = select(model).where(model.portfolio_id == portfolio_id)
+    if fmt is not None:
+        return with_etag(stream_response(statement, model.id, serialize, fmt), etag)
+    children, next_cursor = keyset_page(statement, model.id, *page)
+    return with_etag(page_response(serialize(children), next_cursor), etag), 200
+
 @assets_bp.route('/portfolio/<int:portfolio_id>/assets', methods=['GET'])
 @jwt_required()
 def get_assets(portfolio_id):
-    """Get all assets for a portfolio"""
+    """Get all assets for a portfolio (optionally paged or streamed)"""
     user_id = int(get_jwt_identity())
-    portfolio = Portfolio.query.filter_by(id=portfolio_id, user_id=user_id).first()
-    
-    if not portfolio:
-        return jsonify({'error': 'Portfolio not found'}), 404
-    
-    assets = Asset.query.filter_by(portfolio_id=portfolio_id).all()
-    return jsonify([a.to_dict() for a in assets]), 200
+    return _list_children(Asset, portfolio_id, user_id, Asset.bulk_to_dict)
 
 @assets_bp.route('/portfolio/<int:portfolio_id>/assets', methods=['POST'])
 @jwt_required()
 def create_asset(portfolio_id):
     """Add an asset to a portfolio"""
     user_id = int(get_jwt_identity())
-    portfolio = Portfolio.query.filter_by(id=portfolio_id, user_id=user_id).first()
+    portfolio = Portfolio.locked_for_user(portfolio_id, user_id)
     
     if not portfolio:
         return jsonify({'error': 'Portfolio not found'}), 404
     
     data = request.get_json()
     
-    if not data or not data.get('symbol'):
+    symbol = normalize_symbol(data['symbol']) if data and data.get('symbol') else ''
+    if not symbol:
         return jsonify({'error': 'Symbol is required'}), 400
     
     # Calculate value if quantity and price provided
@@ -45,8 +103,8 @@ def create_asset(portfolio_id):
     
     asset = Asset(
         portfolio_id=portfolio_id,
-        symbol=data['symbol'],
-        name=data.get('name', data['symbol']),
+        symbol=symbol,
+        name=data.get('name', symbol),
         asset_type=data.get('asset_type', 'stock'),
         quantity=data.get('quantity', 0),
         price=data.get('price', 0),
@@ -56,12 +114,55 @@ def create_asset(portfolio_id):
     db.session.add(asset)
     
     # Update portfolio total value
-    portfolio.total_value = sum(a.value for a in portfolio.assets) + value
+    portfolio.apply_value_delta(0.0, asset.value)
     
     db.session.commit()
+    invalidate_rebalancing(portfolio_id)
     
     return jsonify(asset.to_dict()), 201
 
+@assets_bp.route('/portfolio/<int:portfolio_id>/assets/import', methods=['POST'])
+@jwt_required()
+def import_assets(portfolio_id):
+    """
+    Bulk import holdings from a CSV or NDJSON request body
+    
+    The body is streamed row by row; valid rows are inserted in one
+    transaction and invalid rows are reported back by row number.
+    Pass ?strict=true to import nothing if any row is invalid.
+    """
+    user_id = int(get_jwt_identity())
+    portfolio = Portfolio.locked_for_user(portfolio_id, user_id)
+    
+    if not portfolio:
+        return jsonify({'error': 'Portfolio not found'}), 404
+    
+    content_type = request.mimetype
+    if content_type in ('text/csv', 'application/csv'):
+        fmt = 'csv'
+    elif content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        fmt = 'ndjson'
+    else:
+        return jsonify({'error': 'Content-Type must be text/csv or application/x-ndjson'}), 415
+    
+    try:
+        report = import_holdings(portfolio, iter_rows(request.stream, fmt))
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({'error': f'Could not parse upload: {e}'}), 400
+    
+    if report['failed'] and request.args.get('strict', '').lower() in ('1', 'true'):
+        db.session.rollback()
+        report['imported'] = 0
+        report['imported_value'] = 0.0
+        return jsonify(report), 422
+    
+    db.session.commit()
+    invalidate_rebalancing(portfolio_id)
+    
+    report['total_value'] = portfolio.total_value
+    return jsonify(report), 200
+
 @assets_bp.route('/assets/<int:asset_id>', methods=['PUT'])
 @jwt_required()
 def update_asset(asset_id):
@@ -72,32 +173,40 @@ def update_asset(asset_id):
     if not asset:
         return jsonify({'error': 'Asset not found'}), 404
     
-    portfolio = Portfolio.query.filter_by(id=asset.portfolio_id, user_id=user_id).first()
+    portfolio = Portfolio.locked_for_user(asset.portfolio_id, user_id)
     if not portfolio:
         return jsonify({'error': 'Unauthorized'}), 403
+    # Re-read the holding under the lock so the delta uses the committed value
+    db.session.refresh(asset)
     
     data = request.get_json()
     
-    if data.get('symbol'):
-        asset.symbol = data['symbol']
+    if data.get('symbol') and normalize_symbol(data['symbol']):
+        asset.symbol = normalize_symbol(data['symbol'])
     if data.get('name'):
         asset.name = data['name']
     if data.get('asset_type'):
         asset.asset_type = data['asset_type']
+    
+    quantity, price, old_value = asset.holding
+    value = old_value
     if data.get('quantity') is not None:
-        asset.quantity = data['quantity']
+        quantity = float(data['quantity'])
     if data.get('price') is not None:
-        asset.price = data['price']
+        price = float(data['price'])
     if data.get('value') is not None:
-        asset.value = data['value']
+        value = float(data['value'])
     elif data.get('quantity') is not None or data.get('price') is not None:
         # Recalculate value
-        asset.value = asset.quantity * asset.price
+        value = quantity * price
+    asset.set_holding(quantity, price, value)
     
     # Update portfolio total value
-    portfolio.total_value = sum(a.value for a in portfolio.assets)
+    portfolio.apply_value_delta(old_value, value)
+    portfolio_id = portfolio.id
     
     db.session.commit()
+    invalidate_rebalancing(portfolio_id)
     
     return jsonify(asset.to_dict()), 200
 
@@ -111,31 +220,32 @@ def delete_asset(asset_id):
     if not asset:
         return jsonify({'error': 'Asset not found'}), 404
     
-    portfolio = Portfolio.query.filter_by(id=asset.portfolio_id, user_id=user_id).first()
+    portfolio = Portfolio.locked_for_user(asset.portfolio_id, user_id)
     if not portfolio:
         return jsonify({'error': 'Unauthorized'}), 403
+    # Re-read the holding under the lock so the delta uses the committed value
+    db.session.refresh(asset)
     
+    old_value = asset.value
     db.session.delete(asset)
     
     # Update portfolio total value
-    portfolio.total_value = sum(a.value for a in portfolio.assets)
+    portfolio.apply_value_delta(old_value, 0.0)
+    portfolio_id = portfolio.id
     
     db.session.commit()
+    invalidate_rebalancing(portfolio_id)
     
     return jsonify({'message': 'Asset deleted'}), 200
 
 @assets_bp.route('/portfolio/<int:portfolio_id>/allocations', methods=['GET'])
 @jwt_required()
 def get_allocations(portfolio_id):
-    """Get target allocations for a portfolio"""
+    """Get target allocations for a portfolio (optionally paged or streamed)"""
     user_id = int(get_jwt_identity())
-    portfolio = Portfolio.query.filter_by(id=portfolio_id, user_id=user_id).first()
-    
-    if not portfolio:
-        return jsonify({'error': 'Portfolio not found'}), 404
-    
-    allocations = AssetAllocation.query.filter_by(portfolio_id=portfolio_id).all()
-    return jsonify([a.to_dict() for a in allocations]), 200
+    return _list_children(
+        AssetAllocation, portfolio_id, user_id, lambda allocations: [a.to_dict() for a in allocations]
+    )
 
 @assets_bp.route('/portfolio/<int:portfolio_id>/allocations', methods=['POST'])
 @jwt_required()
@@ -149,32 +259,125 @@ def create_allocation(portfolio_id):
     
     data = request.get_json()
     
-    if not data or not data.get('symbol') or data.get('target_percentage') is None:
+    symbol = normalize_symbol(data['symbol']) if data and data.get('symbol') else ''
+    if not symbol or data.get('target_percentage') is None:
         return jsonify({'error': 'Symbol and target_percentage are required'}), 400
     
-    # Check if allocation already exists
-    existing = AssetAllocation.query.filter_by(
-        portfolio_id=portfolio_id,
-        symbol=data['symbol']
-    ).first()
+    # A concurrent POST for the same symbol updates the row instead of failing on the unique index
+    existed = db.session.execute(
+        select(AssetAllocation.id).where(AssetAllocation.portfolio_id == portfolio_id,
+                                         AssetAllocation.symbol == symbol)
+    ).first() is not None
+    _upsert_allocations(portfolio_id, [{
+        'symbol': symbol,
+        'target_percentage': data['target_percentage'],
+        'asset_type': data.get('asset_type'),
+    }])
+    bump_versions(db.session, {portfolio_id})
+    db.session.commit()
+    invalidate_rebalancing(portfolio_id)
     
-    if existing:
-        existing.target_percentage = data['target_percentage']
-        existing.asset_type = data.get('asset_type', existing.asset_type)
-        db.session.commit()
-        return jsonify(existing.to_dict()), 200
+    allocation = AssetAllocation.query.filter_by(portfolio_id=portfolio_id, symbol=symbol).first()
+    return jsonify(allocation.to_dict()), 200 if existed else 201
+
+# Targets may be off by rounding in the client (e.g. three lines of 33.33%)
+ALLOCATION_SUM_TOLERANCE = 0.01
+
+def _parse_allocations(items):
+    """
+    Validate a list of allocation targets in one pass
+    
+    Returns:
+        (rows keyed by symbol, sum of target percentages, error message or None)
+    """
+    if not isinstance(items, list):
+        return None, 0.0, 'allocations must be a list'
+    rows = {}
+    total = 0.0
+    for index, item in enumerate(items):
+        symbol = normalize_symbol(item['symbol']) if isinstance(item, dict) and item.get('symbol') else ''
+        if not symbol:
+            return None, 0.0, f'allocations[{index}]: symbol is required'
+        try:
+            target = float(item['target_percentage'])
+        except (KeyError, TypeError, ValueError):
+            return None, 0.0, f'allocations[{index}]: target_percentage must be a number'
+        if not 0 <= target <= 100:
+            return None, 0.0, f'allocations[{index}]: target_percentage must be between 0 and 100'
+        if symbol in rows:
+            return None, 0.0, f'allocations[{index}]: duplicate symbol {symbol}'
+        rows[symbol] = {'symbol': symbol, 'target_percentage': target, 'asset_type': item.get('asset_type')}
+        total += target
+    return rows, total, None
+
+def _upsert_allocations(portfolio_id, rows):
+    """
+    Insert or update allocation targets with native upserts
+    
+    A row without asset_type is inserted as 'stock' but keeps the type of an
+    existing target for the same symbol.
+    """
+    now = datetime.utcnow()
+    typed, untyped = [], []
+    for row in rows:
+        values = {**row, 'portfolio_id': portfolio_id, 'created_at': now, 'updated_at': now}
+        if row.get('asset_type') is None:
+            untyped.append({**values, 'asset_type': 'stock'})
+        else:
+            typed.append(values)
+    for batch, columns in ((typed, ('target_percentage', 'asset_type', 'updated_at')),
+                           (untyped, ('target_percentage', 'updated_at'))):
+        upsert(db.session, AssetAllocation.__table__, batch,
+               index_elements=('portfolio_id', 'symbol'), update_columns=columns)
+
+@assets_bp.route('/portfolio/<int:portfolio_id>/allocations', methods=['PUT'])
+@jwt_required()
+def replace_allocations(portfolio_id):
+    """
+    Replace or merge a portfolio's whole set of target allocations
+    
+    Body: {"allocations": [{"symbol", "target_percentage", "asset_type"?}, ...],
+    "mode": "replace" (default; symbols not listed are removed) or "merge"
+    (listed symbols are added or updated, others kept)}. The resulting set
+    must sum to 100%. An omitted asset_type keeps an existing target's type
+    ('stock' for new symbols). Written in one transaction with native upserts.
+    """
+    user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+    mode = data.get('mode', 'replace')
+    if mode not in ('replace', 'merge'):
+        return jsonify({'error': "mode must be 'replace' or 'merge'"}), 400
     
-    allocation = AssetAllocation(
-        portfolio_id=portfolio_id,
-        symbol=data['symbol'],
-        target_percentage=data['target_percentage'],
-        asset_type=data.get('asset_type', 'stock')
-    )
+    rows, total, error = _parse_allocations(data.get('allocations'))
+    if error:
+        return jsonify({'error': error}), 400
     
-    db.session.add(allocation)
+    portfolio = Portfolio.locked_for_user(portfolio_id, user_id)
+    if not portfolio:
+        return jsonify({'error': 'Portfolio not found'}), 404
+    
+    table = AssetAllocation.__table__
+    if mode == 'merge':
+        # Targets kept from the current set count toward the total too
+        kept = db.session.execute(
+            select(table.c.symbol, table.c.target_percentage).where(table.c.portfolio_id == portfolio_id)
+        ).all()
+        total += sum(target for symbol, target in kept if symbol not in rows)
+    if abs(total - 100) > ALLOCATION_SUM_TOLERANCE:
+        db.session.rollback()
+        return jsonify({'error': f'Target allocations must sum to 100 (got {round(total, 4)})'}), 400
+    
+    _upsert_allocations(portfolio_id, rows.values())
+    if mode == 'replace':
+        db.session.execute(
+            delete(table).where(table.c.portfolio_id == portfolio_id, table.c.symbol.not_in(list(rows)))
+        )
+    bump_versions(db.session, {portfolio_id})
     db.session.commit()
+    invalidate_rebalancing(portfolio_id)
     
-    return jsonify(allocation.to_dict()), 201
+    allocations = AssetAllocation.query.filter_by(portfolio_id=portfolio_id).order_by(AssetAllocation.id).all()
+    return jsonify([a.to_dict() for a in allocations]), 200
 
 @assets_bp.route('/allocations/<int:allocation_id>', methods=['DELETE'])
 @jwt_required()
@@ -190,7 +393,9 @@ def delete_allocation(allocation_id):
     if not portfolio:
         return jsonify({'error': 'Unauthorized'}), 403
     
+    portfolio_id = portfolio.id
     db.session.delete(allocation)
     db.session.commit()
+    invalidate_rebalancing(portfolio_id)
     
     return jsonify({'message': 'Allocation deleted'}), 200
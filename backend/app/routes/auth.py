@@ -45,7 +45,7 @@ def verify_firebase_token():
     access_token = create_access_token(identity=str(user.id))
     
     import logging
-    logging.info(f"Created JWT token for user_id: {user.id}, token length: {len(access_token)}")
+    logging.info("Created JWT token for user_id: %s", user.id)
     
     return jsonify({
         'access_token': access_token,
@@ -0,0 +1,68 @@
+"""
+Data export and restore routes
+"""
+import logging
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app import db
+from app.services.export import export_frames, restore_user
+
+logger = logging.getLogger(__name__)
+
+export_bp = Blueprint('export', __name__)
+
+MIN_PASSPHRASE_LENGTH = 8
+
+def _passphrase(value):
+    if not isinstance(value, str) or len(value) < MIN_PASSPHRASE_LENGTH:
+        return None
+    return value
+
+@export_bp.route('', methods=['POST'])
+@jwt_required()
+def export_data():
+    """
+    Download the current user's portfolios, assets and allocations as an encrypted archive
+    
+    Expects: { "passphrase": "..." } (at least 8 characters), needed again to restore.
+    The archive is streamed chunk by chunk as it is read and encrypted.
+    """
+    user_id = int(get_jwt_identity())
+    passphrase = _passphrase((request.get_json(silent=True) or {}).get('passphrase'))
+    
+    if passphrase is None:
+        return jsonify({'error': f'passphrase of at least {MIN_PASSPHRASE_LENGTH} characters is required'}), 400
+    
+    def generate():
+        report = {}
+        yield from export_frames(user_id, passphrase, report=report)
+        logger.info("Exported %d rows for user %d at %d rows/s", report['rows'], user_id, report['rows_per_second'])
+    
+    return Response(stream_with_context(generate()), mimetype='application/octet-stream', headers={
+        'Content-Disposition': 'attachment; filename="moneylab-export.mlarch"',
+    })
+
+@export_bp.route('/restore', methods=['POST'])
+@jwt_required()
+def restore_data():
+    """
+    Restore an archive's portfolios into the current user's account
+    
+    The archive is the request body and the passphrase is sent in the
+    X-Archive-Passphrase header. Portfolios are added alongside existing
+    ones; nothing is written unless the whole archive is valid.
+    """
+    user_id = int(get_jwt_identity())
+    passphrase = _passphrase(request.headers.get('X-Archive-Passphrase'))
+    
+    if passphrase is None:
+        return jsonify({'error': 'X-Archive-Passphrase header is required'}), 400
+    
+    try:
+        report = restore_user(request.stream, passphrase, user_id)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    db.session.commit()
+    return jsonify(report), 201
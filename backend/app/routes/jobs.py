@@ -0,0 +1,85 @@
+"""
+Background job routes
+"""
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import select
+from app import db
+from app.models import Job, Portfolio
+from app.services.jobs import USER_KINDS, enqueue
+from app.utils.pagination import page_args, keyset_page, page_response
+
+jobs_bp = Blueprint('jobs', __name__)
+
+MAX_DEDUPE_KEY_LENGTH = 200
+
+@jobs_bp.route('', methods=['POST'])
+@jwt_required()
+def create_job():
+    """
+    Queue a background job
+    
+    Expects: { "kind": "rebalance" | "repair_totals" | "import", "payload": {...},
+    "dedupe_key": optional }. Returns 202 with the new job, or 200 with the
+    queued or running job that already has the dedupe key.
+    """
+    user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+    
+    kind = data.get('kind')
+    payload = data.get('payload') or {}
+    dedupe_key = data.get('dedupe_key')
+    if kind not in USER_KINDS:
+        return jsonify({'error': f"kind must be one of {', '.join(sorted(USER_KINDS))}"}), 400
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'payload must be an object'}), 400
+    if dedupe_key is not None and (not isinstance(dedupe_key, str) or len(dedupe_key) > MAX_DEDUPE_KEY_LENGTH):
+        return jsonify({'error': f'dedupe_key must be a string of at most {MAX_DEDUPE_KEY_LENGTH} characters'}), 400
+    
+    if 'portfolio_id' in payload:
+        if not isinstance(payload['portfolio_id'], int):
+            return jsonify({'error': 'portfolio_id must be an integer'}), 400
+        if Portfolio.version_for_user(payload['portfolio_id'], user_id) is None:
+            return jsonify({'error': 'Portfolio not found'}), 404
+    
+    # Keys are per user, so one user's jobs never dedupe against another's
+    job, created = enqueue(kind, payload, user_id, f'user:{user_id}:{dedupe_key}' if dedupe_key else None)
+    return jsonify(job.to_dict()), 202 if created else 200
+
+@jobs_bp.route('/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """Get a job's status, and its result once it succeeded"""
+    user_id = int(get_jwt_identity())
+    job = Job.query.filter_by(id=job_id, user_id=user_id).first()
+    
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job.to_dict()), 200
+
+@jobs_bp.route('', methods=['GET'])
+@jwt_required()
+def get_jobs():
+    """
+    Get the current user's jobs, oldest first
+    
+    Optional query: status, and limit / after (keyset page on id; the next
+    cursor is returned in X-Next-Cursor)
+    """
+    user_id = int(get_jwt_identity())
+    
+    try:
+        page = page_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    statement = select(Job).where(Job.user_id == user_id)
+    if request.args.get('status'):
+        statement = statement.where(Job.status == request.args['status'])
+    
+    if page is not None:
+        jobs, next_cursor = keyset_page(statement, Job.id, *page)
+        return page_response([j.to_dict() for j in jobs], next_cursor), 200
+    jobs = db.session.execute(statement.order_by(Job.id)).scalars().all()
+    return jsonify([j.to_dict() for j in jobs]), 200
@@ -1,39 +1,172 @@
 """
 Portfolio management routes
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app import db
-from app.models.portfolio import Portfolio, Asset, AssetAllocation
-from app.models.user import User
+from app.models.portfolio import Portfolio, Asset
+from app.models.alert import DriftAlert
 from app.utils.rebalancing import calculate_rebalancing, calculate_portfolio_metrics
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from app.utils.rebalancing_engine import rebalance_many
+from app.utils.trade_solver import build_orders
+from app.utils.consolidation import consolidate
+from app.utils.price_history import to_day, from_days
+from app.utils.snapshots import value_history
+from app.utils.pagination import page_args, stream_format, keyset_page, page_response, stream_response
+from app.utils.etags import not_modified, portfolio_etag, with_etag
+from app.services.rebalance_cache import invalidate_rebalancing
+from sqlalchemy import select
+from datetime import date
+from flask_jwt_extended import jwt_required, get_jwt_identity
 import logging
 
 logger = logging.getLogger(__name__)
 
 portfolio_bp = Blueprint('portfolio', __name__)
 
+def portfolio_detail(portfolio):
+    """Serialize a portfolio with its (eagerly loaded) assets and allocations"""
+    portfolio_dict = portfolio.to_dict()
+    portfolio_dict['assets'] = Asset.bulk_to_dict(portfolio.assets)
+    portfolio_dict['allocations'] = [a.to_dict() for a in portfolio.allocations]
+    return portfolio_dict
+
+def rebalancing_result(portfolio):
+    """
+    Rebalancing recommendations and metrics for a portfolio with loaded holdings
+    
+    Returns:
+        {'recommendations', 'metrics'}, or None if no target allocations are set
+    """
+    # Get current holdings
+    assets = portfolio.assets
+    current_holdings = [
+        {'symbol': asset.symbol, 'value': value}
+        for asset, (_, _, value) in zip(assets, Asset.bulk_decrypt(assets))
+    ]
+    
+    # Get target allocations
+    target_allocations = [
+        {'symbol': alloc.symbol, 'target_percentage': alloc.target_percentage}
+        for alloc in portfolio.allocations
+    ]
+    
+    if not target_allocations:
+        return None
+    
+    # Calculate rebalancing
+    recommendations = calculate_rebalancing(
+        current_holdings,
+        target_allocations,
+        portfolio.total_value
+    )
+    
+    # Calculate metrics
+    metrics = calculate_portfolio_metrics(current_holdings, portfolio.total_value)
+    
+    return {
+        'recommendations': recommendations,
+        'metrics': metrics
+    }
+
 @portfolio_bp.route('', methods=['GET'])
 @jwt_required()
 def get_portfolios():
-    """Get all portfolios for current user"""
+    """
+    Get all portfolios for current user
+    
+    Optional query: limit and after (keyset page on id; the next cursor is
+    returned in X-Next-Cursor) or stream=json|ndjson
+    """
     try:
-        # Debug: Log token info
-        token_data = get_jwt()
         user_id = int(get_jwt_identity())
         
-        logger.info(f"Token data: {token_data}")
-        logger.info(f"User ID from token: {user_id}")
-        
         if not user_id:
             return jsonify({'error': 'Invalid user ID in token'}), 401
         
+        try:
+            fmt = stream_format(request.args)
+            page = page_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        statement = select(Portfolio).where(Portfolio.user_id == user_id)
+        if fmt is not None:
+            return stream_response(statement, Portfolio.id, Portfolio.bulk_to_dict, fmt)
+        if page is not None:
+            portfolios, next_cursor = keyset_page(statement, Portfolio.id, *page)
+            return page_response(Portfolio.bulk_to_dict(portfolios), next_cursor), 200
+        
         portfolios = Portfolio.query.filter_by(user_id=user_id).all()
-        return jsonify([p.to_dict() for p in portfolios]), 200
+        return jsonify(Portfolio.bulk_to_dict(portfolios)), 200
     except Exception as e:
-        logger.error(f"Error in get_portfolios: {str(e)}")
+        logger.exception("Error in get_portfolios: %s", e)
         return jsonify({'error': str(e)}), 500
 
+@portfolio_bp.route('/consolidated', methods=['GET'])
+@jwt_required()
+def get_consolidated():
+    """
+    Household view across all of the user's portfolios
+    
+    Every portfolio and holding is read in one joined query and decrypted in
+    one batch; returns per-symbol exposure (with each portfolio's share),
+    per-portfolio subtotals and the household HHI / diversification score.
+    """
+    user_id = int(get_jwt_identity())
+    
+    rows = db.session.execute(
+        select(Portfolio.id, Portfolio.name, Asset)
+        .outerjoin(Asset, Asset.portfolio_id == Portfolio.id)
+        .where(Portfolio.user_id == user_id)
+        .order_by(Portfolio.id, Asset.id)
+    ).all()
+    
+    portfolios = {}
+    for portfolio_id, name, _ in rows:
+        portfolios.setdefault(portfolio_id, name)
+    assets = [(portfolio_id, asset) for portfolio_id, _, asset in rows if asset is not None]
+    decrypted = Asset.bulk_decrypt(asset for _, asset in assets)
+    holdings = (
+        (portfolio_id, asset.symbol, asset.name, asset.asset_type, quantity, value)
+        for (portfolio_id, asset), (quantity, _, value) in zip(assets, decrypted)
+    )
+    
+    return jsonify(consolidate(list(portfolios.items()), holdings)), 200
+
+@portfolio_bp.route('/alerts', methods=['GET'])
+@jwt_required()
+def get_drift_alerts():
+    """
+    Drift alerts raised for the user's portfolios, oldest first
+    
+    Optional query: status=open (unresolved only), portfolio_id, and limit /
+    after (keyset page on id; the next cursor is returned in X-Next-Cursor)
+    """
+    user_id = int(get_jwt_identity())
+    
+    try:
+        page = page_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    portfolio_id = request.args.get('portfolio_id', type=int)
+    status = request.args.get('status', 'all')
+    if status not in ('all', 'open'):
+        return jsonify({'error': 'status must be one of all, open'}), 400
+    
+    statement = select(DriftAlert).join(Portfolio, Portfolio.id == DriftAlert.portfolio_id).where(
+        Portfolio.user_id == user_id
+    )
+    if status == 'open':
+        statement = statement.where(DriftAlert.resolved_at.is_(None))
+    if portfolio_id is not None:
+        statement = statement.where(DriftAlert.portfolio_id == portfolio_id)
+    
+    if page is not None:
+        alerts, next_cursor = keyset_page(statement, DriftAlert.id, *page)
+        return page_response([a.to_dict() for a in alerts], next_cursor), 200
+    alerts = db.session.execute(statement.order_by(DriftAlert.id)).scalars().all()
+    return jsonify([a.to_dict() for a in alerts]), 200
+
 @portfolio_bp.route('', methods=['POST'])
 @jwt_required()
 def create_portfolio():
@@ -59,18 +192,24 @@ def create_portfolio():
 @portfolio_bp.route('/<int:portfolio_id>', methods=['GET'])
 @jwt_required()
 def get_portfolio(portfolio_id):
-    """Get a specific portfolio with assets and allocations"""
+    """
+    Get a specific portfolio with assets and allocations
+    
+    Supports If-None-Match: an unchanged portfolio is answered 304 after a
+    single version lookup.
+    """
     user_id = int(get_jwt_identity())
-    portfolio = Portfolio.query.filter_by(id=portfolio_id, user_id=user_id).first()
+    unchanged = not_modified('portfolio', portfolio_id, user_id)
+    if unchanged is not None:
+        return unchanged
+    
+    portfolio = Portfolio.with_holdings_for_user(portfolio_id, user_id)
     
     if not portfolio:
         return jsonify({'error': 'Portfolio not found'}), 404
     
-    portfolio_dict = portfolio.to_dict()
-    portfolio_dict['assets'] = [a.to_dict() for a in portfolio.assets]
-    portfolio_dict['allocations'] = [a.to_dict() for a in portfolio.allocations]
-    
-    return jsonify(portfolio_dict), 200
+    etag = portfolio_etag('portfolio', portfolio.id, portfolio.version)
+    return with_etag(jsonify(portfolio_detail(portfolio)), etag), 200
 
 @portfolio_bp.route('/<int:portfolio_id>', methods=['PUT'])
 @jwt_required()
@@ -91,6 +230,7 @@ def update_portfolio(portfolio_id):
         portfolio.total_value = data['total_value']
     
     db.session.commit()
+    invalidate_rebalancing(portfolio_id)
     
     return jsonify(portfolio.to_dict()), 200
 
@@ -106,45 +246,193 @@ def delete_portfolio(portfolio_id):
     
     db.session.delete(portfolio)
     db.session.commit()
+    invalidate_rebalancing(portfolio_id)
     
     return jsonify({'message': 'Portfolio deleted'}), 200
 
 @portfolio_bp.route('/<int:portfolio_id>/rebalance', methods=['GET'])
 @jwt_required()
 def get_rebalancing_recommendations(portfolio_id):
-    """Get rebalancing recommendations for a portfolio"""
+    """
+    Get rebalancing recommendations for a portfolio
+    
+    Results are cached per portfolio version, so repeat calls between writes
+    skip loading and decrypting the holdings.
+    """
     user_id = int(get_jwt_identity())
-    portfolio = Portfolio.query.filter_by(id=portfolio_id, user_id=user_id).first()
+    cache = current_app.extensions.get('rebalance_cache')
+    
+    if cache is not None:
+        version = Portfolio.version_for_user(portfolio_id, user_id)
+        if version is None:
+            return jsonify({'error': 'Portfolio not found'}), 404
+        cached = cache.get(portfolio_id, version)
+        if cached is not None:
+            response = jsonify(cached)
+            response.headers['X-Cache'] = 'HIT'
+            return response, 200
+    
+    portfolio = Portfolio.with_holdings_for_user(portfolio_id, user_id)
     
     if not portfolio:
         return jsonify({'error': 'Portfolio not found'}), 404
     
-    # Get current holdings
-    current_holdings = [
-        {'symbol': asset.symbol, 'value': asset.value}
-        for asset in portfolio.assets
-    ]
+    result = rebalancing_result(portfolio)
+    if result is None:
+        return jsonify({'error': 'No target allocations set'}), 400
     
-    # Get target allocations
+    response = jsonify(result)
+    if cache is not None:
+        cache.set(portfolio.id, portfolio.version, result)
+        response.headers['X-Cache'] = 'MISS'
+    return response, 200
+
+@portfolio_bp.route('/<int:portfolio_id>/rebalance/orders', methods=['POST'])
+@jwt_required()
+def get_rebalancing_orders(portfolio_id):
+    """
+    Get tradeable whole-share orders that move a portfolio toward its targets
+    
+    Optional body: cash, cash_buffer, fixed_cost, proportional_cost (fraction
+    of notional), min_trade, lot_sizes ({symbol: shares}) and prices
+    ({symbol: price}, needed for target symbols not yet held).
+    """
+    user_id = int(get_jwt_identity())
+    portfolio = Portfolio.with_holdings_for_user(portfolio_id, user_id)
+    
+    if not portfolio:
+        return jsonify({'error': 'Portfolio not found'}), 404
+    
+    if not portfolio.allocations:
+        return jsonify({'error': 'No target allocations set'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    options = {}
+    for name in ('cash', 'cash_buffer', 'fixed_cost', 'proportional_cost', 'min_trade'):
+        value = data.get(name, 0)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+            return jsonify({'error': f'{name} must be a non-negative number'}), 400
+        options[name] = float(value)
+    for name in ('lot_sizes', 'prices'):
+        mapping = data.get(name) or {}
+        if not isinstance(mapping, dict) or not all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) and v > 0 for v in mapping.values()
+        ):
+            return jsonify({'error': f'{name} must map symbols to positive numbers'}), 400
+        options[name] = mapping
+    
+    assets = portfolio.assets
+    holdings = [
+        {'symbol': asset.symbol, 'quantity': quantity, 'price': price}
+        for asset, (quantity, price, _) in zip(assets, Asset.bulk_decrypt(assets))
+    ]
     target_allocations = [
         {'symbol': alloc.symbol, 'target_percentage': alloc.target_percentage}
         for alloc in portfolio.allocations
     ]
     
-    if not target_allocations:
-        return jsonify({'error': 'No target allocations set'}), 400
+    return jsonify(build_orders(holdings, target_allocations, **options)), 200
+
+@portfolio_bp.route('/<int:portfolio_id>/valuation', methods=['GET'])
+@jwt_required()
+def get_valuation_series(portfolio_id):
+    """
+    Get the value of a portfolio's current holdings over time
     
-    # Calculate rebalancing
-    recommendations = calculate_rebalancing(
-        current_holdings,
-        target_allocations,
-        portfolio.total_value
-    )
+    Optional query: start and end (YYYY-MM-DD, inclusive)
+    """
+    user_id = int(get_jwt_identity())
+    portfolio = Portfolio.with_holdings_for_user(portfolio_id, user_id)
     
-    # Calculate metrics
-    metrics = calculate_portfolio_metrics(current_holdings, portfolio.total_value)
+    if not portfolio:
+        return jsonify({'error': 'Portfolio not found'}), 404
+    
+    try:
+        start = to_day(request.args['start']) if request.args.get('start') else None
+        end = to_day(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+    
+    quantities = {}
+    assets = portfolio.assets
+    for asset, (quantity, _, _) in zip(assets, Asset.bulk_decrypt(assets)):
+        symbol = asset.symbol.upper()
+        quantities[symbol] = quantities.get(symbol, 0.0) + quantity
+    
+    series = current_app.extensions['price_history'].value_series(quantities, start, end)
     
     return jsonify({
-        'recommendations': recommendations,
-        'metrics': metrics
+        'portfolio_id': portfolio.id,
+        'dates': from_days(series['days']),
+        'values': series['values'].round(2).tolist(),
+        'missing_symbols': series['missing'],
+    }), 200
+
+@portfolio_bp.route('/<int:portfolio_id>/history', methods=['GET'])
+@jwt_required()
+def get_value_history(portfolio_id):
+    """
+    Get a portfolio's recorded value history as OHLC buckets
+    
+    Optional query: period (day, week or month; default day), start and end
+    (YYYY-MM-DD, inclusive bucket start dates) and limit (most recent buckets,
+    default 500)
+    """
+    user_id = int(get_jwt_identity())
+    portfolio = Portfolio.query.filter_by(id=portfolio_id, user_id=user_id).first()
+    
+    if not portfolio:
+        return jsonify({'error': 'Portfolio not found'}), 404
+    
+    period = request.args.get('period', 'day')
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+        limit = min(max(int(request.args.get('limit', 500)), 1), 5000)
+        history = value_history(portfolio.id, period, start, end, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'portfolio_id': portfolio.id, 'period': period, 'buckets': history}), 200
+
+@portfolio_bp.route('/rebalance/batch', methods=['POST'])
+@jwt_required()
+def get_batch_rebalancing_recommendations():
+    """
+    Get rebalancing recommendations for all of the user's portfolios
+    
+    Optional body: { "portfolio_ids": [...] } to restrict the batch.
+    Holdings are loaded and decrypted in bulk and every portfolio is
+    rebalanced in a single vectorized pass.
+    """
+    user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+    
+    portfolio_ids = data.get('portfolio_ids')
+    if portfolio_ids is not None:
+        if not isinstance(portfolio_ids, list) or not all(isinstance(i, int) for i in portfolio_ids):
+            return jsonify({'error': 'portfolio_ids must be a list of integers'}), 400
+    
+    portfolios = Portfolio.all_with_holdings_for_user(user_id, portfolio_ids)
+    totals = Portfolio.bulk_total_values(portfolios)
+    values = iter(Asset.bulk_decrypt([a for p in portfolios for a in p.assets]))
+    
+    batch = [
+        {
+            'holdings': [{'symbol': a.symbol, 'value': next(values)[2]} for a in portfolio.assets],
+            'targets': [
+                {'symbol': alloc.symbol, 'target_percentage': alloc.target_percentage}
+                for alloc in portfolio.allocations
+            ],
+            'total_value': total,
+        }
+        for portfolio, total in zip(portfolios, totals)
+    ]
+    results = rebalance_many(batch)
+    
+    return jsonify({
+        'portfolios': [
+            {'portfolio_id': portfolio.id, 'name': portfolio.name, **result}
+            for portfolio, result in zip(portfolios, results)
+        ]
     }), 200
@@ -0,0 +1,36 @@
+"""
+Market quote routes
+"""
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from app.services.quotes import normalize_symbols
+
+quotes_bp = Blueprint('quotes', __name__)
+
+MAX_SYMBOLS = 100
+
+@quotes_bp.route('', methods=['GET'])
+@jwt_required()
+def get_quotes():
+    """
+    Get quotes for many symbols in one call
+    Expects: ?symbols=AAPL,MSFT,...
+    Unknown symbols are listed in 'missing'; symbols whose upstream fetch
+    failed or timed out are listed in 'unavailable'.
+    """
+    symbols = normalize_symbols(request.args.get('symbols', '').split(','))
+    
+    if not symbols:
+        return jsonify({'error': 'symbols is required'}), 400
+    if len(symbols) > MAX_SYMBOLS:
+        return jsonify({'error': f'At most {MAX_SYMBOLS} symbols per request'}), 400
+    if any(len(s) > 20 for s in symbols):
+        return jsonify({'error': 'Invalid symbol'}), 400
+    
+    quotes = current_app.extensions['quote_service'].get_quotes(symbols)
+    
+    return jsonify({
+        'quotes': [q for q in quotes.values() if q is not None],
+        'missing': [s for s, q in quotes.items() if q is None],
+        'unavailable': [s for s in symbols if s not in quotes],
+    }), 200
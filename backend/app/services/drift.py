@@ -0,0 +1,286 @@
+"""
+Event-driven drift monitoring
+
+DriftMonitor holds, for every portfolio with target allocations, the
+quantity and live value of each holding, their sum, the target weights and
+which symbols are currently out of band, plus an inverted index from
+symbol to the portfolios holding it. A price update only touches the
+portfolios in that symbol's posting list: the holding's value and the
+portfolio total are adjusted by the difference, then that portfolio's
+targets are checked against target ± band. Portfolios not holding the
+symbol are never looked at, and a batch of prices evaluates each affected
+portfolio once.
+
+Only transitions are reported (a target entering or leaving its band), so
+a sustained breach raises a single alert. Tracking a portfolio doesn't
+evaluate it: stored holding values may be stale, so the first live price
+(or an edit picked up by sync()) does. Weights are taken over the live
+value of the holdings, not the stored total_value.
+
+load(), sync() and record_alerts() connect the monitor to the database;
+monitor_drift.py runs it against a replayed feed or the quote service.
+"""
+import csv
+from collections import defaultdict
+from datetime import datetime
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.orm import selectinload
+from app import db
+from app.models import Asset, AssetAllocation, DriftAlert, Portfolio
+
+DEFAULT_BAND = 5.0
+
+class _PortfolioState:
+    """What the monitor keeps per portfolio"""
+    __slots__ = ('version', 'quantities', 'values', 'total', 'targets', 'breached')
+
+    def __init__(self, version: int, targets: Dict[str, float]):
+        self.version = version
+        self.quantities: Dict[str, float] = defaultdict(float)
+        self.values: Dict[str, float] = defaultdict(float)
+        self.total = 0.0
+        self.targets = targets
+        self.breached: Set[str] = set()
+
+class DriftMonitor:
+    """
+    Incremental drift evaluation over tracked portfolios
+
+    Args:
+        band: Allowed distance from the target, in percentage points
+    """
+
+    def __init__(self, band: float = DEFAULT_BAND):
+        self.band = band
+        self.portfolios: Dict[int, _PortfolioState] = {}
+        self.holders: Dict[str, Set[int]] = defaultdict(set)
+        self.prices: Dict[str, float] = {}
+        # Portfolio evaluations so far (one per affected portfolio per batch)
+        self.evaluations = 0
+
+    def track(self, portfolio_id: int, version: int, holdings: Iterable[Tuple[str, float, float]],
+              targets: Dict[str, float], breached: Iterable[str] = ()) -> None:
+        """
+        Start (or restart) tracking a portfolio
+
+        Args:
+            holdings: (symbol, quantity, value) of each asset; symbols with a
+                price already seen by the monitor are revalued at that price
+            targets: {symbol: target_percentage}
+            breached: Symbols with an open alert, so they aren't raised again
+        """
+        self.untrack(portfolio_id)
+        state = _PortfolioState(version, {s.upper(): t for s, t in targets.items()})
+        state.breached = {s.upper() for s in breached}
+        for symbol, quantity, value in holdings:
+            symbol = symbol.upper()
+            state.quantities[symbol] += quantity
+            state.values[symbol] += value
+        for symbol in state.quantities:
+            if symbol in self.prices:
+                state.values[symbol] = state.quantities[symbol] * self.prices[symbol]
+            self.holders[symbol].add(portfolio_id)
+        state.total = sum(state.values.values())
+        self.portfolios[portfolio_id] = state
+
+    def untrack(self, portfolio_id: int) -> None:
+        """Stop tracking a portfolio and drop it from the symbol index"""
+        state = self.portfolios.pop(portfolio_id, None)
+        if state is None:
+            return
+        for symbol in state.quantities:
+            holders = self.holders.get(symbol)
+            if holders is not None:
+                holders.discard(portfolio_id)
+                if not holders:
+                    del self.holders[symbol]
+
+    def symbols(self) -> List[str]:
+        """Symbols held by at least one tracked portfolio"""
+        return sorted(self.holders)
+
+    def on_price(self, symbol: str, price: float) -> List[Dict]:
+        """Apply one price update; see apply_prices"""
+        return self.apply_prices({symbol: price})
+
+    def apply_prices(self, prices: Dict[str, float]) -> List[Dict]:
+        """
+        Apply a batch of price updates
+
+        Returns:
+            Transitions as {'portfolio_id', 'symbol', 'target_percentage',
+            'actual_percentage', 'breached'}; breached is False when the
+            weight came back inside the band
+        """
+        affected = set()
+        for symbol, price in prices.items():
+            symbol = symbol.upper()
+            self.prices[symbol] = price
+            for portfolio_id in self.holders.get(symbol, ()):
+                state = self.portfolios[portfolio_id]
+                value = state.quantities[symbol] * price
+                state.total += value - state.values[symbol]
+                state.values[symbol] = value
+                affected.add(portfolio_id)
+
+        events = []
+        for portfolio_id in sorted(affected):
+            events.extend(self._evaluate(portfolio_id, self.portfolios[portfolio_id]))
+        return events
+
+    def weights(self, portfolio_id: int) -> Dict[str, float]:
+        """Current weights (percent) of a tracked portfolio's holdings"""
+        state = self.portfolios[portfolio_id]
+        return {s: v / state.total * 100 if state.total > 0 else 0.0 for s, v in state.values.items()}
+
+    def evaluate(self, portfolio_id: int) -> List[Dict]:
+        """Check a tracked portfolio at its current weights (transitions as in apply_prices)"""
+        return self._evaluate(portfolio_id, self.portfolios[portfolio_id])
+
+    def _evaluate(self, portfolio_id: int, state: _PortfolioState) -> List[Dict]:
+        self.evaluations += 1
+        events = []
+        for symbol, target in state.targets.items():
+            actual = state.values.get(symbol, 0.0) / state.total * 100 if state.total > 0 else 0.0
+            breached = abs(actual - target) > self.band
+            if breached == (symbol in state.breached):
+                continue
+            if breached:
+                state.breached.add(symbol)
+            else:
+                state.breached.discard(symbol)
+            events.append({
+                'portfolio_id': portfolio_id,
+                'symbol': symbol,
+                'target_percentage': target,
+                'actual_percentage': actual,
+                'breached': breached,
+            })
+        return events
+
+def load(monitor: DriftMonitor, portfolio_ids: Optional[Iterable[int]] = None) -> List[int]:
+    """
+    Track portfolios with target allocations from the database
+
+    Holdings are decrypted in one batch; open alerts seed each portfolio's
+    breached set so a restarted monitor doesn't raise them again.
+
+    Args:
+        portfolio_ids: Portfolios to (re)load; all with allocations if None
+
+    Returns:
+        Ids of the portfolios now tracked
+    """
+    with_targets = select(AssetAllocation.portfolio_id).distinct()
+    query = Portfolio.query.options(
+        selectinload(Portfolio.assets),
+        selectinload(Portfolio.allocations)
+    ).filter(Portfolio.id.in_(with_targets))
+    if portfolio_ids is not None:
+        query = query.filter(Portfolio.id.in_(list(portfolio_ids)))
+    portfolios = query.order_by(Portfolio.id).all()
+
+    open_alerts = defaultdict(set)
+    for portfolio_id, symbol in db.session.execute(
+        select(DriftAlert.portfolio_id, DriftAlert.symbol)
+        .where(DriftAlert.resolved_at.is_(None), DriftAlert.portfolio_id.in_([p.id for p in portfolios]))
+    ):
+        open_alerts[portfolio_id].add(symbol)
+
+    decrypted = iter(Asset.bulk_decrypt([a for p in portfolios for a in p.assets]))
+    for portfolio in portfolios:
+        holdings = [(a.symbol, quantity, value) for a, (quantity, _, value) in zip(portfolio.assets, decrypted)]
+        targets = {alloc.symbol: alloc.target_percentage for alloc in portfolio.allocations}
+        monitor.track(portfolio.id, portfolio.version, holdings, targets, open_alerts[portfolio.id])
+    return [p.id for p in portfolios]
+
+def sync(monitor: DriftMonitor) -> List[Dict]:
+    """
+    Reload portfolios edited since they were loaded
+
+    One query reads the versions of all portfolios with allocations; only
+    new or changed ones are reloaded (and evaluated, since their targets or
+    quantities moved), and deleted ones (or ones whose targets were removed)
+    are dropped.
+
+    Returns:
+        Transitions of the reloaded portfolios
+    """
+    versions = dict(db.session.execute(
+        select(Portfolio.id, Portfolio.version)
+        .where(Portfolio.id.in_(select(AssetAllocation.portfolio_id).distinct()))
+    ).all())
+    for portfolio_id in set(monitor.portfolios) - set(versions):
+        monitor.untrack(portfolio_id)
+    stale = [
+        portfolio_id for portfolio_id, version in versions.items()
+        if portfolio_id not in monitor.portfolios or monitor.portfolios[portfolio_id].version != version
+    ]
+    if not stale:
+        return []
+    return [event for portfolio_id in load(monitor, stale) for event in monitor.evaluate(portfolio_id)]
+
+def record_alerts(events: List[Dict], band: float, at: Optional[datetime] = None) -> int:
+    """
+    Write transitions to drift_alerts (in the session's transaction)
+
+    Breaches insert an open alert; recoveries resolve the open alert of the
+    same portfolio and symbol. Events apply in order, so a recovery followed
+    by a new breach of the same symbol (e.g. from sync() and then a price
+    batch) leaves the new alert open.
+
+    Returns:
+        Number of alerts raised
+    """
+    at = at or datetime.utcnow()
+    table = DriftAlert.__table__
+    connection = db.session.connection()
+    # Breaches are inserted in one statement unless a later recovery must see them first
+    pending = []
+
+    def insert_pending():
+        if pending:
+            connection.execute(table.insert(), pending)
+            pending.clear()
+
+    raised = 0
+    for e in events:
+        key = (e['portfolio_id'], e['symbol'])
+        if e['breached']:
+            pending.append({
+                'portfolio_id': e['portfolio_id'], 'symbol': e['symbol'], 'target_percentage': e['target_percentage'],
+                'actual_percentage': e['actual_percentage'], 'band': band, 'triggered_at': at,
+            })
+            raised += 1
+            continue
+        if any((row['portfolio_id'], row['symbol']) == key for row in pending):
+            insert_pending()
+        connection.execute(
+            update(table)
+            .where(table.c.portfolio_id == e['portfolio_id'], table.c.symbol == e['symbol'],
+                   table.c.resolved_at.is_(None))
+            .values(resolved_at=at)
+        )
+    insert_pending()
+    return raised
+
+def read_feed(path: str) -> List[Tuple[datetime, str, float]]:
+    """
+    Read a recorded price feed
+
+    The CSV needs timestamp (ISO 8601), symbol and price columns; rows are
+    returned in timestamp order (stable for equal timestamps).
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        ticks = [
+            (datetime.fromisoformat(row['timestamp']), row['symbol'].strip().upper(), float(row['price']))
+            for row in csv.DictReader(f)
+        ]
+    return sorted(ticks, key=lambda tick: tick[0])
+
+def replay(ticks: Iterable[Tuple[datetime, str, float]]) -> Iterator[Tuple[datetime, Dict[str, float]]]:
+    """Group ordered ticks into (timestamp, {symbol: price}) batches"""
+    for at, group in groupby(ticks, key=lambda tick: tick[0]):
+        yield at, {symbol: price for _, symbol, price in group}
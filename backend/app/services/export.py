@@ -0,0 +1,403 @@
+"""
+Streaming export and restore of a user's data
+
+An archive holds one user's profile, portfolios, assets and allocations as
+plaintext rows, so it can be restored under another AES_ENCRYPTION_KEY
+(a different deployment, or after a key change); it is protected by its own
+key derived from a passphrase.
+
+Format:
+    MAGIC (8) | scrypt salt (16) | frame | frame | ...
+    frame: length (4, big-endian) | nonce (12) | AES-GCM(zlib(JSON chunk)) | tag (16)
+
+Each frame is one chunk {'table': ..., 'rows': [...]}, authenticated with
+its position so frames can't be dropped or reordered; the first is the
+manifest and the last an 'end' frame with row counts, so a truncated
+archive is detected. Rows are read with server-side cursors a chunk at a
+time; decrypting and sealing (or opening and re-encrypting on restore) a
+chunk is a pure function of its rows, so chunks fan out over an optional
+process pool while a bounded window keeps memory proportional to the chunk
+size. Restores write with bulk inserts in one transaction.
+"""
+import json
+import math
+import struct
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+from Crypto.Cipher import AES
+from Crypto.Protocol.KDF import scrypt
+from Crypto.Random import get_random_bytes
+from sqlalchemy import insert, select
+from sqlalchemy.exc import StatementError
+from app import db
+from app.models import Asset, AssetAllocation, Portfolio, User
+from app.models.portfolio import _decrypt_floats, _decrypt_records
+from app.utils.encryption import encrypt_many, encrypt_records
+
+MAGIC = b'MLARCH01'
+ARCHIVE_VERSION = 1
+SALT_SIZE = 16
+NONCE_SIZE = 12
+TAG_SIZE = 16
+# Interactive-strength scrypt parameters (about 32 MiB and 0.1 s per derivation)
+SCRYPT_N = 2 ** 15
+DEFAULT_CHUNK_SIZE = 1000
+# Largest frame accepted on restore, well above a compressed DEFAULT_CHUNK_SIZE chunk
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+# Largest decompressed chunk accepted on restore (bounds memory against highly compressible frames)
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+TABLES = ('user', 'portfolios', 'assets', 'allocations')
+
+def archive_key(passphrase: str, salt: bytes) -> bytes:
+    """Derive the archive's AES-256 key from a passphrase"""
+    return scrypt(passphrase.encode('utf-8'), salt, 32, N=SCRYPT_N, r=8, p=1)
+
+def _seal(key: bytes, index: int, chunk: Dict) -> bytes:
+    cipher = AES.new(key, AES.MODE_GCM, nonce=get_random_bytes(NONCE_SIZE))
+    cipher.update(struct.pack('>I', index))
+    body, tag = cipher.encrypt_and_digest(zlib.compress(json.dumps(chunk).encode('utf-8')))
+    frame = cipher.nonce + body + tag
+    return struct.pack('>I', len(frame)) + frame
+
+def _open(key: bytes, index: int, frame: bytes) -> Dict:
+    cipher = AES.new(key, AES.MODE_GCM, nonce=frame[:NONCE_SIZE])
+    cipher.update(struct.pack('>I', index))
+    try:
+        plain = cipher.decrypt_and_verify(frame[NONCE_SIZE:-TAG_SIZE], frame[-TAG_SIZE:])
+    except ValueError:
+        raise ValueError('Archive is corrupt or the passphrase is wrong')
+    inflater = zlib.decompressobj()
+    try:
+        data = inflater.decompress(plain, MAX_CHUNK_BYTES)
+    except zlib.error:
+        raise ValueError('Archive is corrupt')
+    if inflater.unconsumed_tail:
+        raise ValueError(f'Archive chunk is larger than {MAX_CHUNK_BYTES} bytes uncompressed')
+    if not inflater.eof:
+        raise ValueError('Archive is corrupt')
+    return json.loads(data)
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+def _parse_time(value) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+def encode_chunk(table: str, rows: List[Tuple], key: bytes, index: int) -> bytes:
+    """
+    Decrypt one chunk of raw rows and seal it as a frame (runs in pool processes)
+
+    Args:
+        rows: Column tuples as selected by _chunks for the table
+    """
+    if table == 'portfolios':
+        totals = _decrypt_floats(row[3] for row in rows)
+        rows = [
+            {'id': row[0], 'name': row[1], 'description': row[2], 'total_value': total,
+             'created_at': _iso(row[4])}
+            for row, total in zip(rows, totals)
+        ]
+    elif table == 'assets':
+        records = _decrypt_records(row[4] for row in rows)
+        legacy = [i for i, record in enumerate(records) if record is None]
+        floats = _decrypt_floats(v for i in legacy for v in rows[i][5:8])
+        for n, i in enumerate(legacy):
+            records[i] = tuple(floats[3 * n:3 * n + 3])
+        rows = [
+            {'portfolio_id': row[0], 'symbol': row[1], 'name': row[2], 'asset_type': row[3],
+             'quantity': record[0], 'price': record[1], 'value': record[2]}
+            for row, record in zip(rows, records)
+        ]
+    elif table == 'allocations':
+        rows = [
+            {'portfolio_id': row[0], 'symbol': row[1], 'target_percentage': row[2], 'asset_type': row[3]}
+            for row in rows
+        ]
+    return _seal(key, index, {'table': table, 'rows': rows})
+
+def _text(value, column):
+    """An archived string checked against its column's type, length and nullability"""
+    if value is None and column.nullable:
+        return None
+    length = getattr(column.type, 'length', None)
+    if not isinstance(value, str) or (length is not None and len(value) > length):
+        raise ValueError(f'invalid {column.name}')
+    return value
+
+def _finite(value) -> float:
+    """An archived number as a finite float"""
+    if isinstance(value, bool):
+        raise TypeError('booleans are not numbers')
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError('number is not finite')
+    return number
+
+def _rebuild_rows(table: str, rows: List[Dict]) -> List[Dict]:
+    """Rebuild archived rows with a fixed set of validated columns for insertion"""
+    if not isinstance(rows, list):
+        raise TypeError('rows must be a list')
+    if table == 'user':
+        if len(rows) != 1 or not isinstance(rows[0], list) or len(rows[0]) != 3:
+            raise ValueError('invalid user')
+        columns = User.__table__.c
+        return [[_text(value, column) for value, column in
+                 zip(rows[0], (columns.firebase_uid, columns.email, columns.display_name))]]
+    if table == 'portfolios':
+        columns = Portfolio.__table__.c
+        totals = encrypt_many(str(_finite(row['total_value'])) for row in rows)
+        return [
+            {'id': row['id'], 'name': _text(row['name'], columns.name),
+             'description': _text(row['description'], columns.description),
+             'total_value_encrypted': total, 'created_at': _parse_time(row['created_at'])}
+            for row, total in zip(rows, totals)
+        ]
+    if table == 'assets':
+        columns = Asset.__table__.c
+        records = encrypt_records((_finite(row['quantity']), _finite(row['price']), _finite(row['value']))
+                                  for row in rows)
+        return [
+            {'portfolio_id': row['portfolio_id'], 'symbol': _text(row['symbol'], columns.symbol),
+             'name': _text(row['name'], columns.name), 'asset_type': _text(row['asset_type'], columns.asset_type),
+             'holding_encrypted': record}
+            for row, record in zip(rows, records)
+        ]
+    if table == 'allocations':
+        columns = AssetAllocation.__table__.c
+        rebuilt = []
+        for row in rows:
+            target = _finite(row['target_percentage'])
+            if not 0 <= target <= 100:
+                raise ValueError('invalid allocation')
+            rebuilt.append({'portfolio_id': row['portfolio_id'], 'symbol': _text(row['symbol'], columns.symbol),
+                            'target_percentage': target,
+                            'asset_type': _text(row['asset_type'], columns.asset_type)})
+        return rebuilt
+    return rows
+
+def decode_frame(frame: bytes, key: bytes, index: int) -> Dict:
+    """
+    Open one frame and encrypt its values under this deployment's key (runs in pool processes)
+
+    Returns:
+        The chunk, with portfolios, assets and allocations carrying column
+        values ready for insertion (portfolio ids are still the archive's)
+
+    Raises:
+        ValueError: If the frame doesn't open or its rows are malformed
+    """
+    chunk = _open(key, index, frame)
+    try:
+        return {'table': chunk['table'], 'rows': _rebuild_rows(chunk['table'], chunk['rows'])}
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise ValueError('Archive is corrupt')
+
+def _ordered(executor, fn, calls: Iterable[Tuple], window: int) -> Iterator:
+    """Results of fn(*args) in call order, at most `window` running at a time (inline without an executor)"""
+    if executor is None:
+        for args in calls:
+            yield fn(*args)
+        return
+    pending = deque()
+    for args in calls:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def _chunks(user_id: int, chunk_size: int) -> Iterator[Tuple[str, List[Tuple]]]:
+    """Yield (table, raw rows) for a user, each table read with a server-side cursor"""
+    user = db.session.get(User, user_id)
+    yield 'user', [(user.firebase_uid, user.email, user.display_name)]
+
+    portfolios = Portfolio.__table__
+    assets = Asset.__table__
+    allocations = AssetAllocation.__table__
+    owned = select(portfolios.c.id).where(portfolios.c.user_id == user_id)
+    statements = {
+        'portfolios': select(portfolios.c.id, portfolios.c.name, portfolios.c.description,
+                             portfolios.c.total_value_encrypted, portfolios.c.created_at)
+        .where(portfolios.c.user_id == user_id).order_by(portfolios.c.id),
+        'assets': select(assets.c.portfolio_id, assets.c.symbol, assets.c.name, assets.c.asset_type,
+                         assets.c.holding_encrypted, assets.c.quantity_encrypted, assets.c.price_encrypted,
+                         assets.c.value_encrypted)
+        .where(assets.c.portfolio_id.in_(owned)).order_by(assets.c.id),
+        'allocations': select(allocations.c.portfolio_id, allocations.c.symbol, allocations.c.target_percentage,
+                              allocations.c.asset_type)
+        .where(allocations.c.portfolio_id.in_(owned)).order_by(allocations.c.id),
+    }
+    for table, statement in statements.items():
+        result = db.session.execute(statement.execution_options(yield_per=chunk_size))
+        try:
+            for rows in result.partitions():
+                # Drivers may return bytea as memoryview, which can't be sent to pool processes
+                yield table, [tuple(bytes(v) if isinstance(v, memoryview) else v for v in row) for row in rows]
+        finally:
+            result.close()
+
+def _finish(report: Dict, started: float) -> Dict:
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    report['rows_per_second'] = round(report['rows'] / report['seconds']) if report['seconds'] else 0
+    return report
+
+def export_frames(user_id: int, passphrase: str, chunk_size: int = DEFAULT_CHUNK_SIZE, executor=None,
+                  window: int = 8, report: Optional[Dict] = None) -> Iterator[bytes]:
+    """
+    Stream a user's archive (inside an app context)
+
+    Args:
+        executor: Pool that decrypts and seals chunks (inline if None)
+        window: Chunks in flight on the executor
+        report: Filled with row counts, bytes and rows_per_second once the
+            stream is exhausted
+    """
+    started = time.perf_counter()
+    report = report if report is not None else {}
+    report.update(tables={table: 0 for table in TABLES}, rows=0, bytes=0)
+    salt = get_random_bytes(SALT_SIZE)
+    key = archive_key(passphrase, salt)
+
+    header = MAGIC + salt + _seal(key, 0, {'table': 'manifest', 'rows': [{
+        'version': ARCHIVE_VERSION, 'created_at': datetime.utcnow().isoformat(),
+    }]})
+    report['bytes'] += len(header)
+    yield header
+
+    index = 0
+
+    def calls():
+        nonlocal index
+        for table, rows in _chunks(user_id, chunk_size):
+            index += 1
+            report['tables'][table] += len(rows)
+            report['rows'] += len(rows)
+            yield table, rows, key, index
+
+    for frame in _ordered(executor, encode_chunk, calls(), window):
+        report['bytes'] += len(frame)
+        yield frame
+
+    end = _seal(key, index + 1, {'table': 'end', 'rows': [{'tables': report['tables']}]})
+    report['bytes'] += len(end)
+    yield end
+    _finish(report, started)
+
+def export_user(user_id: int, out: BinaryIO, passphrase: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                executor=None) -> Dict:
+    """
+    Write a user's archive to a binary file
+
+    Returns:
+        {'tables', 'rows', 'bytes', 'seconds', 'rows_per_second'}
+    """
+    report = {}
+    for data in export_frames(user_id, passphrase, chunk_size, executor, report=report):
+        out.write(data)
+    return report
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        part = stream.read(size - len(data))
+        if not part:
+            break
+        data += part
+    return data
+
+def _frames(stream: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    index = 0
+    while True:
+        prefix = _read_exact(stream, 4)
+        if not prefix:
+            return
+        frame = b''
+        if len(prefix) == 4:
+            (length,) = struct.unpack('>I', prefix)
+            if not NONCE_SIZE + TAG_SIZE <= length <= MAX_FRAME_SIZE:
+                raise ValueError('Archive is corrupt')
+            frame = _read_exact(stream, length)
+        if len(prefix) != 4 or len(frame) != length:
+            raise ValueError('Archive is truncated')
+        yield index, frame
+        index += 1
+
+def restore_user(stream: BinaryIO, passphrase: str, user_id: Optional[int] = None, executor=None,
+                 window: int = 8) -> Dict:
+    """
+    Restore an archive as new portfolios (in the session's transaction; the caller commits)
+
+    Args:
+        user_id: Owner of the restored portfolios; None creates the archived
+            user (who must not exist in this database yet)
+        executor: Pool that opens and re-encrypts chunks (inline if None)
+
+    Returns:
+        {'user_id', 'tables', 'rows', 'seconds', 'rows_per_second'}
+
+    Raises:
+        ValueError: If the archive is corrupt, truncated, from another
+            format version or the passphrase is wrong
+    """
+    started = time.perf_counter()
+    header = _read_exact(stream, len(MAGIC) + SALT_SIZE)
+    if len(header) != len(MAGIC) + SALT_SIZE or not header.startswith(MAGIC):
+        raise ValueError('Not a MoneyLab archive')
+    key = archive_key(passphrase, header[len(MAGIC):])
+
+    report = {'user_id': user_id, 'tables': {table: 0 for table in TABLES}, 'rows': 0}
+    portfolio_ids = {}
+    ended = False
+    calls = ((frame, key, index) for index, frame in _frames(stream))
+    for chunk in _ordered(executor, decode_frame, calls, window):
+        table, rows = chunk['table'], chunk['rows']
+        if ended:
+            raise ValueError('Archive is corrupt')
+        try:
+            if table == 'manifest':
+                if rows[0]['version'] != ARCHIVE_VERSION:
+                    raise ValueError(f"Unsupported archive version {rows[0]['version']}")
+                continue
+            if table == 'end':
+                if rows[0]['tables'] != report['tables']:
+                    raise ValueError('Archive is truncated')
+                ended = True
+                continue
+            if table not in TABLES:
+                raise ValueError('Archive is corrupt')
+
+            if table == 'user':
+                if report['user_id'] is None:
+                    firebase_uid, email, display_name = rows[0]
+                    user = User(firebase_uid=firebase_uid, email=email, display_name=display_name)
+                    db.session.add(user)
+                    db.session.flush()
+                    report['user_id'] = user.id
+            elif table == 'portfolios':
+                archived = [row.pop('id') for row in rows]
+                for row in rows:
+                    row['user_id'] = report['user_id']
+                table_ = Portfolio.__table__
+                new_ids = db.session.execute(
+                    insert(table_).returning(table_.c.id, sort_by_parameter_order=True), rows
+                ).scalars().all()
+                portfolio_ids.update(zip(archived, new_ids))
+            else:
+                for row in rows:
+                    row['portfolio_id'] = portfolio_ids[row['portfolio_id']]
+                model = Asset if table == 'assets' else AssetAllocation
+                if rows:
+                    db.session.execute(insert(model.__table__), rows)
+            report['tables'][table] += len(rows)
+            report['rows'] += len(rows)
+        except (IndexError, KeyError, TypeError, StatementError):
+            # Malformed rows, ids of portfolios not in the archive, duplicate holdings or values the database rejects
+            raise ValueError('Archive is corrupt')
+
+    if not ended:
+        raise ValueError('Archive is truncated')
+    return _finish(report, started)
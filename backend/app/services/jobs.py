@@ -0,0 +1,398 @@
+"""
+Background jobs on the application database
+
+Slow work (rebalancing, total repair, imports, snapshots) can be queued as
+rows of the jobs table instead of running inside a request. Workers
+(worker.py) claim queued jobs with SELECT ... FOR UPDATE SKIP LOCKED, so
+any number of them can share the table without a broker, and run each job
+on a process pool whose processes build their own app.
+
+- Retries: a failed job is queued again with exponential backoff until it
+  has used max_attempts; handlers raise JobFailed for errors a retry can't
+  fix.
+- Leases: a claim is a lease (locked_by, locked_at, attempts) that the
+  worker renews while the job runs. Jobs whose lease wasn't renewed for
+  JOB_TIMEOUT (a dead worker) are requeued, and results reported under a
+  lease that was lost meanwhile are dropped.
+- Deduplication: at most one queued or running job per dedupe_key (a
+  partial unique index); enqueueing the same key returns that job.
+- Per-user concurrency: a claim skips users already running
+  JOB_USER_CONCURRENCY jobs. Claims lock the users' rows, so concurrent
+  workers can't both take a user's last slot.
+"""
+import io
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from flask import current_app
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Job, Portfolio, User
+
+logger = logging.getLogger(__name__)
+
+# Queued jobs read per claim for each free slot, so users at their cap don't starve the others
+CLAIM_LOOKAHEAD = 4
+
+HANDLERS: Dict[str, Callable] = {}
+# Kinds users may enqueue through the API (the rest are enqueued by operators)
+USER_KINDS = set()
+
+class JobFailed(Exception):
+    """Raised by a handler for an error retrying can't fix"""
+
+class LeaseLost(Exception):
+    """Raised when a worker reports on a job attempt it no longer holds"""
+
+def handler(kind: str, user: bool = True):
+    """Register a job handler, called as fn(user_id, payload) -> JSON-serializable result"""
+    def register(fn):
+        HANDLERS[kind] = fn
+        if user:
+            USER_KINDS.add(kind)
+        return fn
+    return register
+
+@handler('rebalance')
+def rebalance_job(user_id, payload):
+    """Rebalancing result of one portfolio, also stored in the rebalancing cache"""
+    from app.routes.portfolio import rebalancing_result
+    portfolio = Portfolio.with_holdings_for_user(payload.get('portfolio_id'), user_id)
+    if portfolio is None:
+        raise JobFailed('Portfolio not found')
+    result = rebalancing_result(portfolio)
+    if result is None:
+        return {'recommendations': [], 'metrics': None}
+    cache = current_app.extensions.get('rebalance_cache')
+    if cache is not None:
+        cache.set(portfolio.id, portfolio.version, result)
+    return result
+
+@handler('repair_totals')
+def repair_totals_job(user_id, payload):
+    """Verify (and with repair=true, fix) the user's portfolio totals"""
+    from app.utils.totals import verify_totals
+    drifted = verify_totals(bool(payload.get('repair')), float(payload.get('tolerance', 0.005)), user_id=user_id)
+    return {'drifted': drifted}
+
+@handler('import')
+def import_job(user_id, payload):
+    """Import holdings from CSV or NDJSON text (payload: portfolio_id, format, data, strict)"""
+    from app.services.rebalance_cache import invalidate_rebalancing
+    from app.utils.importer import import_holdings, iter_rows
+    fmt = payload.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        raise JobFailed('format must be csv or ndjson')
+    portfolio = Portfolio.locked_for_user(payload.get('portfolio_id'), user_id)
+    if portfolio is None:
+        raise JobFailed('Portfolio not found')
+
+    report = import_holdings(portfolio, iter_rows(io.BytesIO(payload.get('data', '').encode('utf-8')), fmt))
+    if report['failed'] and payload.get('strict'):
+        db.session.rollback()
+        report['imported'] = 0
+        report['imported_value'] = 0.0
+        return report
+    db.session.commit()
+    invalidate_rebalancing(portfolio.id)
+    report['total_value'] = portfolio.total_value
+    return report
+
+@handler('snapshot', user=False)
+def snapshot_job(user_id, payload):
+    """Snapshot every portfolio whose value changed (see snapshot_portfolios.py)"""
+    from app.utils.snapshots import snapshot_all
+    return {'written': snapshot_all(int(payload.get('chunk_size', 500)), log=logger.info)}
+
+def _active(dedupe_key: str) -> Optional[Job]:
+    return Job.query.filter(Job.dedupe_key == dedupe_key, Job.status.in_(('queued', 'running'))).first()
+
+def enqueue(kind: str, payload: Optional[Dict] = None, user_id: Optional[int] = None,
+            dedupe_key: Optional[str] = None, max_attempts: Optional[int] = None) -> Tuple[Job, bool]:
+    """
+    Queue a job (commits)
+
+    Returns:
+        (job, created); created is False when a queued or running job
+        already had the dedupe key
+
+    Raises:
+        ValueError: If no handler is registered for the kind
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    if dedupe_key:
+        existing = _active(dedupe_key)
+        if existing is not None:
+            return existing, False
+
+    job = Job(user_id=user_id, kind=kind, dedupe_key=dedupe_key, status='queued',
+              max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'])
+    job.payload = payload
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request queued the same key between the check and the insert
+        db.session.rollback()
+        existing = _active(dedupe_key) if dedupe_key else None
+        if existing is None:
+            raise
+        return existing, False
+    return job, True
+
+def claim(worker_id: str, slots: int, per_user_limit: int, now: Optional[datetime] = None) -> List[Dict]:
+    """
+    Mark up to `slots` runnable jobs as running for this worker (commits)
+
+    Returns:
+        [{'id', 'kind', 'user_id', 'payload', 'attempt'}] in queue order; the
+        worker id and attempt identify the lease
+    """
+    now = now or datetime.utcnow()
+    table = Job.__table__
+    candidates = db.session.execute(
+        select(table.c.id, table.c.user_id)
+        .where(table.c.status == 'queued', table.c.run_after <= now)
+        .order_by(table.c.id)
+        .limit(slots * CLAIM_LOOKAHEAD)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    running = {}
+    user_ids = sorted({user_id for _, user_id in candidates if user_id is not None})
+    if user_ids:
+        # Held until commit: a concurrent claim for the same users waits and then sees these jobs running
+        db.session.execute(
+            select(User.id).where(User.id.in_(user_ids)).order_by(User.id).with_for_update(key_share=True)
+        )
+        running = dict(db.session.execute(
+            select(table.c.user_id, func.count())
+            .where(table.c.status == 'running', table.c.user_id.in_(user_ids))
+            .group_by(table.c.user_id)
+        ).all())
+
+    chosen = []
+    for job_id, user_id in candidates:
+        if len(chosen) == slots:
+            break
+        if user_id is not None:
+            if running.get(user_id, 0) >= per_user_limit:
+                continue
+            running[user_id] = running.get(user_id, 0) + 1
+        chosen.append(job_id)
+    if not chosen:
+        db.session.commit()
+        return []
+
+    db.session.execute(
+        update(table).where(table.c.id.in_(chosen))
+        .values(status='running', locked_by=worker_id, locked_at=now, attempts=table.c.attempts + 1)
+    )
+    # populate_existing: rows already in the session don't show the update's attempts otherwise
+    jobs = Job.query.filter(Job.id.in_(chosen)).order_by(Job.id).populate_existing().all()
+    claimed = [{'id': j.id, 'kind': j.kind, 'user_id': j.user_id, 'payload': j.payload, 'attempt': j.attempts}
+               for j in jobs]
+    db.session.commit()
+    return claimed
+
+def _leased(job_id: int, worker_id: str, attempt: int) -> Job:
+    """The job row, locked, if this worker still holds the attempt's lease"""
+    job = db.session.get(Job, job_id, with_for_update=True, populate_existing=True)
+    if job is None or (job.status, job.locked_by, job.attempts) != ('running', worker_id, attempt):
+        db.session.rollback()
+        raise LeaseLost(f"Job {job_id} attempt {attempt} is no longer held by {worker_id}")
+    return job
+
+def renew(worker_id: str, leases: List[Tuple[int, int]], now: Optional[datetime] = None) -> int:
+    """
+    Extend this worker's leases on running jobs (commits)
+
+    Args:
+        leases: (job id, attempt) pairs
+
+    Returns:
+        Number of leases still held
+    """
+    if not leases:
+        return 0
+    table = Job.__table__
+    renewed = db.session.execute(
+        update(table)
+        .where(table.c.id == bindparam('job_id'), table.c.attempts == bindparam('attempt'),
+               table.c.status == 'running', table.c.locked_by == worker_id)
+        .values(locked_at=now or datetime.utcnow())
+        .execution_options(synchronize_session=False),
+        [{'job_id': job_id, 'attempt': attempt} for job_id, attempt in leases]
+    ).rowcount
+    db.session.commit()
+    return renewed
+
+def finish(job_id: int, result, worker_id: str, attempt: int) -> None:
+    """
+    Record a job's result (commits)
+
+    Raises:
+        LeaseLost: If the attempt's lease expired (the job was requeued or finished elsewhere)
+    """
+    job = _leased(job_id, worker_id, attempt)
+    job.status = 'succeeded'
+    job.result = result
+    job.error = None
+    job.finished_at = datetime.utcnow()
+    job.locked_by = job.locked_at = None
+    db.session.commit()
+
+def fail(job_id: int, error: str, worker_id: str, attempt: int, retry: bool = True,
+         now: Optional[datetime] = None) -> bool:
+    """
+    Record a failed attempt (commits)
+
+    The job is queued again after JOB_RETRY_BACKOFF * 2^(attempts - 1)
+    seconds while it has attempts left and `retry` is set.
+
+    Returns:
+        True if the job will be retried
+
+    Raises:
+        LeaseLost: If the attempt's lease expired (the job was requeued or finished elsewhere)
+    """
+    now = now or datetime.utcnow()
+    job = _leased(job_id, worker_id, attempt)
+    job.error = error
+    job.locked_by = job.locked_at = None
+    retried = retry and job.attempts < job.max_attempts
+    if retried:
+        job.status = 'queued'
+        job.run_after = now + timedelta(seconds=current_app.config['JOB_RETRY_BACKOFF'] * 2 ** (job.attempts - 1))
+    else:
+        job.status = 'failed'
+        job.finished_at = now
+    db.session.commit()
+    return retried
+
+def requeue_stale(timeout: float, now: Optional[datetime] = None) -> int:
+    """
+    Return jobs whose lease wasn't renewed for `timeout` seconds to the queue (commits)
+
+    Their attempt was already counted, so jobs out of attempts fail instead.
+
+    Returns:
+        Number of jobs requeued or failed
+    """
+    now = now or datetime.utcnow()
+    table = Job.__table__
+    stale = (table.c.status == 'running') & (table.c.locked_at < now - timedelta(seconds=timeout))
+    released = {'locked_by': None, 'locked_at': None}
+    failed = db.session.execute(
+        update(table).where(stale, table.c.attempts >= table.c.max_attempts)
+        .values(status='failed', error='Worker lost', finished_at=now, **released)
+    ).rowcount
+    requeued = db.session.execute(
+        update(table).where(stale).values(status='queued', run_after=now, **released)
+    ).rowcount
+    db.session.commit()
+    return failed + requeued
+
+# App of the current pool process, built once by init_process
+_process_app = None
+
+def init_process(config: Optional[Dict] = None) -> None:
+    """Process pool initializer: build this process's app (its own engine and pool)"""
+    global _process_app
+    from app import create_app
+    _process_app = create_app(config)
+
+def execute(kind: str, user_id: Optional[int], payload: Dict):
+    """Run one job's handler in the current (pool) process"""
+    with _process_app.app_context():
+        try:
+            return HANDLERS[kind](user_id, payload)
+        finally:
+            db.session.rollback()
+
+class Worker:
+    """
+    Claims jobs and runs them on an executor until stopped
+
+    Args:
+        executor: Pool the handlers run on (a ProcessPoolExecutor initialized
+            with init_process in production)
+        slots: Jobs run at the same time (normally the pool size)
+        worker_id: Recorded on claimed jobs (default host:pid)
+    """
+
+    def __init__(self, executor, slots: int, worker_id: Optional[str] = None,
+                 poll_interval: Optional[float] = None, log: Callable = logger.info):
+        config = current_app.config
+        self.executor = executor
+        self.slots = slots
+        self.worker_id = worker_id or f"{os.uname().nodename}:{os.getpid()}"
+        self.per_user_limit = config['JOB_USER_CONCURRENCY']
+        self.timeout = config['JOB_TIMEOUT']
+        self.poll_interval = config['JOB_POLL_INTERVAL'] if poll_interval is None else poll_interval
+        # Leases are renewed well before another worker would consider them stale
+        self.renew_interval = self.timeout / 4
+        self.log = log
+        self.processed = 0
+
+    def run(self, once: bool = False) -> int:
+        """
+        Process jobs (inside an app context)
+
+        Args:
+            once: Return when nothing is runnable or running instead of polling forever
+
+        Returns:
+            Number of jobs finished (succeeded or failed) by this call
+        """
+        running = {}
+        requeue_stale(self.timeout)
+        renewed_at = time.monotonic()
+        while True:
+            if len(running) < self.slots:
+                for job in claim(self.worker_id, self.slots - len(running), self.per_user_limit):
+                    future = self.executor.submit(execute, job['kind'], job['user_id'], job['payload'])
+                    running[future] = job
+            if not running:
+                if once:
+                    return self.processed
+                time.sleep(self.poll_interval)
+                requeue_stale(self.timeout)
+                continue
+
+            done, _ = wait(list(running), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._complete(running.pop(future), future)
+            if running and time.monotonic() - renewed_at >= self.renew_interval:
+                renew(self.worker_id, [(job['id'], job['attempt']) for job in running.values()])
+                renewed_at = time.monotonic()
+
+    def _complete(self, job: Dict, future) -> None:
+        try:
+            self._record(job, future)
+        except LeaseLost:
+            # Requeued after its lease expired, so another attempt owns the job now
+            self.log(f"Job {job['id']} ({job['kind']}) attempt {job['attempt']} lost its lease; result dropped")
+
+    def _record(self, job: Dict, future) -> None:
+        error = future.exception()
+        if error is None:
+            finish(job['id'], future.result(), self.worker_id, job['attempt'])
+            self.processed += 1
+            self.log(f"Job {job['id']} ({job['kind']}) succeeded")
+            return
+        if isinstance(error, JobFailed):
+            message, retry = str(error), False
+        else:
+            message, retry = ''.join(traceback.format_exception_only(type(error), error)).strip(), True
+        if fail(job['id'], message, self.worker_id, job['attempt'], retry):
+            self.log(f"Job {job['id']} ({job['kind']}) failed, will retry: {message}")
+        else:
+            self.processed += 1
+            self.log(f"Job {job['id']} ({job['kind']}) failed: {message}")
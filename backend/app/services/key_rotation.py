@@ -0,0 +1,256 @@
+"""
+Online rotation of the AES encryption key
+
+Ciphertexts carry the id of the key they were written with (see
+app.utils.encryption), so after a new key becomes current (with the old one
+in AES_PREVIOUS_KEYS) the app reads old and new values alike and writes only
+new ones. rotate() then re-encrypts the remaining old values in the
+background:
+
+- Tables are walked in primary-key order, one chunk per short transaction.
+  Reads take no locks, decryption and re-encryption run on a process pool
+  outside any transaction, and each value is written back with
+  UPDATE ... WHERE id = :id AND column = :old, so a value the app changed in
+  the meantime (already under the new key) is left alone.
+- Progress is stored per table in key_rotation_checkpoints in the same
+  transaction as each chunk's updates; an interrupted run resumes after the
+  last committed chunk.
+- Rows are read at no more than `rows_per_second`, to bound the extra load
+  on the database.
+
+verify() counts values still under other keys; once it reports none, the
+old key can be removed from AES_PREVIOUS_KEYS.
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import bindparam, select
+from app import db
+from app.models import KeyRotationCheckpoint
+from app.utils.encryption import (
+    current_key_id, decrypt_many, decrypt_records, encrypt_many, encrypt_records, record_key_id, text_key_id,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Encrypted columns per table: 'text' values come from encrypt_data /
+# encrypt_many, 'record' values from encrypt_records. Tables are rotated in
+# this order.
+ROTATED_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    'portfolios': [('total_value_encrypted', 'text')],
+    'assets': [('holding_encrypted', 'record'), ('quantity_encrypted', 'text'),
+               ('price_encrypted', 'text'), ('value_encrypted', 'text')],
+    'portfolio_snapshots': [('value_encrypted', 'text')],
+    'portfolio_value_buckets': [('ohlc_encrypted', 'record')],
+    'jobs': [('payload_encrypted', 'text'), ('result_encrypted', 'text')],
+}
+
+def key_id_of(kind: str, value) -> Optional[int]:
+    """Key id of a stored value (None for an empty or malformed one)"""
+    if not value:
+        return None
+    try:
+        return record_key_id(value) if kind == 'record' else text_key_id(value)
+    except ValueError:
+        return None
+
+def _reencrypt_values(kind: str, values: List) -> List:
+    """Re-encrypt values under the current key (None for values that can't be decrypted)"""
+    decrypt, encrypt = (decrypt_records, encrypt_records) if kind == 'record' else (decrypt_many, encrypt_many)
+    try:
+        return encrypt(decrypt(values))
+    except ValueError:
+        # One bad value fails the whole batch: retry one by one and skip the bad ones
+        results = []
+        for value in values:
+            try:
+                results.append(encrypt(decrypt([value]))[0])
+            except ValueError:
+                results.append(None)
+        return results
+
+def reencrypt(kinds: Sequence[str], rows: List[Tuple]) -> List[Tuple]:
+    """
+    Re-encrypt every value of the rows not under the current key
+
+    Runs in pool processes, which inherit the key environment variables.
+
+    Args:
+        kinds: 'text' or 'record' for each encrypted column
+        rows: (id, value, ...) tuples, values in `kinds` order
+
+    Returns:
+        (id, column index, old value, new value) for each value to write;
+        new value is None when the old one could not be decrypted
+    """
+    current = current_key_id()
+    changes = []
+    for index, kind in enumerate(kinds):
+        stale = [(row[0], row[index + 1]) for row in rows
+                 if row[index + 1] and key_id_of(kind, row[index + 1]) != current]
+        if stale:
+            fresh = _reencrypt_values(kind, [value for _, value in stale])
+            changes.extend((row_id, index, old, new) for (row_id, old), new in zip(stale, fresh))
+    return changes
+
+class RateLimiter:
+    """Sleeps so that work is done at no more than `rate` units per second (0: unlimited)"""
+
+    def __init__(self, rate: float, clock: Callable = time.monotonic, sleep: Callable = time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.next_at = None
+
+    def wait(self, units: int) -> None:
+        """Account for `units` of work just done, sleeping if ahead of the rate"""
+        if not self.rate:
+            return
+        now = self.clock()
+        self.next_at = max(self.next_at or now, now) + units / self.rate
+        if self.next_at > now:
+            self.sleep(self.next_at - now)
+
+def _read_chunk(table, columns, after_id: int, chunk_size: int) -> List[Tuple]:
+    rows = db.session.execute(
+        select(table.c.id, *columns).where(table.c.id > after_id).order_by(table.c.id).limit(chunk_size)
+    ).all()
+    # PostgreSQL returns bytea as memoryview, which can't be pickled to the pool
+    return [tuple(bytes(v) if isinstance(v, memoryview) else v for v in row) for row in rows]
+
+def _checkpoint(key_id: int, table_name: str) -> KeyRotationCheckpoint:
+    checkpoint = db.session.get(KeyRotationCheckpoint, (key_id, table_name))
+    if checkpoint is None:
+        checkpoint = KeyRotationCheckpoint(key_id=key_id, table_name=table_name, last_id=0, rows_rotated=0)
+        db.session.add(checkpoint)
+    return checkpoint
+
+def rotate_table(table_name: str, chunk_size: int = DEFAULT_CHUNK_SIZE, executor=None, workers: int = 1,
+                 limiter: Optional[RateLimiter] = None, restart: bool = False,
+                 max_chunks: Optional[int] = None, log: Callable = logger.info) -> Dict:
+    """
+    Re-encrypt a table's values under the current key, resuming from its checkpoint
+
+    Args:
+        executor: Pool running reencrypt (inline when None)
+        workers: Sub-batches each chunk is split into for the executor
+        restart: Walk the table from the start, even if it was finished
+        max_chunks: Stop after this many chunks (the checkpoint keeps the position)
+
+    Returns:
+        {'table', 'scanned', 'rotated', 'unreadable', 'finished'}
+    """
+    table = db.metadata.tables[table_name]
+    names, kinds = zip(*ROTATED_COLUMNS[table_name])
+    columns = [table.c[name] for name in names]
+    statements = [
+        table.update().where(table.c.id == bindparam('row_id'), column == bindparam('old'))
+        .values({column.name: bindparam('new')})
+        for column in columns
+    ]
+    key_id = current_key_id()
+    limiter = limiter or RateLimiter(0)
+
+    checkpoint = _checkpoint(key_id, table_name)
+    if restart:
+        checkpoint.last_id, checkpoint.rows_rotated, checkpoint.finished_at = 0, 0, None
+    report = {'table': table_name, 'scanned': 0, 'rotated': 0, 'unreadable': 0, 'finished': False}
+    if checkpoint.finished_at is not None:
+        db.session.commit()
+        report['finished'] = True
+        return report
+    after_id = checkpoint.last_id
+    db.session.commit()
+
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        rows = _read_chunk(table, columns, after_id, chunk_size)
+        # End the read transaction before the (slow) crypto work
+        db.session.commit()
+        if not rows:
+            checkpoint = _checkpoint(key_id, table_name)
+            checkpoint.finished_at = checkpoint.updated_at = datetime.utcnow()
+            db.session.commit()
+            report['finished'] = True
+            break
+
+        if executor is None or workers <= 1:
+            changes = reencrypt(kinds, rows)
+        else:
+            size = -(-len(rows) // workers)
+            batches = [rows[n:n + size] for n in range(0, len(rows), size)]
+            changes = [c for batch in executor.map(reencrypt, [kinds] * len(batches), batches) for c in batch]
+
+        for index, statement in enumerate(statements):
+            params = [{'row_id': row_id, 'old': old, 'new': new}
+                      for row_id, i, old, new in changes if i == index and new is not None]
+            if params:
+                db.session.execute(statement, params)
+        rotated = sum(1 for change in changes if change[3] is not None)
+
+        after_id = rows[-1][0]
+        checkpoint = _checkpoint(key_id, table_name)
+        checkpoint.last_id = after_id
+        checkpoint.rows_rotated += rotated
+        checkpoint.updated_at = datetime.utcnow()
+        db.session.commit()
+
+        chunks += 1
+        report['scanned'] += len(rows)
+        report['rotated'] += rotated
+        report['unreadable'] += len(changes) - rotated
+        log(f"{table_name}: rotated {report['rotated']} value(s) up to id {after_id}")
+        limiter.wait(len(rows))
+    return report
+
+def rotate(tables: Optional[Sequence[str]] = None, chunk_size: int = DEFAULT_CHUNK_SIZE, executor=None,
+           workers: int = 1, rows_per_second: float = 0, restart: bool = False,
+           log: Callable = logger.info) -> List[Dict]:
+    """
+    Re-encrypt every table (or `tables`) under the current key; see rotate_table
+
+    Returns:
+        One report per table
+    """
+    limiter = RateLimiter(rows_per_second)
+    return [rotate_table(name, chunk_size, executor, workers, limiter, restart, log=log)
+            for name in tables or ROTATED_COLUMNS]
+
+def verify(tables: Optional[Sequence[str]] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+           rows_per_second: float = 0) -> Dict[str, Dict[int, int]]:
+    """
+    Count stored values by key id, for values not under the current key
+
+    Values are classified from their headers only (nothing is decrypted);
+    malformed values are counted under key id -1.
+
+    Returns:
+        {table: {key id: number of values}}, empty dicts for rotated tables
+    """
+    current = current_key_id()
+    limiter = RateLimiter(rows_per_second)
+    counts = {}
+    for table_name in tables or ROTATED_COLUMNS:
+        table = db.metadata.tables[table_name]
+        names, kinds = zip(*ROTATED_COLUMNS[table_name])
+        columns = [table.c[name] for name in names]
+        stale, after_id = {}, 0
+        while True:
+            rows = _read_chunk(table, columns, after_id, chunk_size)
+            db.session.commit()
+            if not rows:
+                break
+            for row in rows:
+                for kind, value in zip(kinds, row[1:]):
+                    if value:
+                        key_id = key_id_of(kind, value)
+                        key_id = -1 if key_id is None else key_id
+                        if key_id != current:
+                            stale[key_id] = stale.get(key_id, 0) + 1
+            after_id = rows[-1][0]
+            limiter.wait(len(rows))
+        counts[table_name] = stale
+    return counts
@@ -0,0 +1,226 @@
+"""
+Market quote service
+
+Quotes come from a pluggable QuoteProvider and are shared by every request
+in the process through a TTL/LRU cache. Concurrent cache misses for the
+same symbol wait on a single upstream fetch, and all misses of one call
+are fetched in batched upstream requests.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import urllib.parse
+import urllib.request
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, Iterable, List, Optional
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class QuoteProvider(ABC):
+    """Upstream source of quotes; subclasses implement fetch_quotes"""
+    name = 'base'
+    # Largest number of symbols sent in one upstream request
+    max_batch = 50
+    # Seconds one upstream request may block on the network
+    timeout = 10.0
+
+    @abstractmethod
+    def fetch_quotes(self, symbols: List[str]) -> Dict[str, Dict]:
+        """
+        Fetch quotes for a batch of symbols
+
+        Returns:
+            {symbol: {'symbol', 'price', 'previous_close'}}; unknown symbols are omitted
+        """
+
+class YahooQuoteProvider(QuoteProvider):
+    """Yahoo Finance spark endpoint (no API key, up to 20 symbols per request)"""
+    name = 'yahoo'
+    max_batch = 20
+    url = 'https://query1.finance.yahoo.com/v7/finance/spark'
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+
+    def fetch_quotes(self, symbols):
+        query = urllib.parse.urlencode({'symbols': ','.join(symbols), 'range': '1d', 'interval': '1d'})
+        request = urllib.request.Request(
+            f'{self.url}?{query}',
+            headers={'Accept': 'application/json', 'User-Agent': 'MoneyLab/1.0'}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = json.load(response)
+
+        quotes = {}
+        for result in (data.get('spark') or {}).get('result') or []:
+            responses = result.get('response') or []
+            meta = responses[0].get('meta', {}) if responses else {}
+            price = meta.get('regularMarketPrice') or meta.get('previousClose')
+            if not price:
+                continue
+            symbol = result.get('symbol', '').upper()
+            quotes[symbol] = {
+                'symbol': symbol,
+                'price': float(price),
+                'previous_close': float(meta.get('chartPreviousClose') or meta.get('previousClose') or price),
+            }
+        return quotes
+
+class FakeQuoteProvider(QuoteProvider):
+    """
+    Deterministic offline provider for development and tests
+
+    Prices are derived from a hash of the symbol unless given explicitly.
+    Every upstream call is recorded in `calls`.
+    """
+    name = 'fake'
+
+    def __init__(self, prices: Optional[Dict[str, float]] = None, latency: float = 0.0,
+                 unknown: Iterable[str] = ()):
+        self.prices = {s.upper(): p for s, p in (prices or {}).items()}
+        self.latency = latency
+        self.unknown = {s.upper() for s in unknown}
+        self.calls: List[List[str]] = []
+        self._lock = threading.Lock()
+
+    def fetch_quotes(self, symbols):
+        with self._lock:
+            self.calls.append(list(symbols))
+        if self.latency:
+            time.sleep(self.latency)
+
+        quotes = {}
+        for symbol in symbols:
+            if symbol in self.unknown:
+                continue
+            digest = int(hashlib.sha256(symbol.encode()).hexdigest()[:8], 16)
+            price = self.prices.get(symbol, 10 + digest % 49000 / 100)
+            quotes[symbol] = {
+                'symbol': symbol,
+                'price': float(price),
+                'previous_close': round(price * (1 - ((digest >> 8) % 600 - 300) / 10000), 2),
+            }
+        return quotes
+
+PROVIDERS = {
+    'yahoo': YahooQuoteProvider,
+    'fake': FakeQuoteProvider,
+}
+
+def normalize_symbols(symbols: Iterable[str]) -> List[str]:
+    """Uppercase, strip and de-duplicate symbols, keeping first-seen order"""
+    return list(dict.fromkeys(s.strip().upper() for s in symbols if s and s.strip()))
+
+class QuoteService:
+    """
+    Cached, coalescing front end to a QuoteProvider
+
+    Args:
+        provider: Upstream quote source
+        ttl: Seconds a quote stays fresh
+        max_size: Maximum number of cached symbols
+        negative_ttl: Seconds an unknown symbol is remembered as missing
+        wait_timeout: Seconds to wait per upstream batch on another request's
+            in-flight fetch (twice the provider's timeout by default, since
+            urlopen applies it to each socket operation)
+    """
+
+    def __init__(self, provider: QuoteProvider, ttl: float = 60.0, max_size: int = 5000,
+                 negative_ttl: float = 300.0, wait_timeout: Optional[float] = None):
+        self.provider = provider
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+        self.negative_ttl = negative_ttl
+        self.wait_timeout = wait_timeout if wait_timeout is not None else 2 * provider.timeout
+        self.upstream_requests = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get_quotes(self, symbols: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Get quotes for symbols, fetching only what isn't cached or in flight
+
+        Returns:
+            {symbol: quote or None if the provider doesn't know the symbol};
+            symbols whose fetch failed or timed out are left out
+        """
+        symbols = normalize_symbols(symbols)
+        results = {}
+        waiting: Dict[str, Future] = {}
+        mine: Dict[str, Future] = {}
+        batch_size = max(self.provider.max_batch, 1)
+
+        with self._lock:
+            for symbol in symbols:
+                cached = self.cache.get(symbol)
+                if cached is not None:
+                    results[symbol] = cached.get('quote')
+                elif symbol in self._inflight:
+                    waiting[symbol] = self._inflight[symbol]
+                else:
+                    future = Future()
+                    # Upstream batches the owning fetch runs up to and including this symbol's
+                    future.batches = len(mine) // batch_size + 1
+                    mine[symbol] = self._inflight[symbol] = future
+
+        if mine:
+            self._fetch(mine)
+
+        for symbol, future in {**mine, **waiting}.items():
+            try:
+                results[symbol] = future.result(timeout=self.wait_timeout * future.batches)
+            except FutureTimeout:
+                logger.warning("Timed out waiting for the in-flight quote fetch of %s", symbol)
+            except Exception:
+                logger.warning("Quote fetch failed for %s", symbol)
+
+        return {symbol: results[symbol] for symbol in symbols if symbol in results}
+
+    def _fetch(self, pending: Dict[str, Future]) -> None:
+        """Fetch symbols this call owns in provider-sized batches and resolve their futures"""
+        symbols = list(pending)
+        batch_size = max(self.provider.max_batch, 1)
+        for start in range(0, len(symbols), batch_size):
+            batch = symbols[start:start + batch_size]
+            with self._lock:
+                self.upstream_requests += 1
+            try:
+                quotes = self.provider.fetch_quotes(batch)
+            except Exception as e:
+                with self._lock:
+                    for symbol in batch:
+                        self._inflight.pop(symbol, None)
+                for symbol in batch:
+                    pending[symbol].set_exception(e)
+                continue
+
+            with self._lock:
+                for symbol in batch:
+                    quote = quotes.get(symbol)
+                    # Cache misses too (wrapped, so a None quote is distinguishable)
+                    self.cache.set(symbol, {'quote': quote}, None if quote else self.negative_ttl)
+                    self._inflight.pop(symbol, None)
+            for symbol in batch:
+                pending[symbol].set_result(quotes.get(symbol))
+
+    def stats(self) -> Dict:
+        return {
+            'provider': self.provider.name,
+            'upstream_requests': self.upstream_requests,
+            'in_flight': len(self._inflight),
+            **self.cache.stats(),
+        }
+
+def create_quote_service(config) -> QuoteService:
+    """Build the process-wide quote service from app config"""
+    provider_name = config.get('QUOTE_PROVIDER', 'yahoo')
+    if provider_name not in PROVIDERS:
+        raise ValueError(f"Unknown QUOTE_PROVIDER '{provider_name}'")
+    return QuoteService(
+        PROVIDERS[provider_name](),
+        ttl=float(config.get('QUOTE_CACHE_TTL', 60)),
+        max_size=int(config.get('QUOTE_CACHE_SIZE', 5000)),
+    )
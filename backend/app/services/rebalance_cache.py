@@ -0,0 +1,217 @@
+"""
+Rebalancing result cache
+
+Results of GET /api/portfolio/<id>/rebalance are cached per portfolio,
+tagged with the Portfolio.version they were computed from. A cached result
+is only served while the portfolio's version still matches, so any write
+that bumps the version makes it stale; asset and allocation routes also
+invalidate explicitly so stale entries don't linger.
+
+Backends:
+    memory: per-process LRU with a size bound and TTL
+    sqlite: a local SQLite file shared by every worker process on the host
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+from flask import current_app
+from app.utils.cache import TTLCache
+
+class CacheBackend(ABC):
+    """Key/value store for JSON-serializable entries"""
+    name = 'base'
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict]:
+        """Get an entry (None if absent or expired)"""
+
+    @abstractmethod
+    def set(self, key: str, value: Dict) -> None:
+        """Store an entry"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove an entry if present"""
+
+    @abstractmethod
+    def size(self) -> int:
+        """Number of stored entries"""
+
+class MemoryBackend(CacheBackend):
+    """In-process LRU cache with TTL"""
+    name = 'memory'
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def size(self):
+        return len(self.cache)
+
+class SQLiteBackend(CacheBackend):
+    """
+    Cache in a local SQLite file, shared by all processes on the host
+
+    Entries are stored as JSON with an expiry time; expired rows are ignored
+    on read and purged when the table grows past max_size.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path: str, max_size: int = 10000, ttl: float = 300.0):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections aren't shareable)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), time.time() + self.ttl)
+        )
+        if self.size() > self.max_size:
+            self._evict(conn)
+
+    def _evict(self, conn):
+        """Drop expired rows, then the soonest-expiring rows beyond max_size"""
+        conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+        excess = self.size() - self.max_size
+        if excess > 0:
+            conn.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at LIMIT ?)',
+                (excess,)
+            )
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def size(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+class RebalanceCache:
+    """
+    Version-checked rebalancing results with hit/miss counters
+
+    Args:
+        backend: Where entries are stored
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(portfolio_id: int) -> str:
+        return f'rebalance:{portfolio_id}'
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, portfolio_id: int, version: int) -> Optional[Dict]:
+        """Get the cached result if it was computed from this portfolio version"""
+        try:
+            entry = self.backend.get(self._key(portfolio_id))
+        except sqlite3.Error:
+            entry = None
+        if entry is not None and entry.get('version') == version:
+            self._count('hits')
+            return entry['result']
+        self._count('misses')
+        return None
+
+    def set(self, portfolio_id: int, version: int, result: Dict) -> None:
+        try:
+            self.backend.set(self._key(portfolio_id), {'version': version, 'result': result})
+        except sqlite3.Error:
+            # A busy or broken shared store only costs a recomputation
+            pass
+
+    def invalidate(self, portfolio_id: int) -> None:
+        """Drop the cached result for a portfolio after it was written"""
+        self._count('invalidations')
+        try:
+            self.backend.delete(self._key(portfolio_id))
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        try:
+            size = self.backend.size()
+        except sqlite3.Error:
+            # Reported on /api/health, which must not fail because of the cache
+            size = None
+        return {
+            'backend': self.backend.name,
+            'size': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+BACKENDS = {
+    'memory': lambda config: MemoryBackend(
+        max_size=int(config.get('REBALANCE_CACHE_SIZE', 1024)),
+        ttl=float(config.get('REBALANCE_CACHE_TTL', 300)),
+    ),
+    'sqlite': lambda config: SQLiteBackend(
+        config['REBALANCE_CACHE_PATH'],
+        max_size=int(config.get('REBALANCE_CACHE_SIZE', 1024)),
+        ttl=float(config.get('REBALANCE_CACHE_TTL', 300)),
+    ),
+}
+
+def create_rebalance_cache(config) -> Optional[RebalanceCache]:
+    """Build the rebalancing cache from app config (None when disabled)"""
+    backend_name = config.get('REBALANCE_CACHE_BACKEND', 'memory')
+    if backend_name in ('', 'none'):
+        return None
+    if backend_name not in BACKENDS:
+        raise ValueError(f"Unknown REBALANCE_CACHE_BACKEND '{backend_name}'")
+    return RebalanceCache(BACKENDS[backend_name](config))
+
+def invalidate_rebalancing(portfolio_id: int) -> None:
+    """Drop a portfolio's cached rebalancing result, if caching is enabled"""
+    cache = current_app.extensions.get('rebalance_cache')
+    if cache is not None:
+        cache.invalidate(portfolio_id)
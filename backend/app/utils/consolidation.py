@@ -0,0 +1,66 @@
+"""
+Household view of a user's holdings across all portfolios
+
+consolidate() groups decrypted holdings by symbol in a single pass,
+accumulating per-symbol exposure (with each portfolio's share of it) and
+per-portfolio subtotals together; HHI is then taken over symbol exposures,
+so the same symbol held in several accounts counts as one concentration.
+"""
+from typing import Dict, Iterable, Sequence, Tuple
+
+def consolidate(portfolios: Sequence[Tuple[int, str]], holdings: Iterable[Tuple]) -> Dict:
+    """
+    Aggregate holdings by symbol and by portfolio
+
+    Args:
+        portfolios: (id, name) of every portfolio of the user, including empty ones
+        holdings: (portfolio_id, symbol, name, asset_type, quantity, value) rows
+
+    Returns:
+        {'total_value', 'num_portfolios', 'num_symbols', 'hhi',
+        'diversification_score', 'symbols', 'portfolios'}; symbols are sorted by
+        value (largest first) and portfolios keep the given order
+    """
+    subtotals = {pid: {'portfolio_id': pid, 'name': name, 'value': 0.0, 'num_holdings': 0}
+                 for pid, name in portfolios}
+    symbols = {}
+    for portfolio_id, symbol, name, asset_type, quantity, value in holdings:
+        key = symbol.upper()
+        exposure = symbols.get(key)
+        if exposure is None:
+            exposure = symbols[key] = {
+                'symbol': key, 'name': name or key, 'asset_type': asset_type,
+                'quantity': 0.0, 'value': 0.0, 'portfolios': {},
+            }
+        exposure['quantity'] += quantity
+        exposure['value'] += value
+        share = exposure['portfolios'].get(portfolio_id)
+        if share is None:
+            share = exposure['portfolios'][portfolio_id] = {'portfolio_id': portfolio_id, 'quantity': 0.0, 'value': 0.0}
+        share['quantity'] += quantity
+        share['value'] += value
+
+        subtotal = subtotals[portfolio_id]
+        subtotal['value'] += value
+        subtotal['num_holdings'] += 1
+
+    total = sum(s['value'] for s in subtotals.values())
+    hhi = 0.0
+    for exposure in symbols.values():
+        weight = exposure['value'] / total if total else 0.0
+        exposure['weight'] = weight
+        exposure['portfolios'] = list(exposure['portfolios'].values())
+        hhi += weight ** 2
+    for subtotal in subtotals.values():
+        subtotal['weight'] = subtotal['value'] / total if total else 0.0
+
+    return {
+        'total_value': total,
+        'num_portfolios': len(subtotals),
+        'num_symbols': len(symbols),
+        'hhi': hhi,
+        # Same scale as calculate_portfolio_metrics: 1 - HHI, 0 for an empty household
+        'diversification_score': round(1 - hhi, 3) if symbols and total else 0,
+        'symbols': sorted(symbols.values(), key=lambda s: -s['value']),
+        'portfolios': list(subtotals.values()),
+    }
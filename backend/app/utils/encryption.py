@@ -1,69 +1,370 @@
 """
 AES Encryption utilities for sensitive data
+
+Ciphertexts protect confidentiality and (for packed records) integrity of
+the bytes themselves, but are not bound to the row that stores them: a
+record's HMAC covers its header, nonce and ciphertext only, so a value
+copied from one assets row to another (even in another portfolio) still
+authenticates. Holdings are encrypted before their row or portfolio id is
+known (new assets, imports, restores), so binding them is left to access
+control on the rows rather than to the ciphertext.
 """
 import base64
+import hashlib
+import hmac
+import struct
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import pad, unpad
+from Crypto.Util.strxor import strxor
 import os
+from app.utils.metrics import crypto_timed
+
+BLOCK_SIZE = AES.block_size
+
+# Packed record format (see encrypt_records):
+#   header (1) | nonce (12) | AES-CTR ciphertext of little-endian doubles | HMAC tag (16)
+# The header is RECORD_VERSION under key id 0 and RECORD_KEYED | key id under
+# keys 1-127, so records written before key ids existed still read as key 0.
+RECORD_VERSION = 1
+RECORD_KEYED = 0x80
+MAX_KEY_ID = 0x7f
+# Text ciphertexts under key ids above 0 are "k<id>:" + base64 (base64 never contains ':')
+TEXT_KEY_PREFIX = 'k'
+RECORD_NONCE_SIZE = 12
+RECORD_TAG_SIZE = 16
+RECORD_OVERHEAD = 1 + RECORD_NONCE_SIZE + RECORD_TAG_SIZE
 
 def get_encryption_key():
     """Get the encryption key from environment variables"""
     key = os.environ.get('AES_ENCRYPTION_KEY')
     if not key:
         raise ValueError("AES_ENCRYPTION_KEY not found in environment variables")
-    return base64.b64decode(key)
+    return _decode_key(key)
+
+@lru_cache(maxsize=8)
+def _decode_key(encoded_key: str) -> bytes:
+    """Base64-decode key material once per process (per distinct key)"""
+    return base64.b64decode(encoded_key)
+
+def current_key_id() -> int:
+    """
+    Id of AES_ENCRYPTION_KEY, from AES_ENCRYPTION_KEY_ID (default 0)
+
+    New ciphertexts are tagged with this id; rotating the key means giving
+    the new key the next id and moving the old one to AES_PREVIOUS_KEYS.
+    """
+    return _parse_key_id(os.environ.get('AES_ENCRYPTION_KEY_ID', '0'))
+
+@lru_cache(maxsize=8)
+def _parse_key_id(value: str) -> int:
+    key_id = int(value)
+    if not 0 <= key_id <= MAX_KEY_ID:
+        raise ValueError(f"Encryption key ids must be between 0 and {MAX_KEY_ID}")
+    return key_id
+
+def get_key(key_id: int) -> bytes:
+    """
+    Get the key for a key id: the current key or one of AES_PREVIOUS_KEYS
+
+    AES_PREVIOUS_KEYS lists retired keys still needed for decryption as
+    comma-separated "id:base64key" pairs.
+
+    Raises:
+        ValueError: If no key with the id is configured
+    """
+    if key_id == current_key_id():
+        return get_encryption_key()
+    key = _parse_previous_keys(os.environ.get('AES_PREVIOUS_KEYS', '')).get(key_id)
+    if key is None:
+        raise ValueError(f"Encryption key {key_id} not found in AES_PREVIOUS_KEYS")
+    return key
+
+@lru_cache(maxsize=8)
+def _parse_previous_keys(spec: str) -> Dict[int, bytes]:
+    keys = {}
+    for entry in filter(None, (e.strip() for e in spec.split(','))):
+        key_id, sep, key = entry.partition(':')
+        if not sep:
+            raise ValueError("AES_PREVIOUS_KEYS entries must look like id:base64key")
+        keys[_parse_key_id(key_id)] = _decode_key(key)
+    return keys
+
+def _split_text(value: str) -> Tuple[int, str]:
+    """Key id and base64 body of a text ciphertext"""
+    head, sep, body = value.partition(':')
+    if not sep:
+        return 0, value
+    if not head.startswith(TEXT_KEY_PREFIX) or not head[1:].isdigit():
+        raise ValueError("Malformed encrypted value")
+    return int(head[1:]), body
+
+def text_key_id(value: str) -> int:
+    """Id of the key a text ciphertext (encrypt_data / encrypt_many) was written with"""
+    return _split_text(value)[0]
+
+def record_key_id(blob: bytes) -> int:
+    """Id of the key a packed record (encrypt_records) was written with"""
+    header = blob[0]
+    if header == RECORD_VERSION:
+        return 0
+    if header & RECORD_KEYED:
+        return header & MAX_KEY_ID
+    raise ValueError("Malformed encrypted record")
+
+@lru_cache(maxsize=8)
+def _block_cipher(key: bytes):
+    """
+    Raw AES block cipher for a key, built once per process.
+
+    CBC chaining is done by hand on top of this so the key schedule is not
+    recomputed for every value, and whole batches go through a single call.
+    """
+    return AES.new(key, AES.MODE_ECB)
+
+@lru_cache(maxsize=8)
+def _record_keys(key: bytes) -> Tuple[bytes, bytes]:
+    """Derive independent encryption and MAC keys for packed records"""
+    return (
+        hmac.digest(key, b'moneylab:record:enc', hashlib.sha256),
+        hmac.digest(key, b'moneylab:record:mac', hashlib.sha256),
+    )
 
 def encrypt_data(data: str) -> str:
     """
     Encrypt sensitive data using AES encryption
-    
+
     Args:
         data: String data to encrypt
-        
+
     Returns:
         Base64 encoded encrypted string
     """
     if not data:
         return data
-    
-    key = get_encryption_key()
-    cipher = AES.new(key, AES.MODE_CBC)
-    iv = cipher.iv
-    
-    # Pad the data to be a multiple of 16 bytes
-    padded_data = pad(data.encode('utf-8'), AES.block_size)
-    
-    # Encrypt
-    encrypted = cipher.encrypt(padded_data)
-    
-    # Combine IV and encrypted data, then encode to base64
-    encrypted_with_iv = iv + encrypted
-    return base64.b64encode(encrypted_with_iv).decode('utf-8')
+
+    return encrypt_many([data])[0]
 
 def decrypt_data(encrypted_data: str) -> str:
     """
     Decrypt AES encrypted data
-    
+
     Args:
         encrypted_data: Base64 encoded encrypted string
-        
+
     Returns:
         Decrypted string
     """
     if not encrypted_data:
         return encrypted_data
-    
-    key = get_encryption_key()
-    
-    # Decode from base64
-    encrypted_with_iv = base64.b64decode(encrypted_data)
-    
-    # Extract IV and encrypted data
-    iv = encrypted_with_iv[:16]
-    encrypted = encrypted_with_iv[16:]
-    
-    # Decrypt
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    decrypted = unpad(cipher.decrypt(encrypted), AES.block_size)
-    
-    return decrypted.decode('utf-8')
+
+    return decrypt_many([encrypted_data])[0]
+
+@crypto_timed('encrypt_text')
+def encrypt_many(values: Iterable[Optional[str]]) -> List[Optional[str]]:
+    """
+    Encrypt a batch of strings with AES-CBC
+
+    Produces exactly the same format as encrypt_data (base64 of IV + ciphertext,
+    prefixed with "k<id>:" unless the current key id is 0), but every value is
+    encrypted with one cached cipher and one block-cipher call per block
+    position instead of one cipher setup per value.
+
+    Args:
+        values: Strings to encrypt; empty values are passed through unchanged
+
+    Returns:
+        List of base64 encoded encrypted strings, in input order
+    """
+    values = list(values)
+    indexes = [i for i, v in enumerate(values) if v]
+    results = list(values)
+    if not indexes:
+        return results
+
+    key_id = current_key_id()
+    prefix = f'{TEXT_KEY_PREFIX}{key_id}:' if key_id else ''
+    cipher = _block_cipher(get_encryption_key())
+    padded = [pad(values[i].encode('utf-8'), BLOCK_SIZE) for i in indexes]
+    ivs = get_random_bytes(BLOCK_SIZE * len(padded))
+
+    # CBC: C[j] = E(P[j] XOR C[j-1]) with C[-1] = IV. Messages are chained
+    # independently, so block j of every message is encrypted in one call.
+    previous = [ivs[k * BLOCK_SIZE:(k + 1) * BLOCK_SIZE] for k in range(len(padded))]
+    chunks = [[iv] for iv in previous]
+    position = 0
+    active = list(range(len(padded)))
+    while active:
+        mixed = strxor(
+            b''.join(padded[k][position:position + BLOCK_SIZE] for k in active),
+            b''.join(previous[k] for k in active)
+        )
+        encrypted = cipher.encrypt(mixed)
+        for n, k in enumerate(active):
+            block = encrypted[n * BLOCK_SIZE:(n + 1) * BLOCK_SIZE]
+            previous[k] = block
+            chunks[k].append(block)
+        position += BLOCK_SIZE
+        active = [k for k in active if len(padded[k]) > position]
+
+    for k, i in enumerate(indexes):
+        results[i] = prefix + base64.b64encode(b''.join(chunks[k])).decode('utf-8')
+    return results
+
+@crypto_timed('decrypt_text')
+def decrypt_many(values: Iterable[Optional[str]]) -> List[Optional[str]]:
+    """
+    Decrypt a batch of AES encrypted strings
+
+    All ciphertext blocks written with the same key are decrypted with a
+    single call to that key's cached block cipher and un-chained with one XOR
+    over the whole buffer.
+
+    Args:
+        values: Base64 encoded encrypted strings; empty values are passed through
+
+    Returns:
+        List of decrypted strings, in input order
+
+    Raises:
+        ValueError: If any value is not a well-formed ciphertext for its key,
+            or its key is not configured
+    """
+    values = list(values)
+    results = list(values)
+    by_key = defaultdict(list)
+    for i, value in enumerate(values):
+        if value:
+            key_id, body = _split_text(value)
+            by_key[key_id].append((i, base64.b64decode(body)))
+
+    for key_id, group in by_key.items():
+        for _, blob in group:
+            if len(blob) < 2 * BLOCK_SIZE or len(blob) % BLOCK_SIZE:
+                raise ValueError("Ciphertext is not a whole number of AES blocks")
+
+        cipher = _block_cipher(get_key(key_id))
+
+        # P[j] = D(C[j]) XOR C[j-1]: the "previous block" stream is each blob minus
+        # its last block, aligned with the blob minus its IV.
+        decrypted = strxor(
+            cipher.decrypt(b''.join(blob[BLOCK_SIZE:] for _, blob in group)),
+            b''.join(blob[:-BLOCK_SIZE] for _, blob in group)
+        )
+
+        offset = 0
+        for i, blob in group:
+            length = len(blob) - BLOCK_SIZE
+            results[i] = unpad(decrypted[offset:offset + length], BLOCK_SIZE).decode('utf-8')
+            offset += length
+    return results
+
+def _keystream(cipher, nonces: Sequence[bytes], lengths: Sequence[int]) -> bytes:
+    """AES-CTR keystream for many records, generated with one block-cipher call"""
+    counters = []
+    for nonce, length in zip(nonces, lengths):
+        blocks = -(-length // BLOCK_SIZE)
+        counters.extend(nonce + struct.pack('>I', n) for n in range(blocks))
+    stream = cipher.encrypt(b''.join(counters))
+
+    # Trim each record's keystream to its exact length
+    parts, offset = [], 0
+    for length in lengths:
+        parts.append(stream[offset:offset + length])
+        offset += -(-length // BLOCK_SIZE) * BLOCK_SIZE
+    return b''.join(parts)
+
+@crypto_timed('encrypt_record')
+def encrypt_records(records: Iterable[Optional[Sequence[float]]]) -> List[Optional[bytes]]:
+    """
+    Encrypt numeric records into compact authenticated ciphertexts
+
+    Each record (e.g. quantity, price, value) is packed as little-endian
+    doubles and encrypted with AES-CTR, then authenticated with a truncated
+    HMAC-SHA256 (encrypt-then-MAC). Keystreams for the whole batch come from a
+    single call to the cached block cipher. The tag detects tampering with a
+    record, not a record moved to another row (see the module docstring).
+
+    Args:
+        records: Sequences of floats; None entries are passed through
+
+    Returns:
+        List of binary ciphertexts, in input order
+    """
+    records = list(records)
+    indexes = [i for i, r in enumerate(records) if r is not None]
+    results: List[Optional[bytes]] = [None] * len(records)
+    if not indexes:
+        return results
+
+    key_id = current_key_id()
+    enc_key, mac_key = _record_keys(get_encryption_key())
+    plain = [struct.pack(f'<{len(records[i])}d', *records[i]) for i in indexes]
+    nonces = [get_random_bytes(RECORD_NONCE_SIZE) for _ in indexes]
+    lengths = [len(p) for p in plain]
+    encrypted = strxor(b''.join(plain), _keystream(_block_cipher(enc_key), nonces, lengths))
+
+    header = bytes([RECORD_KEYED | key_id if key_id else RECORD_VERSION])
+    offset = 0
+    for i, nonce, length in zip(indexes, nonces, lengths):
+        body = header + nonce + encrypted[offset:offset + length]
+        tag = hmac.digest(mac_key, body, hashlib.sha256)[:RECORD_TAG_SIZE]
+        results[i] = body + tag
+        offset += length
+    return results
+
+@crypto_timed('decrypt_record')
+def decrypt_records(blobs: Iterable[Optional[bytes]]) -> List[Optional[Tuple[float, ...]]]:
+    """
+    Verify and decrypt packed records produced by encrypt_records
+
+    Args:
+        blobs: Binary ciphertexts; empty values are passed through as None
+
+    Returns:
+        List of float tuples, in input order
+
+    Raises:
+        ValueError: If a record is malformed, fails authentication or its key
+            is not configured
+    """
+    blobs = list(blobs)
+    results: List[Optional[Tuple[float, ...]]] = [None] * len(blobs)
+    by_key = defaultdict(list)
+    for i, blob in enumerate(blobs):
+        if blob:
+            blob = bytes(blob)
+            length = len(blob) - RECORD_OVERHEAD
+            if length < 0 or length % 8:
+                raise ValueError("Malformed encrypted record")
+            by_key[record_key_id(blob)].append((i, blob))
+
+    for key_id, group in by_key.items():
+        enc_key, mac_key = _record_keys(get_key(key_id))
+        nonces, bodies = [], []
+        for _, blob in group:
+            body, tag = blob[:-RECORD_TAG_SIZE], blob[-RECORD_TAG_SIZE:]
+            if not hmac.compare_digest(hmac.digest(mac_key, body, hashlib.sha256)[:RECORD_TAG_SIZE], tag):
+                raise ValueError("Encrypted record failed authentication")
+            nonces.append(body[1:1 + RECORD_NONCE_SIZE])
+            bodies.append(body[1 + RECORD_NONCE_SIZE:])
+
+        lengths = [len(b) for b in bodies]
+        plain = strxor(b''.join(bodies), _keystream(_block_cipher(enc_key), nonces, lengths))
+
+        offset = 0
+        for (i, _), length in zip(group, lengths):
+            results[i] = struct.unpack(f'<{length // 8}d', plain[offset:offset + length])
+            offset += length
+    return results
+
+def encrypt_record(values: Sequence[float]) -> bytes:
+    """Encrypt a single numeric record (see encrypt_records)"""
+    return encrypt_records([values])[0]
+
+def decrypt_record(blob: bytes) -> Optional[Tuple[float, ...]]:
+    """Decrypt a single numeric record (see decrypt_records)"""
+    return decrypt_records([blob])[0]
@@ -0,0 +1,54 @@
+"""
+Conditional GET support for portfolio resources
+
+ETags are derived from Portfolio.version, which every write to a portfolio,
+its assets or its allocations increments. A request whose If-None-Match
+still matches is answered 304 after a single-row version lookup, before
+anything is loaded, decrypted or serialized.
+"""
+import hashlib
+from typing import Optional
+from flask import Response, request
+from app.models.portfolio import Portfolio
+
+def portfolio_etag(kind: str, portfolio_id: int, version: int, query_string: Optional[bytes] = None) -> str:
+    """
+    Strong ETag for one representation of a portfolio resource
+
+    The query string is part of the ETag, since e.g. a page or stream of
+    assets is a different representation from the full list. It defaults to
+    the current request's.
+    """
+    if query_string is None:
+        query_string = request.query_string
+    tag = f'{kind}-{portfolio_id}-v{version}'
+    if query_string:
+        tag += '-' + hashlib.sha256(query_string).hexdigest()[:12]
+    return tag
+
+def not_modified(kind: str, portfolio_id: int, user_id: int) -> Optional[Response]:
+    """
+    Answer If-None-Match for a user's portfolio resource
+
+    Only requests carrying If-None-Match pay for the version lookup; others
+    take their ETag from the version loaded with the data.
+
+    Returns:
+        A 304 response if the client's copy is current, otherwise None (also
+        when the portfolio isn't found, so the handler reports the 404)
+    """
+    if not request.if_none_match:
+        return None
+    version = Portfolio.version_for_user(portfolio_id, user_id)
+    if version is None:
+        return None
+    etag = portfolio_etag(kind, portfolio_id, version)
+    if request.if_none_match.contains(etag):
+        return with_etag(Response(status=304), etag)
+    return None
+
+def with_etag(response: Response, etag: str) -> Response:
+    """Attach an ETag; clients must revalidate before reusing the cached body"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,176 @@
+"""
+Streaming bulk import of holdings from CSV or NDJSON
+"""
+import csv
+import io
+import json
+import math
+from typing import Dict, Iterator, Optional, Tuple
+from app import db
+from app.models.portfolio import Asset, bump_versions
+from app.utils.encryption import encrypt_records
+
+# Column names accepted from brokerage exports, mapped to asset fields
+FIELD_ALIASES = {
+    'symbol': 'symbol',
+    'ticker': 'symbol',
+    'name': 'name',
+    'description': 'name',
+    'asset_type': 'asset_type',
+    'type': 'asset_type',
+    'quantity': 'quantity',
+    'shares': 'quantity',
+    'price': 'price',
+    'value': 'value',
+    'market_value': 'value',
+}
+
+MAX_REPORTED_ERRORS = 1000
+
+def _normalize_key(key) -> Optional[str]:
+    if not isinstance(key, str):
+        return None
+    return FIELD_ALIASES.get(key.strip().lower().replace(' ', '_'))
+
+def normalize_symbol(symbol) -> str:
+    """Canonical form of a ticker on every write path (stripped, uppercase, as quotes are looked up)"""
+    return str(symbol).strip().upper()
+
+def _number(raw, field) -> float:
+    if raw is None or raw == '':
+        return 0.0
+    if isinstance(raw, bool):
+        raise ValueError(f"{field} must be a number")
+    if isinstance(raw, str):
+        raw = raw.strip().replace(',', '').lstrip('$')
+    try:
+        number = float(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number")
+    if not math.isfinite(number):
+        raise ValueError(f"{field} must be a finite number")
+    return number
+
+def iter_rows(stream, fmt: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    Parse an uploaded file row by row without reading it into memory
+
+    Args:
+        stream: Binary stream of the request body
+        fmt: 'csv' or 'ndjson'
+
+    Yields:
+        (row number, raw row dict or None, parse error or None)
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        # Row 1 is the header, so data rows start at 2
+        for number, row in enumerate(csv.DictReader(text), start=2):
+            yield number, row, None
+        return
+
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, None, f"Invalid JSON: {e.msg}"
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "Each line must be a JSON object"
+            continue
+        yield number, row, None
+
+def validate_row(row: Dict) -> Dict:
+    """
+    Normalize one raw row into asset fields
+
+    Raises:
+        ValueError: With a user-facing message if the row is invalid
+    """
+    fields = {}
+    for key, raw in row.items():
+        field = _normalize_key(key)
+        if field:
+            fields[field] = raw
+
+    symbol = normalize_symbol(fields.get('symbol') or '')
+    if not symbol:
+        raise ValueError("Symbol is required")
+    if len(symbol) > 20:
+        raise ValueError("Symbol must be at most 20 characters")
+
+    quantity = _number(fields.get('quantity'), 'quantity')
+    price = _number(fields.get('price'), 'price')
+    if fields.get('value') in (None, ''):
+        value = quantity * price
+    else:
+        value = _number(fields.get('value'), 'value')
+
+    return {
+        'symbol': symbol,
+        'name': str(fields.get('name') or symbol)[:255],
+        'asset_type': str(fields.get('asset_type') or 'stock')[:50],
+        'quantity': quantity,
+        'price': price,
+        'value': value,
+    }
+
+def import_holdings(portfolio, rows, batch_size: int = 500) -> Dict:
+    """
+    Insert validated rows into a portfolio in batches
+
+    Rows are encrypted a batch at a time and written with bulk inserts; the
+    caller owns the transaction (nothing is committed here) and memory use is
+    bounded by batch_size plus the capped error report.
+
+    Args:
+        portfolio: Portfolio receiving the holdings (should be row-locked)
+        rows: Iterable from iter_rows
+        batch_size: Rows encrypted and inserted per statement
+
+    Returns:
+        Report with imported/failed counts, imported value and row errors
+    """
+    report = {'imported': 0, 'failed': 0, 'imported_value': 0.0, 'errors': [], 'errors_truncated': False}
+    batch = []
+
+    def flush():
+        records = encrypt_records((r['quantity'], r['price'], r['value']) for r in batch)
+        db.session.bulk_insert_mappings(Asset, [
+            {
+                'portfolio_id': portfolio.id,
+                'symbol': r['symbol'],
+                'name': r['name'],
+                'asset_type': r['asset_type'],
+                '_holding_encrypted': record,
+            }
+            for r, record in zip(batch, records)
+        ])
+        report['imported'] += len(batch)
+        report['imported_value'] += sum(r['value'] for r in batch)
+        batch.clear()
+
+    for number, row, error in rows:
+        if error is None:
+            try:
+                batch.append(validate_row(row))
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            report['failed'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'row': number, 'error': error})
+            else:
+                report['errors_truncated'] = True
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    portfolio.apply_value_delta(0.0, report['imported_value'])
+    if report['imported']:
+        # Bulk inserts bypass the flush that bumps versions (the total may not have changed)
+        bump_versions(db.session, {portfolio.id})
+    return report
@@ -0,0 +1,49 @@
+"""
+Sampled logging for hot paths
+
+Messages logged on every request (e.g. rejected tokens from a misbehaving
+client) are passed through at most once per `every` calls of the same
+message template. Arguments use logging's lazy %-style formatting, so
+dropped and disabled records are never formatted.
+"""
+import logging
+import threading
+from typing import Dict
+
+class SampledLogger:
+    """
+    Wraps a logger, emitting one in every `every` records per message
+
+    Args:
+        logger: Logger to emit through
+        every: Keep the 1st, (every+1)th, ... call of each message template
+    """
+
+    def __init__(self, logger: logging.Logger, every: int = 100):
+        self.logger = logger
+        self.every = max(1, int(every))
+        self._calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _sample(self, msg: str) -> bool:
+        with self._lock:
+            calls = self._calls.get(msg, 0)
+            self._calls[msg] = calls + 1
+        return calls % self.every == 0
+
+    def log(self, level: int, msg: str, *args, **kwargs) -> None:
+        if self.logger.isEnabledFor(level) and self._sample(msg):
+            kwargs.setdefault('stacklevel', 3)
+            self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, msg: str, *args, **kwargs) -> None:
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg: str, *args, **kwargs) -> None:
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg: str, *args, **kwargs) -> None:
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg: str, *args, **kwargs) -> None:
+        self.log(logging.ERROR, msg, *args, **kwargs)
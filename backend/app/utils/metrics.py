@@ -0,0 +1,192 @@
+"""
+In-process metrics in the Prometheus text exposition format
+
+A small registry of counters and histograms, kept per worker process and
+rendered by GET /api/metrics. init_metrics(app) adds per-route request
+latency; SQL statements (via query_stats) and encryption calls record into
+the module-level metrics below from wherever they run.
+"""
+import bisect
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, List, Sequence, Tuple
+from flask import Response, current_app, g, request
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    """Monotonically increasing value per label set"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_labels(self.label_names, k)} {_number(v)}' for k, v in items]
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._series.items())
+        lines = []
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                rendered = _labels(self.label_names, labels, 'le="%s"' % le)
+                lines.append(f'{self.name}_bucket{rendered} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {total!r}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}')
+        return lines
+
+class Registry:
+    """Named metrics plus callbacks that report gauges at scrape time"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]]] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def gauge(self, name: str, documentation: str, collect: Callable[[], Dict]) -> None:
+        """Register a gauge whose {((label, value), ...): number} samples are read at scrape time"""
+        self._gauges[name] = (documentation, collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        for name, (documentation, collect) in self._gauges.items():
+            try:
+                samples = collect()
+            except Exception:
+                continue
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in sorted(samples.items()):
+                rendered = _labels([k for k, _ in labels], [v for _, v in labels])
+                lines.append(f'{name}{rendered} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'moneylab_http_request_duration_seconds', 'Time spent handling requests',
+    labels=('method', 'route', 'status'),
+))
+SQL_STATEMENTS = REGISTRY.register(Counter(
+    'moneylab_sql_statements_total', 'SQL statements executed',
+))
+SQL_DURATION = REGISTRY.register(Histogram(
+    'moneylab_sql_statement_duration_seconds', 'SQL statement execution time',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+))
+CRYPTO_CALLS = REGISTRY.register(Counter(
+    'moneylab_crypto_calls_total', 'Encryption and decryption calls', labels=('operation',),
+))
+CRYPTO_VALUES = REGISTRY.register(Counter(
+    'moneylab_crypto_values_total', 'Values encrypted or decrypted', labels=('operation',),
+))
+CRYPTO_SECONDS = REGISTRY.register(Counter(
+    'moneylab_crypto_seconds_total', 'Time spent encrypting or decrypting', labels=('operation',),
+))
+
+def crypto_timed(operation: str):
+    """Count calls, values and time of a batch encryption function"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(values, *args, **kwargs):
+            started = time.perf_counter()
+            result = fn(values, *args, **kwargs)
+            CRYPTO_SECONDS.inc(time.perf_counter() - started, operation)
+            CRYPTO_CALLS.inc(1, operation)
+            CRYPTO_VALUES.inc(sum(r is not None for r in result), operation)
+            return result
+        return wrapper
+    return decorator
+
+def init_metrics(app):
+    """Time every request by route and serve the registry on /api/metrics"""
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('METRICS_TOKEN', None)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            REQUEST_DURATION.observe(
+                time.perf_counter() - started, request.method, route, str(response.status_code)
+            )
+        return response
+
+    @app.route('/api/metrics')
+    def metrics():
+        if not current_app.config['METRICS_ENABLED']:
+            return {'error': 'Not found'}, 404
+        token = current_app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return {'error': 'Unauthorized'}, 401
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
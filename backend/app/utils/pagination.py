@@ -0,0 +1,127 @@
+"""
+Keyset pagination and streaming for list endpoints
+
+List endpoints return their full result by default. With ?limit (and
+optionally ?after=<id>) they return one page ordered by id; the cursor for
+the next page is sent in the X-Next-Cursor header, so the body keeps the
+same shape as the unpaginated response. With ?stream=json or ?stream=ndjson
+the whole result is written progressively from a server-side cursor,
+decrypting and serializing one chunk at a time.
+"""
+import json
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from flask import Response, jsonify, stream_with_context
+from app import db
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+def page_args(args) -> Optional[Tuple[int, int]]:
+    """
+    Parse ?after and ?limit
+
+    Returns:
+        (after_id, limit), or None if the request didn't ask for a page
+
+    Raises:
+        ValueError: If either value isn't a valid integer
+    """
+    if 'limit' not in args and 'after' not in args:
+        return None
+    try:
+        after = int(args.get('after') or 0)
+        limit = int(args.get('limit') or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        raise ValueError('after and limit must be integers')
+    if after < 0 or limit < 1:
+        raise ValueError('after must be >= 0 and limit >= 1')
+    return after, min(limit, MAX_PAGE_SIZE)
+
+def stream_format(args) -> Optional[str]:
+    """
+    Get the requested ?stream format, or None when not streaming
+
+    Raises:
+        ValueError: If the format isn't supported
+    """
+    fmt = args.get('stream')
+    if not fmt:
+        return None
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"stream must be one of {', '.join(STREAM_FORMATS)}")
+    return fmt
+
+def keyset_page(statement, id_column, after: int, limit: int) -> Tuple[List, Optional[int]]:
+    """
+    Fetch one page of ORM rows with id greater than `after`
+
+    One extra row is read to know whether another page exists.
+
+    Returns:
+        (rows, next cursor or None on the last page)
+    """
+    rows = db.session.execute(
+        statement.where(id_column > after).order_by(id_column).limit(limit + 1)
+    ).scalars().all()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+def page_response(items: List[Dict], next_cursor: Optional[int]) -> Response:
+    """JSON list response carrying the next-page cursor in a header"""
+    response = jsonify(items)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
+
+def _chunks(statement, id_column, serialize: Callable[[List], List[Dict]],
+            chunk_size: int) -> Iterator[List[Dict]]:
+    """Serialize rows chunk by chunk from a server-side cursor, releasing each chunk"""
+    result = db.session.execute(
+        statement.order_by(id_column).execution_options(yield_per=chunk_size)
+    ).scalars()
+    try:
+        for rows in result.partitions():
+            items = serialize(rows)
+            # Drop the chunk from the identity map so memory stays flat
+            for row in rows:
+                db.session.expunge(row)
+            yield items
+    finally:
+        result.close()
+
+def stream_response(statement, id_column, serialize: Callable[[List], List[Dict]], fmt: str,
+                    chunk_size: Optional[int] = None) -> Response:
+    """
+    Stream all rows of a select as a JSON array or NDJSON
+
+    Args:
+        statement: ORM select of a single entity
+        id_column: Column to order by
+        serialize: Converts a chunk of rows to dictionaries (e.g. Asset.bulk_to_dict)
+        fmt: 'json' or 'ndjson'
+        chunk_size: Rows fetched, decrypted and written per chunk (default STREAM_CHUNK_SIZE)
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+
+    def generate():
+        if fmt == 'ndjson':
+            for items in _chunks(statement, id_column, serialize, chunk_size):
+                yield ''.join(json.dumps(item) + '\n' for item in items)
+            return
+
+        yield '['
+        first = True
+        for items in _chunks(statement, id_column, serialize, chunk_size):
+            if items:
+                yield ('' if first else ',') + ','.join(json.dumps(item) for item in items)
+                first = False
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[fmt])
@@ -0,0 +1,142 @@
+"""
+Database connection pool configuration, warmup and readiness
+
+Each worker process gets its own SQLAlchemy pool, sized from DB_POOL_SIZE
+and DB_MAX_OVERFLOW (serve.py derives these from the worker thread count
+and an optional DB_MAX_CONNECTIONS budget). Connections are pre-pinged on
+checkout and recycled after DB_POOL_RECYCLE seconds so restarts and idle
+timeouts on the database side don't surface as request errors.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+def engine_options(config) -> Dict:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the configured database
+
+    In-memory SQLite shares one static connection, so only pre-ping is
+    applied there.
+    """
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    uri = config.get('SQLALCHEMY_DATABASE_URI')
+    if not uri:
+        return options
+    url = make_url(uri)
+    if not (url.drivername.startswith('sqlite') and url.database in (None, '', ':memory:')):
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+        )
+    return options
+
+def pool_status(engine) -> Dict:
+    """
+    Connection counts of an engine's pool
+
+    saturation is the share of the pool's capacity (size + overflow) that is
+    checked out; pools without a fixed size report only their class.
+    """
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if not hasattr(pool, 'checkedout'):
+        return status
+    size = pool.size()
+    capacity = size + max(pool._max_overflow, 0)
+    checked_out = pool.checkedout()
+    status.update(
+        size=size,
+        max_overflow=pool._max_overflow,
+        checked_out=checked_out,
+        idle=pool.checkedin(),
+        overflow=max(pool.overflow(), 0),
+        saturation=round(checked_out / capacity, 4) if capacity else 1.0,
+    )
+    return status
+
+def warm_up(app) -> Dict:
+    """
+    Prepare a worker before it accepts traffic
+
+    Opens the pool's connections (concurrently, so each is a distinct
+    connection), decodes the encryption key and builds the cached ciphers,
+    and resolves the URL map so the first requests don't pay for it.
+
+    Returns:
+        What was warmed and how long it took, also logged
+    """
+    from app import db
+    from app.utils.encryption import decrypt_many, encrypt_many
+
+    started = time.perf_counter()
+    with app.app_context():
+        engine = db.engine
+        connections = getattr(engine.pool, 'size', lambda: 1)() or 1
+
+        def ping(_):
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+                # Hold the connection until every worker thread has one
+                time.sleep(0.01)
+
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            list(pool.map(ping, range(connections)))
+
+        decrypt_many(encrypt_many(['0.0']))
+        app.url_map.bind('localhost').match('/api/health')
+
+    app.extensions['warmed_up'] = True
+    report = {'connections': connections, 'seconds': round(time.perf_counter() - started, 3)}
+    logger.info("Worker warmed up: %d connections in %.3fs", report['connections'], report['seconds'])
+    return report
+
+def init_pool_health(app):
+    """Register the readiness check and pool gauges"""
+    from app import db
+    from app.utils.metrics import REGISTRY
+
+    @app.route('/api/health/ready')
+    def readiness_check():
+        """
+        Readiness: the database answers and the pool isn't saturated
+
+        Returns 503 while the worker can't take more traffic, so a load
+        balancer can route around it without restarting it.
+        """
+        status = pool_status(db.engine)
+        status['warmed_up'] = app.extensions.get('warmed_up', False)
+        saturated = status.get('saturation', 0.0) >= app.config['DB_POOL_SATURATION_LIMIT']
+        if saturated:
+            # Don't queue behind the requests holding the pool
+            database = 'not checked'
+        else:
+            try:
+                with db.engine.connect() as conn:
+                    conn.execute(text('SELECT 1'))
+                database = 'ok'
+            except Exception as e:
+                logger.warning("Readiness check failed to reach the database: %s", e)
+                database = 'unavailable'
+        ready = database == 'ok'
+        return {
+            'status': 'ready' if ready else 'unavailable',
+            'database': database,
+            'pool': status,
+        }, 200 if ready else 503
+
+    def pool_gauge():
+        with app.app_context():
+            status = pool_status(db.engine)
+        return {
+            (('state', state),): status[state]
+            for state in ('checked_out', 'idle', 'overflow') if state in status
+        }
+
+    REGISTRY.gauge('moneylab_db_pool_connections', 'Database pool connections by state', pool_gauge)
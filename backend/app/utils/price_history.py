@@ -0,0 +1,215 @@
+"""
+Memory-mapped columnar price history store
+
+Each symbol's daily closes live in two append-only column files:
+<SYMBOL>.dates (int32 days since 1970-01-01) and <SYMBOL>.closes (float64).
+Columns are read through np.memmap, so only the pages a query touches are
+loaded and the OS page cache is shared across worker processes. Dates are
+strictly increasing; appending a date at or before the last stored one is
+ignored, which makes re-running an ingest idempotent.
+"""
+import os
+import re
+import threading
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+DATE_DTYPE = np.dtype('<i4')
+CLOSE_DTYPE = np.dtype('<f8')
+
+_EPOCH = date(1970, 1, 1)
+_SYMBOL_PATTERN = re.compile(r'^[A-Z0-9.\-^=]{1,20}$')
+
+def to_day(value) -> int:
+    """Convert a date or ISO date string to days since the epoch"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return (value - _EPOCH).days
+
+def from_days(days: np.ndarray) -> List[str]:
+    """Convert days since the epoch to ISO date strings"""
+    return np.datetime_as_string(np.asarray(days, dtype='datetime64[D]'), unit='D').tolist()
+
+class PriceHistoryStore:
+    """
+    Per-symbol append-only price files under one directory
+
+    Args:
+        root: Directory holding <SYMBOL>.dates and <SYMBOL>.closes per symbol
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        # symbol -> (record count when mapped, dates memmap, closes memmap)
+        self._maps: Dict[str, Tuple[int, np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, symbol: str, column: str) -> str:
+        symbol = symbol.upper()
+        if not _SYMBOL_PATTERN.match(symbol):
+            raise ValueError(f"Invalid symbol '{symbol}'")
+        return os.path.join(self.root, f'{symbol}.{column}')
+
+    def symbols(self) -> List[str]:
+        """List symbols with stored history"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[:-len('.dates')] for name in os.listdir(self.root) if name.endswith('.dates'))
+
+    def load(self, symbol: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Get a symbol's full history as read-only (dates, closes) arrays
+
+        Mappings are reused until the files grow. Returns None if the symbol
+        has no history.
+        """
+        dates_path, closes_path = self._path(symbol, 'dates'), self._path(symbol, 'closes')
+        try:
+            # Closes are written before dates, so a record counts once its date exists
+            count = min(os.path.getsize(dates_path) // DATE_DTYPE.itemsize,
+                        os.path.getsize(closes_path) // CLOSE_DTYPE.itemsize)
+        except OSError:
+            return None
+        if count == 0:
+            return None
+
+        key = symbol.upper()
+        with self._lock:
+            cached = self._maps.get(key)
+            if cached is None or cached[0] != count:
+                cached = (
+                    count,
+                    np.memmap(dates_path, dtype=DATE_DTYPE, mode='r', shape=(count,)),
+                    np.memmap(closes_path, dtype=CLOSE_DTYPE, mode='r', shape=(count,)),
+                )
+                self._maps[key] = cached
+            return cached[1], cached[2]
+
+    def append(self, symbol: str, days: Sequence[int], closes: Sequence[float]) -> int:
+        """
+        Append closes for a symbol
+
+        Input is sorted and de-duplicated by date (last close wins); dates at
+        or before the last stored date are skipped.
+
+        Returns:
+            Number of records written
+        """
+        days = np.asarray(days, dtype=np.int32)
+        closes = np.asarray(closes, dtype=float)
+        if len(days) == 0:
+            return 0
+
+        # Keep the last close for each date, in date order
+        order = np.argsort(days, kind='stable')
+        days, closes = days[order], closes[order]
+        last_of_day = np.append(days[1:] != days[:-1], True)
+        days, closes = days[last_of_day], closes[last_of_day]
+
+        existing = self.load(symbol)
+        if existing is not None:
+            keep = days > existing[0][-1]
+            days, closes = days[keep], closes[keep]
+        keep = np.isfinite(closes) & (closes > 0)
+        days, closes = days[keep], closes[keep]
+        if len(days) == 0:
+            return 0
+
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._path(symbol, 'closes'), 'ab') as f:
+            f.write(closes.astype(CLOSE_DTYPE).tobytes())
+        with open(self._path(symbol, 'dates'), 'ab') as f:
+            f.write(days.astype(DATE_DTYPE).tobytes())
+        return len(days)
+
+    def value_series(self, quantities: Dict[str, float], start: Optional[int] = None,
+                     end: Optional[int] = None) -> Dict:
+        """
+        Value a fixed set of holdings over time
+
+        The calendar is the union of trading dates of the held symbols within
+        [start, end]. Each symbol's close is carried forward over dates it has
+        no record for; before its first record it contributes nothing.
+
+        Args:
+            quantities: {symbol: quantity}
+            start, end: Inclusive bounds in days since the epoch
+
+        Returns:
+            Dict with 'days' and 'values' arrays, and 'missing' symbols with no
+            history (including symbols that aren't valid store names)
+        """
+        histories = {}
+        missing = []
+        for symbol in quantities:
+            try:
+                columns = self.load(symbol)
+            except ValueError:
+                # Asset symbols aren't validated, so a name the store can't hold just has no history
+                columns = None
+            if columns is None:
+                missing.append(symbol)
+            else:
+                histories[symbol] = columns
+
+        # Slice each history to the window (plus one prior record to carry forward)
+        windows = []
+        for symbol, (dates, closes) in histories.items():
+            lo = 0 if start is None else max(int(np.searchsorted(dates, start)) - 1, 0)
+            hi = len(dates) if end is None else int(np.searchsorted(dates, end, side='right'))
+            if hi > lo:
+                windows.append((quantities[symbol], dates[lo:hi], closes[lo:hi]))
+        if not windows:
+            return {'days': np.empty(0, dtype=np.int32), 'values': np.empty(0), 'missing': missing}
+
+        # Every symbol's value is a step function: quantity x close changes only on
+        # the symbol's own dates. Scatter those steps onto the calendar with one
+        # bincount and integrate with cumsum, so no symbol or day is looped over.
+        lengths = np.array([len(dates) for _, dates, _ in windows])
+        dates = np.concatenate([dates for _, dates, _ in windows])
+        closes = np.concatenate([closes for _, _, closes in windows])
+        steps = closes.copy()
+        steps[1:] -= closes[:-1]
+        starts = np.cumsum(lengths) - lengths
+        steps[starts] = closes[starts]
+        steps *= np.repeat([quantity for quantity, _, _ in windows], lengths)
+
+        # Calendar = union of dates within [start, end], built from a day bitmap
+        first = int(dates.min()) if start is None else max(int(dates.min()), start)
+        last = int(dates.max()) if end is None else min(int(dates.max()), end)
+        if last < first:
+            return {'days': np.empty(0, dtype=np.int32), 'values': np.empty(0), 'missing': missing}
+        offsets = dates - first
+        trading = np.zeros(last - first + 1, dtype=bool)
+        trading[offsets[offsets >= 0]] = True
+        calendar = (np.flatnonzero(trading) + first).astype(np.int32)
+        if len(calendar) == 0:
+            return {'days': calendar, 'values': np.empty(0), 'missing': missing}
+
+        # Records before start (carried forward) land on the first calendar slot
+        slots = np.maximum(np.cumsum(trading) - 1, 0)
+        values = np.cumsum(np.bincount(slots[np.maximum(offsets, 0)], weights=steps, minlength=len(calendar)))
+
+        return {'days': calendar, 'values': values, 'missing': missing}
+
+def ingest_rows(store: PriceHistoryStore, rows: Iterable[Dict], default_symbol: Optional[str] = None) -> Dict[str, int]:
+    """
+    Append parsed price rows to the store
+
+    Args:
+        rows: Dicts with 'date', 'close' and (unless default_symbol is given) 'symbol'
+
+    Returns:
+        {symbol: records written}
+    """
+    columns: Dict[str, Tuple[List[int], List[float]]] = {}
+    for row in rows:
+        symbol = (row.get('symbol') or default_symbol or '').strip().upper()
+        if not symbol or not row.get('date') or row.get('close') in (None, ''):
+            continue
+        days, closes = columns.setdefault(symbol, ([], []))
+        days.append(to_day(row['date']))
+        closes.append(float(row['close']))
+
+    return {symbol: store.append(symbol, days, closes) for symbol, (days, closes) in columns.items()}
@@ -0,0 +1,78 @@
+"""
+Per-request SQL statement counting and timing
+
+Every statement executed through SQLAlchemy is counted against the active
+QueryStats (one per request, or one per track_queries() block). With
+SQL_DEBUG_HEADERS enabled (set from the environment variable of the same
+name, on by default when FLASK_ENV=development) each response carries
+X-SQL-Query-Count and X-SQL-Query-Time-Ms so N+1 patterns are easy to spot.
+Process-wide totals are also exported on /api/metrics (see app.utils.metrics).
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.utils.metrics import SQL_DURATION, SQL_STATEMENTS
+
+class QueryStats:
+    """Running count and total duration of SQL statements"""
+    __slots__ = ('count', 'duration')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __repr__(self):
+        return f'<QueryStats {self.count} statements in {self.duration * 1000:.1f}ms>'
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar('query_stats', default=None)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    SQL_STATEMENTS.inc()
+    SQL_DURATION.observe(elapsed)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+
+@contextmanager
+def track_queries():
+    """Count SQL statements executed inside the block"""
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+def init_query_stats(app):
+    """Track statements per request and optionally report them in response headers"""
+    app.config.setdefault('SQL_DEBUG_HEADERS', app.debug)
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats()
+        g.query_stats_token = _current_stats.set(g.query_stats)
+
+    @app.after_request
+    def add_query_stats_headers(response):
+        stats = g.get('query_stats')
+        if stats is not None and app.config['SQL_DEBUG_HEADERS']:
+            response.headers['X-SQL-Query-Count'] = str(stats.count)
+            response.headers['X-SQL-Query-Time-Ms'] = f'{stats.duration * 1000:.2f}'
+        return response
+
+    @app.teardown_request
+    def end_query_stats(exc):
+        token = g.pop('query_stats_token', None)
+        if token is not None:
+            _current_stats.reset(token)
@@ -2,6 +2,14 @@
 Portfolio rebalancing calculation utilities
 """
 from typing import List, Dict
+from app.utils.rebalancing_engine import rebalance_many
+
+def _single(holdings: List[Dict], targets: List[Dict], total_value: float) -> Dict:
+    return rebalance_many([{
+        'holdings': holdings,
+        'targets': targets,
+        'total_value': total_value,
+    }])[0]
 
 def calculate_rebalancing(
     current_holdings: List[Dict],
@@ -19,28 +27,12 @@ def calculate_rebalancing(
     Returns:
         List of rebalancing recommendations with buy/sell amounts
     """
-    # Create dictionaries for easier lookup
-    current_dict = {holding['symbol']: holding['value'] for holding in current_holdings}
-    target_dict = {alloc['symbol']: alloc['target_percentage'] / 100 for alloc in target_allocations}
-    
-    recommendations = []
-    
-    for symbol, target_pct in target_dict.items():
-        current_value = current_dict.get(symbol, 0)
-        target_value = total_value * target_pct
-        difference = target_value - current_value
-        
-        recommendations.append({
-            'symbol': symbol,
-            'current_value': current_value,
-            'target_value': target_value,
-            'current_percentage': (current_value / total_value * 100) if total_value > 0 else 0,
-            'target_percentage': target_pct * 100,
-            'difference': difference,
-            'action': 'BUY' if difference > 0 else 'SELL' if difference < 0 else 'HOLD'
-        })
+    # One target per symbol (the last one given wins), in first-seen order
+    targets = {}
+    for alloc in target_allocations:
+        targets[alloc['symbol']] = alloc
     
-    return recommendations
+    return _single(current_holdings, list(targets.values()), total_value)['recommendations']
 
 def calculate_portfolio_metrics(holdings: List[Dict], total_value: float) -> Dict:
     """
@@ -53,25 +45,5 @@ def calculate_portfolio_metrics(holdings: List[Dict], total_value: float) -> Dic
     Returns:
         Dictionary with portfolio metrics
     """
-    if total_value == 0:
-        return {
-            'total_value': 0,
-            'num_holdings': 0,
-            'largest_holding': None,
-            'diversification_score': 0
-        }
-    
-    # Calculate diversification (inverse of concentration)
-    # Using Herfindahl-Hirschman Index (HHI)
-    percentages = [h['value'] / total_value for h in holdings]
-    hhi = sum(p ** 2 for p in percentages)
-    diversification_score = 1 - hhi  # Normalized to 0-1
-    
-    largest = max(holdings, key=lambda x: x['value']) if holdings else None
-    
-    return {
-        'total_value': total_value,
-        'num_holdings': len(holdings),
-        'largest_holding': largest['symbol'] if largest else None,
-        'diversification_score': round(diversification_score, 3)
-    }
+    # Diversification is 1 - Herfindahl-Hirschman Index (HHI), normalized to 0-1
+    return _single(holdings, [], total_value)['metrics']
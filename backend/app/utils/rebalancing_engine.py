@@ -0,0 +1,199 @@
+"""
+Vectorized rebalancing engine for many portfolios at once
+
+Holdings and targets for any number of portfolios are passed as aligned
+NumPy arrays (one row per holding / per target, tagged with a portfolio
+index and an integer symbol code) and processed in a single pass with no
+per-portfolio Python loops. calculate_rebalancing and
+calculate_portfolio_metrics in app.utils.rebalancing wrap this engine for
+the single-portfolio list-of-dicts interface.
+"""
+from typing import Dict, List, Sequence
+import numpy as np
+
+def encode_portfolios(portfolios: Sequence[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Flatten list-of-dicts portfolios into the engine's aligned arrays
+
+    Args:
+        portfolios: Each with 'holdings' ([{'symbol', 'value'}]), 'targets'
+            ([{'symbol', 'target_percentage'}]) and 'total_value'
+
+    Returns:
+        Keyword arguments for rebalance_batch
+    """
+    holding_symbols = [h['symbol'] for p in portfolios for h in p['holdings']]
+    target_symbols = [t['symbol'] for p in portfolios for t in p['targets']]
+    _, codes = np.unique(np.array(holding_symbols + target_symbols, dtype=object), return_inverse=True)
+
+    return {
+        'holding_portfolio': np.repeat(
+            np.arange(len(portfolios)), [len(p['holdings']) for p in portfolios]
+        ),
+        'holding_symbol': codes[:len(holding_symbols)],
+        'holding_value': np.array(
+            [h['value'] for p in portfolios for h in p['holdings']], dtype=float
+        ),
+        'target_portfolio': np.repeat(
+            np.arange(len(portfolios)), [len(p['targets']) for p in portfolios]
+        ),
+        'target_symbol': codes[len(holding_symbols):],
+        'target_percentage': np.array(
+            [t['target_percentage'] for p in portfolios for t in p['targets']], dtype=float
+        ),
+        'total_value': np.array([p['total_value'] for p in portfolios], dtype=float),
+    }
+
+def rebalance_batch(
+    holding_portfolio: np.ndarray,
+    holding_symbol: np.ndarray,
+    holding_value: np.ndarray,
+    target_portfolio: np.ndarray,
+    target_symbol: np.ndarray,
+    target_percentage: np.ndarray,
+    total_value: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    Compute drift, trades and concentration metrics for many portfolios
+
+    Holding values for the same (portfolio, symbol) are summed. All arrays
+    prefixed holding_ / target_ must be aligned row-wise; total_value has one
+    entry per portfolio.
+
+    Returns:
+        Per target row: 'current_value', 'target_value', 'current_percentage',
+        'target_percentage', 'difference', 'action' (1 buy, -1 sell, 0 hold).
+        Per portfolio: 'num_holdings', 'largest_holding' (holding row index or
+        -1), 'hhi' and 'diversification_score'.
+    """
+    holding_portfolio = np.asarray(holding_portfolio, dtype=np.int64)
+    holding_symbol = np.asarray(holding_symbol, dtype=np.int64)
+    holding_value = np.asarray(holding_value, dtype=float)
+    target_portfolio = np.asarray(target_portfolio, dtype=np.int64)
+    target_symbol = np.asarray(target_symbol, dtype=np.int64)
+    total_value = np.asarray(total_value, dtype=float)
+    n_portfolios = len(total_value)
+    n_symbols = int(max(
+        holding_symbol.max(initial=-1), target_symbol.max(initial=-1)
+    )) + 1
+
+    # Aggregate holdings by (portfolio, symbol) key, then look up each target's key
+    holding_keys = holding_portfolio * n_symbols + holding_symbol
+    unique_keys, inverse = np.unique(holding_keys, return_inverse=True)
+    key_values = np.bincount(inverse, weights=holding_value, minlength=len(unique_keys))
+
+    target_keys = target_portfolio * n_symbols + target_symbol
+    current_value = np.zeros(len(target_keys))
+    if len(unique_keys):
+        position = np.minimum(np.searchsorted(unique_keys, target_keys), len(unique_keys) - 1)
+        found = unique_keys[position] == target_keys
+        current_value[found] = key_values[position[found]]
+
+    target_total = total_value[target_portfolio]
+    target_fraction = np.asarray(target_percentage, dtype=float) / 100
+    target_value = target_total * target_fraction
+    difference = target_value - current_value
+    with np.errstate(divide='ignore', invalid='ignore'):
+        current_percentage = np.where(target_total > 0, current_value / target_total * 100, 0.0)
+
+        # Herfindahl-Hirschman Index over holding rows
+        holding_total = total_value[holding_portfolio]
+        shares = np.where(holding_total != 0, holding_value / holding_total, 0.0)
+    hhi = np.bincount(holding_portfolio, weights=shares ** 2, minlength=n_portfolios)
+    num_holdings = np.bincount(holding_portfolio, minlength=n_portfolios)
+
+    # Largest holding per portfolio: first row with the maximum value
+    order = np.lexsort((np.arange(len(holding_value)), -holding_value, holding_portfolio))
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = holding_portfolio[order][1:] != holding_portfolio[order][:-1]
+    largest_holding = np.full(n_portfolios, -1)
+    largest_holding[holding_portfolio[order][is_first]] = order[is_first]
+
+    return {
+        'current_value': current_value,
+        'target_value': target_value,
+        'current_percentage': current_percentage,
+        'target_percentage': target_fraction * 100,
+        'difference': difference,
+        'action': np.sign(difference).astype(int),
+        'num_holdings': num_holdings,
+        'largest_holding': largest_holding,
+        'hhi': hhi,
+        'diversification_score': np.round(1 - hhi, 3),
+    }
+
+_ACTIONS = {1: 'BUY', -1: 'SELL', 0: 'HOLD'}
+
+def recommendations_for(result: Dict[str, np.ndarray], target_symbols: Sequence[str], rows) -> List[Dict]:
+    """Build the list-of-dicts recommendation format for a slice of target rows"""
+    columns = {
+        name: result[name][rows].tolist()
+        for name in ('current_value', 'target_value', 'current_percentage',
+                     'target_percentage', 'difference', 'action')
+    }
+    return [
+        {
+            'symbol': symbol,
+            'current_value': current_value,
+            'target_value': target_value,
+            'current_percentage': current_percentage,
+            'target_percentage': target_percentage,
+            'difference': difference,
+            'action': _ACTIONS[action],
+        }
+        for symbol, current_value, target_value, current_percentage, target_percentage, difference, action
+        in zip(target_symbols, columns['current_value'], columns['target_value'],
+               columns['current_percentage'], columns['target_percentage'],
+               columns['difference'], columns['action'])
+    ]
+
+def metrics_for(result: Dict[str, np.ndarray], portfolio: int, total_value: float,
+                holding_symbols: Sequence[str]) -> Dict:
+    """
+    Build the calculate_portfolio_metrics format for one portfolio of a batch
+
+    holding_symbols is indexed by holding row across the whole batch.
+    """
+    if total_value == 0:
+        return {
+            'total_value': 0,
+            'num_holdings': 0,
+            'largest_holding': None,
+            'diversification_score': 0
+        }
+    largest = int(result['largest_holding'][portfolio])
+    return {
+        'total_value': total_value,
+        'num_holdings': int(result['num_holdings'][portfolio]),
+        'largest_holding': holding_symbols[largest] if largest >= 0 else None,
+        'diversification_score': float(result['diversification_score'][portfolio])
+    }
+
+def rebalance_many(portfolios: Sequence[Dict]) -> List[Dict]:
+    """
+    Rebalance many list-of-dicts portfolios in one vectorized pass
+
+    Args:
+        portfolios: As for encode_portfolios
+
+    Returns:
+        One {'recommendations', 'metrics'} dict per input portfolio
+    """
+    if not portfolios:
+        return []
+    arrays = encode_portfolios(portfolios)
+    result = rebalance_batch(**arrays)
+
+    holding_symbols = [h['symbol'] for p in portfolios for h in p['holdings']]
+    target_start = np.concatenate(([0], np.cumsum([len(p['targets']) for p in portfolios])))
+
+    output = []
+    for i, portfolio in enumerate(portfolios):
+        rows = slice(target_start[i], target_start[i + 1])
+        output.append({
+            'recommendations': recommendations_for(
+                result, [t['symbol'] for t in portfolio['targets']], rows
+            ),
+            'metrics': metrics_for(result, i, portfolio['total_value'], holding_symbols),
+        })
+    return output
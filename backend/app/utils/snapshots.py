@@ -0,0 +1,227 @@
+"""
+Portfolio value snapshots and pre-aggregated history
+
+Whenever a flush changes a portfolio's total value, a snapshot row is
+written and the portfolio's day, week and month buckets (open/high/low/close)
+are updated in the same transaction. A snapshot is only written when the
+value differs from the portfolio's previous snapshot, so periodic runs of
+snapshot_portfolios.py add rows only for values that changed outside the ORM.
+History queries read the buckets, so charts spanning years decrypt a few
+hundred rows instead of every snapshot.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, delete, event, func, insert, select, update
+from sqlalchemy.orm import Session, attributes
+from app.models.portfolio import Portfolio, _decrypt_floats, _decrypt_records
+from app.models.snapshot import PortfolioSnapshot, PortfolioValueBucket
+from app.utils.encryption import encrypt_many, encrypt_records
+
+PERIODS = ('day', 'week', 'month')
+
+# Values closer than this to the previous snapshot don't count as a change
+VALUE_TOLERANCE = 1e-6
+
+snapshots = PortfolioSnapshot.__table__
+buckets = PortfolioValueBucket.__table__
+
+def bucket_start(at: datetime, period: str) -> date:
+    """First day of the bucket containing `at` (weeks start on Monday)"""
+    day = at.date()
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"Unknown period '{period}'")
+
+def record_values(connection, values: Dict[int, float], at: Optional[datetime] = None) -> int:
+    """
+    Record snapshots for portfolios whose value changed since their last snapshot
+
+    Args:
+        connection: Connection of the transaction doing the write
+        values: {portfolio_id: current total value}
+        at: Snapshot time (default now, UTC)
+
+    Returns:
+        Number of snapshots written
+    """
+    if not values:
+        return 0
+    at = at or datetime.utcnow()
+    portfolio_ids = sorted(values)
+
+    # Serialize writers per portfolio (row locks, in id order) until commit: buckets
+    # are read-modify-write on encrypted OHLC, and two writers of a new bucket
+    # would both insert it. Rows already updated by this flush are locked anyway.
+    connection.execute(
+        select(Portfolio.__table__.c.id).where(Portfolio.__table__.c.id.in_(portfolio_ids))
+        .order_by(Portfolio.__table__.c.id).with_for_update()
+    )
+
+    # Latest snapshot per portfolio in one statement
+    latest_ids = (
+        select(func.max(snapshots.c.id))
+        .where(snapshots.c.portfolio_id.in_(portfolio_ids))
+        .group_by(snapshots.c.portfolio_id)
+    )
+    latest = connection.execute(
+        select(snapshots.c.portfolio_id, snapshots.c.value_encrypted).where(snapshots.c.id.in_(latest_ids))
+    ).all()
+    previous = dict(zip([row.portfolio_id for row in latest],
+                        _decrypt_floats(row.value_encrypted for row in latest)))
+
+    changed = [
+        pid for pid in portfolio_ids
+        if pid not in previous or abs(previous[pid] - values[pid]) > VALUE_TOLERANCE
+    ]
+    if not changed:
+        return 0
+
+    encrypted = encrypt_many(str(float(values[pid])) for pid in changed)
+    connection.execute(insert(snapshots), [
+        {'portfolio_id': pid, 'recorded_at': at, 'value_encrypted': ciphertext}
+        for pid, ciphertext in zip(changed, encrypted)
+    ])
+    _update_buckets(connection, {pid: float(values[pid]) for pid in changed}, at)
+    return len(changed)
+
+def _update_buckets(connection, values: Dict[int, float], at: datetime) -> None:
+    """Fold new values into the day/week/month buckets containing `at`"""
+    starts = {period: bucket_start(at, period) for period in PERIODS}
+    rows = connection.execute(
+        select(buckets.c.id, buckets.c.portfolio_id, buckets.c.period, buckets.c.bucket_start,
+               buckets.c.ohlc_encrypted, buckets.c.snapshot_count)
+        .where(buckets.c.portfolio_id.in_(list(values)))
+        .where(buckets.c.bucket_start.in_(set(starts.values())))
+    ).all()
+    existing = {
+        (row.portfolio_id, row.period): (row, ohlc)
+        for row, ohlc in zip(rows, _decrypt_records(row.ohlc_encrypted for row in rows))
+        if row.bucket_start == starts.get(row.period)
+    }
+
+    updates, updated_ohlc, inserts, inserted_ohlc = [], [], [], []
+    for pid, value in values.items():
+        for period in PERIODS:
+            found = existing.get((pid, period))
+            if found is not None and found[1] is not None:
+                row, (open_, high, low, _) = found
+                updates.append({'bucket_id': row.id, 'count': row.snapshot_count + 1})
+                updated_ohlc.append((open_, max(high, value), min(low, value), value))
+            elif found is not None:
+                # Unreadable bucket: restart it from this value
+                updates.append({'bucket_id': found[0].id, 'count': 1})
+                updated_ohlc.append((value, value, value, value))
+            else:
+                inserts.append({'portfolio_id': pid, 'period': period, 'bucket_start': starts[period]})
+                inserted_ohlc.append((value, value, value, value))
+
+    if updates:
+        for params, blob in zip(updates, encrypt_records(updated_ohlc)):
+            params['ohlc'] = blob
+            params['updated_at'] = at
+        connection.execute(
+            update(buckets)
+            .where(buckets.c.id == bindparam('bucket_id'))
+            .values(ohlc_encrypted=bindparam('ohlc'), snapshot_count=bindparam('count'),
+                    updated_at=bindparam('updated_at')),
+            updates
+        )
+    if inserts:
+        for params, blob in zip(inserts, encrypt_records(inserted_ohlc)):
+            params.update(ohlc_encrypted=blob, snapshot_count=1, updated_at=at)
+        connection.execute(insert(buckets), inserts)
+
+def value_history(portfolio_id: int, period: str = 'day', start: Optional[date] = None,
+                  end: Optional[date] = None, limit: int = 500) -> List[Dict]:
+    """
+    Get a portfolio's pre-aggregated value history
+
+    Args:
+        period: 'day', 'week' or 'month'
+        start, end: Inclusive bounds on bucket start dates
+        limit: Most recent buckets to return
+
+    Returns:
+        Buckets in chronological order with 'start', 'open', 'high', 'low',
+        'close' and 'snapshots'
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+    query = PortfolioValueBucket.query.filter_by(portfolio_id=portfolio_id, period=period)
+    if start is not None:
+        query = query.filter(PortfolioValueBucket.bucket_start >= start)
+    if end is not None:
+        query = query.filter(PortfolioValueBucket.bucket_start <= end)
+    rows = query.order_by(PortfolioValueBucket.bucket_start.desc()).limit(limit).all()[::-1]
+
+    history = []
+    for row, ohlc in zip(rows, _decrypt_records(row._ohlc_encrypted for row in rows)):
+        if ohlc is None:
+            continue
+        open_, high, low, close = ohlc
+        history.append({
+            'start': row.bucket_start.isoformat(),
+            'open': open_,
+            'high': high,
+            'low': low,
+            'close': close,
+            'snapshots': row.snapshot_count,
+        })
+    return history
+
+def snapshot_all(chunk_size: int = 500, log=print) -> int:
+    """
+    Snapshot every portfolio whose value changed since its last snapshot
+
+    Meant to run on a schedule (e.g. nightly cron) to catch totals written
+    outside the ORM. Commits per chunk of portfolios.
+
+    Returns:
+        Number of snapshots written
+    """
+    from app import db
+
+    written = 0
+    last_id = 0
+    while True:
+        portfolios = (
+            Portfolio.query.filter(Portfolio.id > last_id)
+            .order_by(Portfolio.id).limit(chunk_size).all()
+        )
+        if not portfolios:
+            break
+        values = {p.id: d['total_value'] for p, d in zip(portfolios, Portfolio.bulk_to_dict(portfolios))}
+        written += record_values(db.session.connection(), values)
+        db.session.commit()
+        last_id = portfolios[-1].id
+        log(f"Checked portfolios up to id {last_id}: {written} snapshot(s) written")
+    return written
+
+def _snapshots_enabled() -> bool:
+    return not has_app_context() or current_app.config.get('PORTFOLIO_SNAPSHOTS', True)
+
+@event.listens_for(Session, 'after_flush')
+def _snapshot_changed_portfolios(session, flush_context):
+    """Snapshot portfolios whose total value was inserted or changed by this flush"""
+    if not _snapshots_enabled():
+        return
+    values = {}
+    for obj in session.new:
+        if isinstance(obj, Portfolio):
+            values[obj.id] = obj.total_value
+    for obj in session.dirty:
+        if isinstance(obj, Portfolio) and attributes.get_history(obj, '_total_value_encrypted').has_changes():
+            values[obj.id] = obj.total_value
+    if values:
+        record_values(session.connection(), values)
+
+@event.listens_for(Portfolio, 'before_delete')
+def _delete_portfolio_history(mapper, connection, target):
+    """Remove a portfolio's snapshots and buckets before the portfolio row"""
+    connection.execute(delete(snapshots).where(snapshots.c.portfolio_id == target.id))
+    connection.execute(delete(buckets).where(buckets.c.portfolio_id == target.id))
@@ -0,0 +1,73 @@
+"""
+Portfolio total verification and repair
+
+Asset writes keep Portfolio.total_value up to date by applying deltas; this
+module recomputes totals from the holdings in bulk to detect and fix drift
+(e.g. rows written by older code or floating point accumulation).
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional
+from app import db
+from app.models.portfolio import Portfolio, Asset
+
+def compute_totals(portfolio_ids: List[int]) -> Dict[int, float]:
+    """Sum holding values per portfolio with one query and one batch decryption"""
+    assets = Asset.query.filter(Asset.portfolio_id.in_(portfolio_ids)).all()
+    totals = defaultdict(float)
+    for asset, (_, _, value) in zip(assets, Asset.bulk_decrypt(assets)):
+        totals[asset.portfolio_id] += value
+    return {pid: totals.get(pid, 0.0) for pid in portfolio_ids}
+
+def verify_totals(
+    repair: bool = False,
+    tolerance: float = 0.005,
+    chunk_size: int = 500,
+    user_id: Optional[int] = None
+) -> List[Dict]:
+    """
+    Compare stored portfolio totals against the sum of their holdings
+
+    Args:
+        repair: Overwrite drifted totals with the recomputed value
+        tolerance: Absolute difference below which a total counts as correct
+        chunk_size: Portfolios processed (and committed) per batch
+        user_id: Only check this user's portfolios
+
+    Returns:
+        List of drift reports with 'portfolio_id', 'stored', 'actual' and 'drift'
+    """
+    drifted = []
+    last_id = 0
+    while True:
+        query = Portfolio.query.filter(Portfolio.id > last_id)
+        if user_id is not None:
+            query = query.filter(Portfolio.user_id == user_id)
+        query = query.order_by(Portfolio.id).limit(chunk_size)
+        if repair:
+            # Lock so concurrent asset writes don't apply deltas to a total being replaced
+            query = query.with_for_update()
+        portfolios = query.all()
+        if not portfolios:
+            break
+
+        actual = compute_totals([p.id for p in portfolios])
+        stored = Portfolio.bulk_to_dict(portfolios)
+        for portfolio, stored_dict in zip(portfolios, stored):
+            drift = actual[portfolio.id] - stored_dict['total_value']
+            if abs(drift) > tolerance:
+                drifted.append({
+                    'portfolio_id': portfolio.id,
+                    'stored': stored_dict['total_value'],
+                    'actual': actual[portfolio.id],
+                    'drift': drift,
+                })
+                if repair:
+                    portfolio.total_value = actual[portfolio.id]
+
+        last_id = portfolios[-1].id
+        # End the transaction per chunk so locks are held briefly
+        if repair:
+            db.session.commit()
+        else:
+            db.session.rollback()
+    return drifted
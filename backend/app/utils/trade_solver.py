@@ -0,0 +1,226 @@
+"""
+Integer-share rebalancing solver
+
+Turns target allocations into tradeable whole-share (or lot-size) orders
+that respect a cash buffer, per-trade fixed and proportional costs and a
+minimum trade size, while keeping dollar tracking error against the
+targets as small as possible.
+
+The unconstrained optimum is computed in one vectorized step (each position
+rounded to the nearest lot of its target). If the resulting buys don't fit
+in the available cash, lots are removed greedily in order of least added
+tracking error per dollar freed, using a heap, so the work beyond the
+vectorized step is proportional to the shortfall rather than the
+portfolio size.
+"""
+import heapq
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+def _trade_costs(notional: np.ndarray, fixed_cost: float, proportional_cost: float) -> np.ndarray:
+    """Cost of each trade given its signed notional"""
+    return np.where(notional != 0, fixed_cost + proportional_cost * np.abs(notional), 0.0)
+
+def solve_trades(
+    symbols: Sequence[str],
+    prices: np.ndarray,
+    quantities: np.ndarray,
+    target_weights: np.ndarray,
+    cash: float = 0.0,
+    cash_buffer: float = 0.0,
+    lot_sizes: Optional[np.ndarray] = None,
+    fixed_cost: float = 0.0,
+    proportional_cost: float = 0.0,
+    min_trade: float = 0.0
+) -> Dict:
+    """
+    Solve for whole-lot trades that track target weights
+
+    Args:
+        symbols: Symbol per position
+        prices: Price per share, > 0
+        quantities: Shares currently held (0 for target-only symbols)
+        target_weights: Target weight per position as a fraction (0-1); positions
+            not in the target model should have weight 0 and are sold down
+        cash: Uninvested cash available to the portfolio
+        cash_buffer: Cash that must remain uninvested after trading and costs
+        lot_sizes: Shares per tradeable lot (default 1)
+        fixed_cost: Cost charged per executed trade
+        proportional_cost: Cost as a fraction of each trade's notional
+        min_trade: Trades with a smaller notional are not placed
+
+    Returns:
+        Dict with 'trades' (signed shares per position), 'final_quantities',
+        'costs', 'cash_after', 'tracking_error' (root of summed squared
+        weight deviations) and 'feasible' (False if the buffer can't be met
+        even after removing every buy)
+    """
+    prices = np.asarray(prices, dtype=float)
+    held = np.asarray(quantities, dtype=float)
+    weights = np.asarray(target_weights, dtype=float)
+    lots = np.ones(len(prices)) if lot_sizes is None else np.asarray(lot_sizes, dtype=float)
+    lot_values = lots * prices
+
+    wealth = float(held @ prices) + cash
+    investable = max(wealth - cash_buffer, 0.0)
+    target_values = weights * investable
+
+    # Nearest whole-lot trade to the target, without going short
+    lots_traded = np.rint((target_values / prices - held) / lots)
+    lots_traded = np.maximum(lots_traded, -np.floor(held / lots))
+    notional = lots_traded * lot_values
+
+    # Drop trades below the minimum size
+    small = np.abs(notional) < min_trade
+    lots_traded[small] = 0
+    notional[small] = 0
+
+    costs = _trade_costs(notional, fixed_cost, proportional_cost)
+    cash_after = cash - float(notional.sum()) - float(costs.sum())
+
+    if cash_after < cash_buffer:
+        # Remove lots one at a time, cheapest in added squared error per dollar freed.
+        # Removing one lot from position i changes its excess e = value - target by
+        # -v (v = lot value), adding v^2 - 2ev to the squared error: v - 2e per dollar.
+        excess = (held + lots_traded * lots) * prices - target_values
+        scores = lot_values - 2 * excess
+
+        # Bulk step: take one lot from the best-scoring positions whose removal
+        # doesn't cross the minimum-trade boundary, stopping short of the
+        # shortfall so the exact heap loop below only handles the remainder.
+        removable = (held + (lots_traded - 1) * lots >= 0) & (
+            ((lots_traded - 1) * lot_values >= min_trade) | (lots_traded < 0)
+        )
+        candidates = np.nonzero(removable)[0]
+        candidates = candidates[np.argsort(scores[candidates], kind='stable')]
+        freed = np.cumsum(lot_values[candidates] * (1 + proportional_cost))
+        bulk = candidates[:max(int(np.searchsorted(freed, cash_buffer - cash_after)) - 1, 0)]
+        if len(bulk):
+            lots_traded[bulk] -= 1
+            notional[bulk] = lots_traded[bulk] * lot_values[bulk]
+            costs[bulk] = _trade_costs(notional[bulk], fixed_cost, proportional_cost)
+            cash_after = cash - float(notional.sum()) - float(costs.sum())
+            excess[bulk] = (held[bulk] + lots_traded[bulk] * lots[bulk]) * prices[bulk] - target_values[bulk]
+            scores[bulk] = lot_values[bulk] - 2 * excess[bulk]
+
+        candidates = np.nonzero(held + (lots_traded - 1) * lots >= 0)[0]
+        heap = list(zip(scores[candidates].tolist(), candidates.tolist()))
+        heapq.heapify(heap)
+        while heap and cash_after < cash_buffer:
+            _, i = heapq.heappop(heap)
+            old_notional, old_cost = notional[i], costs[i]
+            lots_traded[i] -= 1
+            if 0 < lots_traded[i] * lot_values[i] < min_trade:
+                # A buy shrunk below the minimum: cancel it outright
+                lots_traded[i] = 0
+            elif lots_traded[i] < 0 and -lots_traded[i] * lot_values[i] < min_trade:
+                # A new sell must be at least the minimum size, or not happen at all
+                smallest_sell = np.ceil(min_trade / lot_values[i])
+                if smallest_sell > np.floor(held[i] / lots[i]):
+                    lots_traded[i] += 1
+                    continue
+                lots_traded[i] = -smallest_sell
+            notional[i] = lots_traded[i] * lot_values[i]
+            costs[i] = _trade_costs(notional[i:i + 1], fixed_cost, proportional_cost)[0]
+            cash_after += (old_notional - notional[i]) + (old_cost - costs[i])
+            excess[i] = (held[i] + lots_traded[i] * lots[i]) * prices[i] - target_values[i]
+            if held[i] + (lots_traded[i] - 1) * lots[i] >= 0:
+                heapq.heappush(heap, (lot_values[i] - 2 * excess[i], i))
+
+    final_quantities = held + lots_traded * lots
+    final_values = final_quantities * prices
+    invested = final_values.sum() + cash_after
+    final_weights = final_values / invested if invested > 0 else np.zeros(len(prices))
+
+    return {
+        'symbols': list(symbols),
+        'trades': lots_traded * lots,
+        'final_quantities': final_quantities,
+        'notional': notional,
+        'costs': costs,
+        'target_values': target_values,
+        'final_weights': final_weights,
+        'cash_after': cash_after,
+        'tracking_error': float(np.sqrt(((final_weights - weights) ** 2).sum())),
+        'feasible': cash_after >= cash_buffer - 1e-9,
+    }
+
+def build_orders(
+    holdings: List[Dict],
+    target_allocations: List[Dict],
+    prices: Optional[Dict[str, float]] = None,
+    lot_sizes: Optional[Dict[str, float]] = None,
+    **options
+) -> Dict:
+    """
+    Solve orders for a list-of-dicts portfolio
+
+    Args:
+        holdings: [{'symbol', 'quantity', 'price'}]
+        target_allocations: [{'symbol', 'target_percentage'}] (0-100)
+        prices: Price overrides, and prices for target symbols not yet held
+        lot_sizes: Lot size per symbol (default 1 share)
+        **options: cash, cash_buffer, fixed_cost, proportional_cost, min_trade
+
+    Returns:
+        Dict with 'orders' (non-zero trades), 'unpriced' symbols that couldn't
+        be traded, and a 'summary'
+    """
+    prices = prices or {}
+    lot_sizes = lot_sizes or {}
+
+    positions = {}
+    for h in holdings:
+        position = positions.setdefault(h['symbol'], {'quantity': 0.0, 'price': 0.0, 'weight': 0.0})
+        position['quantity'] += h.get('quantity') or 0.0
+        position['price'] = h.get('price') or position['price']
+    for alloc in target_allocations:
+        position = positions.setdefault(alloc['symbol'], {'quantity': 0.0, 'price': 0.0, 'weight': 0.0})
+        position['weight'] = alloc['target_percentage'] / 100
+    for symbol, price in prices.items():
+        if symbol in positions:
+            positions[symbol]['price'] = price
+
+    unpriced = sorted(s for s, p in positions.items() if not p['price'] or p['price'] <= 0)
+    symbols = [s for s in positions if s not in unpriced]
+
+    result = solve_trades(
+        symbols,
+        np.array([positions[s]['price'] for s in symbols], dtype=float),
+        np.array([positions[s]['quantity'] for s in symbols], dtype=float),
+        np.array([positions[s]['weight'] for s in symbols], dtype=float),
+        lot_sizes=np.array([lot_sizes.get(s, 1) for s in symbols], dtype=float),
+        **options
+    )
+
+    orders = []
+    columns = zip(symbols, result['trades'].tolist(), result['notional'].tolist(),
+                  result['costs'].tolist(), result['target_values'].tolist(),
+                  result['final_quantities'].tolist(), result['final_weights'].tolist())
+    for symbol, shares, notional, cost, target_value, final_quantity, final_weight in columns:
+        if shares == 0:
+            continue
+        orders.append({
+            'symbol': symbol,
+            'action': 'BUY' if shares > 0 else 'SELL',
+            'shares': abs(shares),
+            'price': positions[symbol]['price'],
+            'notional': abs(notional),
+            'cost': cost,
+            'target_value': target_value,
+            'final_quantity': final_quantity,
+            'final_percentage': final_weight * 100,
+            'target_percentage': positions[symbol]['weight'] * 100,
+        })
+
+    return {
+        'orders': orders,
+        'unpriced': unpriced,
+        'summary': {
+            'num_orders': len(orders),
+            'total_costs': float(result['costs'].sum()),
+            'cash_after': result['cash_after'],
+            'tracking_error': result['tracking_error'],
+            'feasible': bool(result['feasible']),
+        },
+    }
@@ -0,0 +1,38 @@
+"""
+Native INSERT ... ON CONFLICT upserts
+
+PostgreSQL and SQLite share the ON CONFLICT syntax; the statement is built
+with the dialect of the session's connection so one round trip inserts new
+rows and updates existing ones against a unique index.
+"""
+from typing import Dict, List, Sequence
+from sqlalchemy.dialects import postgresql, sqlite
+
+INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+def upsert(session, table, rows: List[Dict], index_elements: Sequence[str], update_columns: Sequence[str]):
+    """
+    Insert rows, updating `update_columns` of rows that conflict on `index_elements`
+
+    Args:
+        session: Session whose connection (and transaction) runs the statement
+        table: Core table to write
+        rows: Column dicts, all with the same keys
+
+    Raises:
+        NotImplementedError: For databases without ON CONFLICT support
+    """
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect not in INSERTS:
+        raise NotImplementedError(f"Upserts are not supported on {dialect}")
+    statement = INSERTS[dialect](table).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(index_elements),
+        set_={column: statement.excluded[column] for column in update_columns},
+    )
+    session.execute(statement)
@@ -0,0 +1,15 @@
+"""
+MoneyLab ASGI Entry Point
+
+Serves the read endpoints on async database sessions and everything else
+through the Flask app. Run with e.g.:
+    uvicorn asgi:application --workers 4
+"""
+from dotenv import load_dotenv
+from app import create_app
+from app.asgi import create_asgi_app
+
+# Load environment variables
+load_dotenv()
+
+application = create_asgi_app(create_app())
@@ -0,0 +1,148 @@
+"""
+Concurrency benchmark: WSGI read path vs the async ASGI read path
+
+Seeds a database with one user's portfolios and holdings, then issues the
+same mix of read requests (portfolio list/detail, assets, rebalance) at a
+fixed concurrency through:
+    wsgi: the Flask app on a pool of --concurrency threads, like a threaded
+          WSGI worker
+    asgi: the async read endpoints on one event loop with --concurrency
+          requests in flight
+
+Defaults to a temporary SQLite file; pass --database-uri to measure against
+Postgres, where time spent waiting on the network is what the async path
+overlaps.
+
+Usage (from the backend folder):
+    python -m benchmarks.bench_asgi [--requests 2000] [--concurrency 32]
+"""
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Crypto.Random import get_random_bytes
+
+def _seed(portfolios, holdings):
+    """Create one user with portfolios and holdings; returns (user_id, portfolio_ids)"""
+    from app import db
+    from app.models import User, Portfolio, Asset, AssetAllocation
+
+    db.drop_all()
+    db.create_all()
+    user = User(firebase_uid='bench-uid', email='bench@example.com')
+    db.session.add(user)
+    db.session.commit()
+    ids = []
+    for p in range(portfolios):
+        portfolio = Portfolio(user_id=user.id, name=f'Bench {p}', total_value=holdings * 100.0)
+        db.session.add(portfolio)
+        db.session.flush()
+        for h in range(holdings):
+            db.session.add(Asset(portfolio_id=portfolio.id, symbol=f'S{h}', quantity=10, price=10, value=100))
+            db.session.add(AssetAllocation(portfolio_id=portfolio.id, symbol=f'S{h}',
+                                           target_percentage=100 / holdings))
+        ids.append(portfolio.id)
+    db.session.commit()
+    return user.id, ids
+
+def _paths(portfolio_ids, count):
+    """A fixed mix of read requests over all portfolios"""
+    kinds = ('/api/portfolio', '/api/portfolio/{}', '/api/portfolio/{}/rebalance',
+             '/api/assets/portfolio/{}/assets')
+    return [kinds[n % len(kinds)].format(portfolio_ids[n % len(portfolio_ids)]) for n in range(count)]
+
+def _summary(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+def _run_wsgi(flask_app, paths, headers, concurrency):
+    client = flask_app.test_client()
+
+    def one(path):
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, (path, response.status_code)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, paths))
+    return _summary(latencies, time.perf_counter() - started)
+
+async def _run_asgi(asgi_app, paths, headers, concurrency):
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+    gate = asyncio.Semaphore(concurrency)
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def one(path):
+        statuses = []
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': raw_headers,
+                 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+                 'raw_path': path.encode(), 'server': ('bench', 80), 'client': ('127.0.0.1', 0)}
+        async with gate:
+            started = time.perf_counter()
+            await asgi_app(scope, receive, send)
+            assert statuses == [200], (path, statuses)
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(one(path) for path in paths))
+    elapsed = time.perf_counter() - started
+    await asgi_app.close()
+    return _summary(latencies, elapsed)
+
+def run(requests=2000, concurrency=32, portfolios=20, holdings=25, database_uri=None):
+    """Run the benchmark and return {mode: {requests_per_sec, p50_ms, p95_ms}}"""
+    os.environ.setdefault('AES_ENCRYPTION_KEY', base64.b64encode(get_random_bytes(32)).decode())
+
+    from flask_jwt_extended import create_access_token
+    from app import create_app
+    from app.asgi import create_asgi_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flask_app = create_app({
+            'SQLALCHEMY_DATABASE_URI': database_uri or f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'QUOTE_PROVIDER': 'fake',
+            'PORTFOLIO_SNAPSHOTS': False,
+            # Measure the read path itself, not the result cache
+            'REBALANCE_CACHE_BACKEND': 'none',
+        })
+        with flask_app.app_context():
+            user_id, portfolio_ids = _seed(portfolios, holdings)
+            headers = {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+        paths = _paths(portfolio_ids, requests)
+
+        results = {'wsgi': _run_wsgi(flask_app, paths, headers, concurrency)}
+        results['asgi'] = asyncio.run(_run_asgi(create_asgi_app(flask_app), paths, headers, concurrency))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per mode')
+    parser.add_argument('--concurrency', type=int, default=32, help='requests in flight')
+    parser.add_argument('--portfolios', type=int, default=20)
+    parser.add_argument('--holdings', type=int, default=25, help='assets per portfolio')
+    parser.add_argument('--database-uri', help='sync database URI (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    results = run(args.requests, args.concurrency, args.portfolios, args.holdings, args.database_uri)
+    print(f"{'mode':<8}{'req/sec':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for mode, r in results.items():
+        print(f"{mode:<8}{r['requests_per_sec']:>12,.0f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}")
+    print(f"asgi vs wsgi: {results['asgi']['requests_per_sec'] / results['wsgi']['requests_per_sec']:.2f}x")
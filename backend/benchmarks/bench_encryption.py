@@ -0,0 +1,79 @@
+"""
+Micro-benchmark for AES encryption utilities
+
+Compares the original per-value path (decode key + build cipher per call)
+against the cached single-value and batch APIs. Packed records are reported
+in field values/sec so they compare directly with the per-column rates.
+
+Usage (from the backend folder):
+    python -m benchmarks.bench_encryption [--count 6000]
+"""
+import argparse
+import base64
+import os
+import time
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from Crypto.Util.Padding import pad, unpad
+
+def _legacy_encrypt(data: str) -> str:
+    """Encryption as it was before key caching (reference only)"""
+    key = base64.b64decode(os.environ['AES_ENCRYPTION_KEY'])
+    cipher = AES.new(key, AES.MODE_CBC)
+    encrypted = cipher.encrypt(pad(data.encode('utf-8'), AES.block_size))
+    return base64.b64encode(cipher.iv + encrypted).decode('utf-8')
+
+def _legacy_decrypt(encrypted_data: str) -> str:
+    """Decryption as it was before key caching (reference only)"""
+    key = base64.b64decode(os.environ['AES_ENCRYPTION_KEY'])
+    encrypted_with_iv = base64.b64decode(encrypted_data)
+    cipher = AES.new(key, AES.MODE_CBC, encrypted_with_iv[:16])
+    return unpad(cipher.decrypt(encrypted_with_iv[16:]), AES.block_size).decode('utf-8')
+
+def _rate(fn, count, repeat=3):
+    """Best-of-N ciphertexts/sec for fn() processing `count` values"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+def run(count=6000):
+    """Run the benchmark and return {case: ciphertexts/sec}"""
+    os.environ.setdefault('AES_ENCRYPTION_KEY', base64.b64encode(get_random_bytes(32)).decode())
+
+    from app.utils.encryption import (
+        encrypt_data, decrypt_data, encrypt_many, decrypt_many, encrypt_records, decrypt_records
+    )
+
+    plaintexts = [str(round(i * 1.37, 2)) for i in range(count)]
+    ciphertexts = encrypt_many(plaintexts)
+    # One packed (quantity, price, value) record stands in for three ciphertexts
+    records = [(float(i), 1.37, i * 1.37) for i in range(count // 3)]
+    packed = encrypt_records(records)
+
+    return {
+        'encrypt_legacy': _rate(lambda: [_legacy_encrypt(p) for p in plaintexts], count),
+        'encrypt_data': _rate(lambda: [encrypt_data(p) for p in plaintexts], count),
+        'encrypt_many': _rate(lambda: encrypt_many(plaintexts), count),
+        'decrypt_legacy': _rate(lambda: [_legacy_decrypt(c) for c in ciphertexts], count),
+        'decrypt_data': _rate(lambda: [decrypt_data(c) for c in ciphertexts], count),
+        'decrypt_many': _rate(lambda: decrypt_many(ciphertexts), count),
+        'encrypt_records': _rate(lambda: encrypt_records(records), len(records) * 3),
+        'decrypt_records': _rate(lambda: decrypt_records(packed), len(records) * 3),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=6000, help='values per run')
+    args = parser.parse_args()
+
+    results = run(args.count)
+    print(f"{'case':<18}{'ciphertexts/sec':>18}")
+    for case, rate in results.items():
+        print(f"{case:<18}{rate:>18,.0f}")
+    for op in ('encrypt', 'decrypt'):
+        speedup = results[f'{op}_many'] / results[f'{op}_legacy']
+        print(f"{op}_many vs legacy: {speedup:.1f}x")
@@ -0,0 +1,43 @@
+"""
+Micro-benchmark for price history valuation
+
+Values a fixed set of holdings over years of daily closes, the work behind
+GET /api/portfolio/<id>/valuation.
+
+Usage (from the backend folder):
+    python -m benchmarks.bench_price_history [--symbols 300] [--years 10]
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+def run(symbols=300, years=10, repeat=5):
+    """Run the benchmark and return {'symbols', 'days', 'best_ms'}"""
+    from app.utils.price_history import PriceHistoryStore, to_day
+
+    with tempfile.TemporaryDirectory() as root:
+        store = PriceHistoryStore(root)
+        days = np.arange(to_day('2014-01-01'), to_day('2014-01-01') + 365 * years)
+        quantities = {}
+        for i in range(symbols):
+            store.append(f'S{i}', days, np.linspace(10, 20, len(days)))
+            quantities[f'S{i}'] = 1.0
+        store.value_series(quantities)  # map the files once
+
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            store.value_series(quantities)
+            best = min(best, time.perf_counter() - start)
+    return {'symbols': symbols, 'days': len(days), 'best_ms': best * 1000}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--symbols', type=int, default=300, help='symbols held')
+    parser.add_argument('--years', type=int, default=10, help='years of daily closes per symbol')
+    args = parser.parse_args()
+
+    result = run(args.symbols, args.years)
+    print(f"value_series: {result['symbols']} symbols x {result['days']} days in {result['best_ms']:.1f} ms")
@@ -0,0 +1,58 @@
+"""
+Latency benchmark for the integer-share trade solver
+
+Times solve_trades on synthetic portfolios of increasing size, including
+a cash shortfall so the greedy repair step is exercised.
+
+Usage (from the backend folder):
+    python -m benchmarks.bench_trade_solver [--sizes 10 100 1000 5000 10000]
+"""
+import argparse
+import time
+import numpy as np
+from app.utils.trade_solver import solve_trades
+
+def _portfolio(size, seed=42):
+    rng = np.random.default_rng(seed)
+    prices = rng.uniform(5, 500, size)
+    quantities = np.floor(rng.uniform(0, 200, size))
+    weights = rng.dirichlet(np.ones(size))
+    return {
+        'symbols': [f'SYM{i}' for i in range(size)],
+        'prices': prices,
+        'quantities': quantities,
+        'target_weights': weights,
+        # Buffer larger than current cash forces the repair loop to free money
+        'cash': 0.0,
+        'cash_buffer': float(prices @ quantities) * 0.01,
+        'fixed_cost': 1.0,
+        'proportional_cost': 0.0005,
+        'min_trade': 25.0,
+    }
+
+def run(sizes=(10, 100, 1000, 5000, 10000), repeat=20):
+    """Return {holdings: {'median_ms', 'p95_ms', 'orders'}}"""
+    results = {}
+    for size in sizes:
+        portfolio = _portfolio(size)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = solve_trades(**portfolio)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[size] = {
+            'median_ms': float(np.median(timings)),
+            'p95_ms': float(np.percentile(timings, 95)),
+            'orders': int(np.count_nonzero(result['trades'])),
+        }
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 5000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'holdings':>10}{'median ms':>12}{'p95 ms':>10}{'orders':>8}")
+    for size, stats in run(args.sizes, args.repeat).items():
+        print(f"{size:>10}{stats['median_ms']:>12.2f}{stats['p95_ms']:>10.2f}{stats['orders']:>8}")
@@ -0,0 +1,283 @@
+"""
+Benchmark suite: every API endpoint, encryption and rebalancing on synthetic data
+
+Loads a seeded synthetic dataset (see benchmarks.synthetic) into SQLite or a
+local Postgres, then times each case: every blueprint endpoint through the
+test client (with its SQL statement count), encrypt_data/decrypt_data, and
+the rebalancing functions on the generated portfolios. Runs fully offline
+(quotes come from the fake provider).
+
+Results are written as JSON with the dataset parameters and environment, so
+runs can be compared; --baseline flags cases whose median got slower than
+--threshold (exit status 1 if any did).
+
+Usage (from the backend folder):
+    python -m benchmarks.suite [--database-uri postgresql://...] [--output results.json]
+                               [--baseline previous.json] [--threshold 0.25]
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from Crypto.Random import get_random_bytes
+
+from benchmarks.synthetic import generate, load
+
+def _measure(fn, repeat, warmup=2):
+    """Time fn() and return {'median_ms', 'p95_ms', 'min_ms', 'runs'} plus any stats dict fn returns"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    extra = result if isinstance(result, dict) else {}
+    return {
+        'median_ms': round(statistics.median(timings), 4),
+        # Nearest-rank percentile: the smallest timing at or above 95% of the runs
+        'p95_ms': round(timings[math.ceil(0.95 * len(timings)) - 1], 4),
+        'min_ms': round(timings[0], 4),
+        'runs': repeat,
+        **extra,
+    }
+
+def _endpoint_cases(client, headers, portfolio_id, symbols):
+    """(name, callable) per endpoint; writes undo themselves so every run sees the same data"""
+    from app import db
+    from app.models import Asset
+
+    def get(path):
+        def call():
+            response = client.get(path, headers=headers)
+            assert response.status_code == 200, (path, response.status_code, response.get_data(as_text=True)[:200])
+            return {'sql_statements': int(response.headers['X-SQL-Query-Count'])}
+        return call
+
+    def post(path, body):
+        def call():
+            response = client.post(path, json=body, headers=headers)
+            assert response.status_code in (200, 201), (path, response.status_code)
+            return {'sql_statements': int(response.headers['X-SQL-Query-Count'])}
+        return call
+
+    def asset_round_trip():
+        created = client.post(f'/api/assets/portfolio/{portfolio_id}/assets', headers=headers,
+                              json={'symbol': 'BENCH', 'quantity': 3, 'price': 12.5})
+        updated = client.put(f"/api/assets/assets/{created.get_json()['id']}", headers=headers,
+                             json={'quantity': 4})
+        deleted = client.delete(f"/api/assets/assets/{created.get_json()['id']}", headers=headers)
+        assert (created.status_code, updated.status_code, deleted.status_code) == (201, 200, 200)
+        return {'sql_statements': sum(int(r.headers['X-SQL-Query-Count']) for r in (created, updated, deleted))}
+
+    def allocation_round_trip():
+        created = client.post(f'/api/assets/portfolio/{portfolio_id}/allocations', headers=headers,
+                              json={'symbol': 'BENCH', 'target_percentage': 1})
+        deleted = client.delete(f"/api/assets/allocations/{created.get_json()['id']}", headers=headers)
+        assert (created.status_code, deleted.status_code) == (201, 200)
+        return {'sql_statements': sum(int(r.headers['X-SQL-Query-Count']) for r in (created, deleted))}
+
+    def import_round_trip():
+        body = 'symbol,quantity,price\n' + ''.join(f'IMP{i},{i + 1},10\n' for i in range(50))
+        response = client.post(f'/api/assets/portfolio/{portfolio_id}/assets/import', data=body,
+                               headers={**headers, 'Content-Type': 'text/csv'})
+        assert response.status_code == 200, response.get_data(as_text=True)[:200]
+        # One bulk delete rather than 50 timed DELETE requests (the stored total drifts, which doesn't matter here)
+        Asset.query.filter(Asset.portfolio_id == portfolio_id, Asset.symbol.like('IMP%')).delete()
+        db.session.commit()
+        return {'sql_statements': int(response.headers['X-SQL-Query-Count'])}
+
+    def portfolio_round_trip():
+        created = client.post('/api/portfolio', json={'name': 'Bench', 'total_value': 1}, headers=headers)
+        pid = created.get_json()['id']
+        updated = client.put(f'/api/portfolio/{pid}', json={'name': 'Bench 2'}, headers=headers)
+        deleted = client.delete(f'/api/portfolio/{pid}', headers=headers)
+        assert (created.status_code, updated.status_code, deleted.status_code) == (201, 200, 200)
+        return {'sql_statements': sum(int(r.headers['X-SQL-Query-Count']) for r in (created, updated, deleted))}
+
+    base = f'/api/portfolio/{portfolio_id}'
+    return [
+        ('health', get('/api/health')),
+        ('auth.me', get('/api/auth/me')),
+        ('auth.verify', post('/api/auth/verify', {'firebase_uid': 'bench-verify', 'email': 'bench-verify@example.com'})),
+        ('portfolio.list', get('/api/portfolio')),
+        ('portfolio.list_page', get('/api/portfolio?limit=10')),
+        ('portfolio.detail', get(base)),
+        ('portfolio.rebalance', get(f'{base}/rebalance')),
+        ('portfolio.rebalance_orders', post(f'{base}/rebalance/orders', {'cash': 1000, 'min_trade': 1})),
+        ('portfolio.rebalance_batch', post('/api/portfolio/rebalance/batch', {})),
+        ('portfolio.valuation', get(f'{base}/valuation')),
+        ('portfolio.history', get(f'{base}/history?period=week')),
+        ('portfolio.write_round_trip', portfolio_round_trip),
+        ('assets.list', get(f'/api/assets/portfolio/{portfolio_id}/assets')),
+        ('assets.stream', get(f'/api/assets/portfolio/{portfolio_id}/assets?stream=ndjson')),
+        ('assets.allocations', get(f'/api/assets/portfolio/{portfolio_id}/allocations')),
+        ('assets.write_round_trip', asset_round_trip),
+        ('assets.allocation_round_trip', allocation_round_trip),
+        ('assets.import_csv', import_round_trip),
+        ('quotes', get('/api/quotes?symbols=' + ','.join(symbols[:50]))),
+    ]
+
+def _compute_cases(dataset, count):
+    """Encryption and rebalancing cases on generated values"""
+    from app.utils.encryption import decrypt_data, encrypt_data
+    from app.utils.rebalancing import calculate_portfolio_metrics, calculate_rebalancing
+    from app.utils.rebalancing_engine import rebalance_many
+
+    plaintexts = [str(a['value']) for p in dataset['portfolios'] for a in p['assets']][:count]
+    ciphertexts = [encrypt_data(p) for p in plaintexts]
+    portfolios = [{
+        'holdings': [{'symbol': a['symbol'], 'value': a['value']} for a in p['assets']],
+        'targets': [{'symbol': a['symbol'], 'target_percentage': a['target_percentage']} for a in p['allocations']],
+        'total_value': p['total_value'],
+    } for p in dataset['portfolios']]
+    first = portfolios[0]
+
+    return [
+        (f'encryption.encrypt_data_x{len(plaintexts)}', lambda: [encrypt_data(p) for p in plaintexts]),
+        (f'encryption.decrypt_data_x{len(ciphertexts)}', lambda: [decrypt_data(c) for c in ciphertexts]),
+        ('rebalancing.calculate_rebalancing', lambda: calculate_rebalancing(
+            first['holdings'], first['targets'], first['total_value'])),
+        ('rebalancing.calculate_portfolio_metrics', lambda: calculate_portfolio_metrics(
+            first['holdings'], first['total_value'])),
+        (f'rebalancing.rebalance_many_x{len(portfolios)}', lambda: rebalance_many(portfolios)),
+    ]
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(database_uri=None, seed=7, users=5, portfolios=4, assets=250, symbols=1000, history_days=180,
+        repeat=20, only=None):
+    """
+    Run the suite and return the JSON-serializable report
+
+    Args:
+        only: Run only cases whose name starts with one of these prefixes
+    """
+    os.environ.setdefault('AES_ENCRYPTION_KEY', base64.b64encode(get_random_bytes(32)).decode())
+
+    from flask_jwt_extended import create_access_token
+    from app import create_app, db
+
+    parameters = {'seed': seed, 'users': users, 'portfolios_per_user': portfolios, 'assets_per_portfolio': assets,
+                  'symbols': symbols, 'history_days': history_days, 'repeat': repeat}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': database_uri or f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'QUOTE_PROVIDER': 'fake',
+            'PRICE_HISTORY_DIR': os.path.join(tmp, 'prices'),
+            'SQL_DEBUG_HEADERS': True,
+            # Every run measures the full read path
+            'REBALANCE_CACHE_BACKEND': 'none',
+        })
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            dataset = generate(seed, users, portfolios, assets, symbols, history_days)
+            app.config['PORTFOLIO_SNAPSHOTS'] = False
+            started = time.perf_counter()
+            loaded = load(dataset, app.extensions['price_history'])
+            parameters['load_seconds'] = round(time.perf_counter() - started, 3)
+            app.config['PORTFOLIO_SNAPSHOTS'] = True
+            headers = {'Authorization': f"Bearer {create_access_token(identity=str(loaded['user_ids'][0]))}"}
+            dialect = db.engine.dialect.name
+
+        client = app.test_client()
+        cases = _endpoint_cases(client, headers, loaded['portfolio_ids'][0], dataset['prices']['symbols'])
+        with app.app_context():
+            cases += _compute_cases(dataset, count=min(2000, loaded['assets']))
+            for name, fn in cases:
+                if only and not name.startswith(tuple(only)):
+                    continue
+                results[name] = _measure(fn, repeat)
+        with app.app_context():
+            db.session.remove()
+            if database_uri:
+                db.drop_all()
+            db.engine.dispose()
+
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': dialect,
+            'commit': _git_commit(),
+        },
+        'parameters': {**parameters, 'loaded_assets': loaded['assets'], 'loaded_allocations': loaded['allocations']},
+        'results': results,
+    }
+
+def compare(report, baseline, threshold):
+    """
+    Cases whose median is more than `threshold` (a fraction) slower than the baseline
+
+    Returns:
+        [(case, baseline median ms, current median ms, change)] for regressions
+    """
+    regressions = []
+    for name, current in report['results'].items():
+        previous = baseline['results'].get(name)
+        if not previous or not previous['median_ms']:
+            continue
+        change = current['median_ms'] / previous['median_ms'] - 1
+        if change > threshold:
+            regressions.append((name, previous['median_ms'], current['median_ms'], change))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-uri', help='SQLite or Postgres URI (default: temporary SQLite file); '
+                                               'tables are dropped afterwards')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--portfolios', type=int, default=4, help='portfolios per user')
+    parser.add_argument('--assets', type=int, default=250, help='holdings per portfolio')
+    parser.add_argument('--symbols', type=int, default=1000)
+    parser.add_argument('--history-days', type=int, default=180)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--only', nargs='+', help='case name prefixes, e.g. portfolio. encryption.')
+    parser.add_argument('--output', help='JSON results path (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed median slowdown (fraction)')
+    args = parser.parse_args()
+
+    report = run(args.database_uri, args.seed, args.users, args.portfolios, args.assets, args.symbols,
+                 args.history_days, args.repeat, args.only)
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results',
+        datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'case':<42}{'median ms':>12}{'p95 ms':>10}{'sql':>6}")
+    for name, r in report['results'].items():
+        print(f"{name:<42}{r['median_ms']:>12.2f}{r['p95_ms']:>10.2f}{r.get('sql_statements', ''):>6}")
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before:.2f}ms -> {after:.2f}ms (+{change:.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}")
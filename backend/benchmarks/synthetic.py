@@ -0,0 +1,155 @@
+"""
+Seeded synthetic data for benchmarks
+
+generate() builds users, portfolios, holdings, target allocations, daily
+value snapshots and per-symbol price history from a seed, so two runs with
+the same arguments produce identical data. load() writes it through the
+app's models (encrypting in batches), snapshot tables and price store.
+
+Usage (from the backend folder), e.g. to fill a local Postgres for manual testing:
+    python -m benchmarks.synthetic --users 10 --portfolios 5 --assets 200 [--seed 7]
+"""
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict
+import numpy as np
+
+ASSET_TYPES = ('stock', 'etf', 'bond', 'crypto')
+
+def generate(seed=7, users=5, portfolios=4, assets=100, symbols=500, history_days=120) -> Dict:
+    """
+    Build a deterministic dataset
+
+    Args:
+        users: Number of users
+        portfolios: Portfolios per user
+        assets: Holdings per portfolio (symbols drawn without replacement)
+        symbols: Size of the symbol universe
+        history_days: Days of price history and daily portfolio values
+
+    Returns:
+        {'users', 'portfolios', 'prices', 'end'}; each portfolio carries its
+        'assets', 'allocations' (summing to 100) and 'history' of daily values
+    """
+    rng = np.random.default_rng(seed)
+    universe = [f'S{i:04d}' for i in range(symbols)]
+    # Geometric random walk per symbol; holdings are priced at the last close
+    starts = 20 + 480 * rng.random(symbols)
+    paths = starts * np.exp(np.cumsum(rng.normal(0.0003, 0.02, (history_days, symbols)), axis=0))
+    closes = paths[-1]
+    end = datetime(2024, 6, 28)
+
+    dataset = {'users': [], 'portfolios': [], 'end': end, 'prices': {
+        'symbols': universe, 'closes': paths, 'days': history_days,
+    }}
+    for u in range(users):
+        dataset['users'].append({'firebase_uid': f'synthetic-{seed}-{u}', 'email': f'user{u}-{seed}@example.com',
+                                 'display_name': f'User {u}'})
+        for p in range(portfolios):
+            count = min(assets, symbols)
+            picks = np.sort(rng.choice(symbols, count, replace=False))
+            quantities = np.round(rng.lognormal(3, 1, count), 4)
+            prices = closes[picks]
+            values = quantities * prices
+            weights = rng.dirichlet(np.ones(count)) * 100
+            daily = (paths[:, picks] * quantities).sum(axis=1)
+            dataset['portfolios'].append({
+                'user': u,
+                'name': f'Portfolio {u}-{p}',
+                'description': 'Synthetic benchmark portfolio',
+                'assets': [
+                    {'symbol': universe[s], 'name': universe[s], 'asset_type': ASSET_TYPES[s % len(ASSET_TYPES)],
+                     'quantity': float(q), 'price': float(pr), 'value': float(v)}
+                    for s, q, pr, v in zip(picks, quantities, prices, values)
+                ],
+                'allocations': [
+                    {'symbol': universe[s], 'target_percentage': float(w),
+                     'asset_type': ASSET_TYPES[s % len(ASSET_TYPES)]}
+                    for s, w in zip(picks, weights)
+                ],
+                'total_value': float(values.sum()),
+                'history': [float(v) for v in daily],
+            })
+    return dataset
+
+def load(dataset: Dict, price_store=None) -> Dict:
+    """
+    Insert a generated dataset (inside an app context)
+
+    Returns:
+        {'user_ids', 'portfolio_ids', 'assets', 'allocations'} for the inserted rows
+    """
+    from app import db
+    from app.models import User, Portfolio, Asset, AssetAllocation
+    from app.utils.encryption import encrypt_many, encrypt_records
+    from app.utils.price_history import to_day
+    from app.utils.snapshots import record_values
+
+    users = [User(**u) for u in dataset['users']]
+    db.session.add_all(users)
+    db.session.flush()
+
+    portfolios = []
+    totals = encrypt_many([str(p['total_value']) for p in dataset['portfolios']])
+    for spec, total in zip(dataset['portfolios'], totals):
+        portfolio = Portfolio(user_id=users[spec['user']].id, name=spec['name'], description=spec['description'])
+        portfolio._total_value_encrypted = total
+        portfolios.append(portfolio)
+    db.session.add_all(portfolios)
+    db.session.flush()
+
+    asset_count = allocation_count = 0
+    for portfolio, spec in zip(portfolios, dataset['portfolios']):
+        records = encrypt_records([(a['quantity'], a['price'], a['value']) for a in spec['assets']])
+        for a, record in zip(spec['assets'], records):
+            asset = Asset(portfolio_id=portfolio.id, symbol=a['symbol'], name=a['name'], asset_type=a['asset_type'])
+            asset._holding_encrypted = record
+            db.session.add(asset)
+        db.session.add_all(AssetAllocation(portfolio_id=portfolio.id, **a) for a in spec['allocations'])
+        asset_count += len(spec['assets'])
+        allocation_count += len(spec['allocations'])
+    db.session.flush()
+
+    # Back-dated daily values, oldest first, so the OHLC buckets fill in order
+    connection = db.session.connection()
+    days = len(dataset['portfolios'][0]['history']) if dataset['portfolios'] else 0
+    for d in range(days):
+        at = dataset['end'] - timedelta(days=days - 1 - d)
+        record_values(connection, {p.id: s['history'][d] for p, s in zip(portfolios, dataset['portfolios'])}, at)
+    db.session.commit()
+
+    if price_store is not None:
+        prices = dataset['prices']
+        first = to_day(dataset['end'].date().isoformat()) - prices['days'] + 1
+        day_numbers = list(range(first, first + prices['days']))
+        for i, symbol in enumerate(prices['symbols']):
+            price_store.append(symbol, day_numbers, prices['closes'][:, i])
+
+    return {
+        'user_ids': [u.id for u in users],
+        'portfolio_ids': [p.id for p in portfolios],
+        'assets': asset_count,
+        'allocations': allocation_count,
+    }
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from app import create_app, db
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--portfolios', type=int, default=4, help='portfolios per user')
+    parser.add_argument('--assets', type=int, default=100, help='holdings per portfolio')
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--history-days', type=int, default=120)
+    args = parser.parse_args()
+
+    load_dotenv()
+    app = create_app({'PORTFOLIO_SNAPSHOTS': False})
+    with app.app_context():
+        db.create_all()
+        dataset = generate(args.seed, args.users, args.portfolios, args.assets, args.symbols, args.history_days)
+        loaded = load(dataset, app.extensions['price_history'])
+    print(f"Loaded {len(loaded['user_ids'])} users, {len(loaded['portfolio_ids'])} portfolios, "
+          f"{loaded['assets']} assets, {loaded['allocations']} allocations")
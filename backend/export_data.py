@@ -0,0 +1,59 @@
+"""
+Export a user's data to an encrypted archive, or restore one
+
+Archives hold plaintext values protected by a passphrase (from
+EXPORT_PASSPHRASE or a prompt), so they restore under any
+AES_ENCRYPTION_KEY, e.g. to move a user to another deployment. Decryption
+and re-encryption run on a process pool, chunk by chunk, so memory stays
+bounded by --chunk-size.
+
+Usage (from the backend folder):
+    python export_data.py export --user-id 5 -o user5.mlarch [--processes 4] [--chunk-size 1000]
+    python export_data.py restore user5.mlarch [--user-id 7] [--processes 4]
+"""
+import argparse
+import getpass
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from app import create_app, db
+from app.services.export import DEFAULT_CHUNK_SIZE, export_user, restore_user
+
+def print_report(action, report):
+    tables = ', '.join(f'{count} {table}' for table, count in report['tables'].items())
+    print(f"{action} {report['rows']} rows ({tables}) in {report['seconds']:.2f}s, "
+          f"{report['rows_per_second']} rows/s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export or restore a user's data")
+    parser.add_argument('command', choices=('export', 'restore'))
+    parser.add_argument('archive', nargs='?', help='archive to restore')
+    parser.add_argument('-o', '--output', help='archive to write (export)')
+    parser.add_argument('--user-id', type=int,
+                        help='user to export; for restore, the owner of the restored portfolios '
+                             '(default: create the archived user)')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 2,
+                        help='processes decrypting and encrypting chunks')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='rows per chunk')
+    args = parser.parse_args()
+    if args.command == 'export' and (args.user_id is None or not args.output):
+        parser.error('export needs --user-id and --output')
+    if args.command == 'restore' and not args.archive:
+        parser.error('restore needs an archive')
+
+    load_dotenv()
+    passphrase = os.environ.get('EXPORT_PASSPHRASE') or getpass.getpass('Archive passphrase: ')
+    app = create_app()
+    # Pool processes inherit the environment (AES_ENCRYPTION_KEY) and need no app
+    with app.app_context(), ProcessPoolExecutor(args.processes) as pool:
+        if args.command == 'export':
+            with open(args.output, 'wb') as out:
+                report = export_user(args.user_id, out, passphrase, args.chunk_size, pool)
+            print_report('Exported', report)
+            print(f"Wrote {report['bytes']} bytes to {args.output}")
+        else:
+            with open(args.archive, 'rb') as archive:
+                report = restore_user(archive, passphrase, args.user_id, pool)
+            db.session.commit()
+            print_report('Restored', report)
+            print(f"Portfolios belong to user {report['user_id']}")
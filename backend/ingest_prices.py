@@ -0,0 +1,39 @@
+"""
+Load daily closing prices into the price history store
+
+Each CSV needs date and close columns (e.g. a Yahoo Finance download) and
+either a symbol column or --symbol. Re-running an ingest only appends dates
+newer than those already stored.
+
+Usage (from the backend folder):
+    python ingest_prices.py prices.csv [more.csv ...] [--symbol AAPL]
+"""
+import argparse
+import csv
+import os
+from dotenv import load_dotenv
+from app import create_app
+from app.utils.price_history import ingest_rows
+
+def read_rows(path):
+    """Yield CSV rows with lowercased headers ('Adj Close' is ignored in favour of 'Close')"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            yield {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append daily closes to the price history store')
+    parser.add_argument('files', nargs='+', help='CSV files with date and close columns')
+    parser.add_argument('--symbol', help='symbol for files without a symbol column '
+                                         '(default: the file name, e.g. AAPL.csv)')
+    args = parser.parse_args()
+
+    load_dotenv()
+    app = create_app()
+    store = app.extensions['price_history']
+    for path in args.files:
+        default_symbol = args.symbol or os.path.splitext(os.path.basename(path))[0]
+        written = ingest_rows(store, read_rows(path), default_symbol)
+        for symbol, count in sorted(written.items()):
+            print(f"{symbol}: {count} new record(s) from {path}")
+    print(f"Done: price history in {store.root}")
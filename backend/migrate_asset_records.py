@@ -0,0 +1,93 @@
+"""
+Convert assets from three encrypted columns to one packed encrypted record
+
+Safe to run while the app is serving traffic: rows are converted in small
+primary-key chunks, each committed on its own, and a row is only written if
+it still has no packed record (so concurrent app writes always win).
+Re-running picks up where a previous run stopped.
+
+Usage (from the backend folder):
+    python migrate_asset_records.py [--chunk-size 1000] [--pause 0.05] [--keep-legacy]
+"""
+import argparse
+import time
+from dotenv import load_dotenv
+from sqlalchemy import bindparam
+from app import create_app, db
+from app.migrations import migrate
+from app.models import Asset
+from app.utils.encryption import decrypt_many, encrypt_records
+
+def _to_float(value):
+    try:
+        return float(value) if value else 0.0
+    except ValueError:
+        return 0.0
+
+def migrate_chunk(after_id, chunk_size, keep_legacy=False):
+    """
+    Convert one chunk of legacy rows with id > after_id
+
+    Returns:
+        (rows converted, last id seen) - last id is None when nothing is left
+    """
+    table = Asset.__table__
+    rows = db.session.execute(
+        db.select(table.c.id, table.c.quantity_encrypted, table.c.price_encrypted, table.c.value_encrypted)
+        .where(table.c.holding_encrypted.is_(None), table.c.id > after_id)
+        .order_by(table.c.id)
+        .limit(chunk_size)
+    ).all()
+    if not rows:
+        return 0, None
+
+    plain = decrypt_many(v for row in rows for v in row[1:])
+    records = encrypt_records(
+        tuple(_to_float(v) for v in plain[3 * n:3 * n + 3]) for n in range(len(rows))
+    )
+
+    values = {'holding_encrypted': bindparam('record')}
+    if not keep_legacy:
+        values.update(quantity_encrypted=None, price_encrypted=None, value_encrypted=None)
+    statement = (
+        table.update()
+        .where(table.c.id == bindparam('row_id'), table.c.holding_encrypted.is_(None))
+        .values(**values)
+    )
+    result = db.session.execute(
+        statement,
+        [{'row_id': row.id, 'record': record} for row, record in zip(rows, records)]
+    )
+    db.session.commit()
+    return result.rowcount, rows[-1].id
+
+def migrate_asset_records(chunk_size=1000, pause=0.0, keep_legacy=False, log=print):
+    """Convert every legacy asset row; returns the number of rows converted"""
+    # Adds assets.holding_encrypted to databases created before packed records
+    migrate(db.engine, log=log)
+
+    total, last_id = 0, 0
+    started = time.perf_counter()
+    while True:
+        converted, last_id = migrate_chunk(last_id, chunk_size, keep_legacy)
+        if last_id is None:
+            break
+        total += converted
+        log(f"Converted {total} rows (up to id {last_id}, {total / (time.perf_counter() - started):.0f} rows/s)")
+        if pause:
+            time.sleep(pause)
+    return total
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack encrypted asset columns into one record per row')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='rows per transaction')
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds to sleep between chunks')
+    parser.add_argument('--keep-legacy', action='store_true',
+                        help='keep the old columns populated (for mixed-version deploys)')
+    args = parser.parse_args()
+
+    load_dotenv()
+    app = create_app()
+    with app.app_context():
+        count = migrate_asset_records(args.chunk_size, args.pause, args.keep_legacy)
+        print(f"Done: {count} asset rows converted to packed records")
@@ -0,0 +1,59 @@
+"""
+Watch portfolios for drift away from their target allocations
+
+Loads every portfolio with target allocations (and their open alerts) into
+a DriftMonitor, then applies price updates as they arrive: from a recorded
+feed (--feed, a CSV of timestamp, symbol, price) or by polling the quote
+service for the held symbols every --interval seconds. Breaches and recoveries are written to
+drift_alerts, which users read from GET /api/portfolio/alerts. Portfolio
+edits are picked up between updates by comparing versions.
+
+Usage (from the backend folder):
+    python monitor_drift.py [--band 5] [--interval 60]
+    python monitor_drift.py --feed ticks.csv
+"""
+import argparse
+import time
+from dotenv import load_dotenv
+from app import create_app, db
+from app.services.drift import DriftMonitor, load, read_feed, record_alerts, replay, sync
+
+def apply(monitor, prices, at=None):
+    """Pick up edits, apply one batch of prices and record the transitions"""
+    events = sync(monitor) + monitor.apply_prices(prices)
+    raised = record_alerts(events, monitor.band, at)
+    db.session.commit()
+    return raised, len(events) - raised
+
+if __name__ == '__main__':
+    load_dotenv()
+    app = create_app()
+
+    parser = argparse.ArgumentParser(description='Raise alerts when portfolios drift from their targets')
+    parser.add_argument('--band', type=float, default=app.config['DRIFT_BAND'],
+                        help='allowed distance from the target in percentage points')
+    parser.add_argument('--feed', help='replay a recorded price feed instead of polling quotes')
+    parser.add_argument('--interval', type=float, default=60, help='seconds between quote polls')
+    args = parser.parse_args()
+
+    monitor = DriftMonitor(args.band)
+    with app.app_context():
+        load(monitor)
+        print(f"Tracking {len(monitor.portfolios)} portfolio(s) over {len(monitor.holders)} symbol(s)")
+
+        if args.feed:
+            for at, prices in replay(read_feed(args.feed)):
+                raised, resolved = apply(monitor, prices, at)
+                if raised or resolved:
+                    print(f"{at.isoformat()}: {raised} alert(s) raised, {resolved} resolved")
+            print(f"Done: {monitor.evaluations} portfolio evaluation(s)")
+        else:
+            quotes = app.extensions['quote_service']
+            while True:
+                found = quotes.get_quotes(monitor.symbols())
+                prices = {symbol: quote['price'] for symbol, quote in found.items() if quote}
+                raised, resolved = apply(monitor, prices)
+                if raised or resolved:
+                    print(f"{raised} alert(s) raised, {resolved} resolved")
+                db.session.remove()
+                time.sleep(args.interval)
@@ -0,0 +1,28 @@
+"""
+Verify portfolio totals against their holdings and optionally repair drift
+
+Usage (from the backend folder):
+    python repair_totals.py [--repair] [--tolerance 0.005] [--user-id ID]
+"""
+import argparse
+from dotenv import load_dotenv
+from app import create_app
+from app.utils.totals import verify_totals
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recompute portfolio totals and report drift')
+    parser.add_argument('--repair', action='store_true', help='write recomputed totals')
+    parser.add_argument('--tolerance', type=float, default=0.005, help='allowed absolute drift')
+    parser.add_argument('--chunk-size', type=int, default=500, help='portfolios per transaction')
+    parser.add_argument('--user-id', type=int, help="only check one user's portfolios")
+    args = parser.parse_args()
+
+    load_dotenv()
+    app = create_app()
+    with app.app_context():
+        drifted = verify_totals(args.repair, args.tolerance, args.chunk_size, args.user_id)
+        for report in drifted:
+            print(f"Portfolio {report['portfolio_id']}: stored {report['stored']:.2f}, "
+                  f"actual {report['actual']:.2f}, drift {report['drift']:+.2f}")
+        action = 'repaired' if args.repair else 'found'
+        print(f"Done: {len(drifted)} drifted portfolio total(s) {action}")
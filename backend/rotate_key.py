@@ -0,0 +1,61 @@
+"""
+Re-encrypt stored data under a new AES key, online
+
+Rotation steps:
+    1. Generate a key (python generate_key.py) and deploy it as
+       AES_ENCRYPTION_KEY with the next AES_ENCRYPTION_KEY_ID, moving the old
+       key to AES_PREVIOUS_KEYS (e.g. AES_PREVIOUS_KEYS=0:<old key>). The app
+       then reads values under either key and writes only the new one.
+    2. Run this script (with the same environment) while the app serves
+       traffic. It can be stopped at any time and resumes from its checkpoint.
+    3. Run it with --verify; once nothing is left under the old key, remove
+       that key from AES_PREVIOUS_KEYS.
+
+Usage (from the backend folder):
+    python rotate_key.py [--processes 4] [--chunk-size 1000] [--rows-per-second 5000] [--tables assets ...]
+    python rotate_key.py --restart     # walk the tables again from the start
+    python rotate_key.py --verify      # count values still under other keys
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from app import create_app, db
+from app.migrations import migrate
+from app.services.key_rotation import DEFAULT_CHUNK_SIZE, ROTATED_COLUMNS, rotate, verify
+from app.utils.encryption import current_key_id
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-encrypt stored data under the current AES key')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 2,
+                        help='processes re-encrypting each chunk')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='rows per chunk (each chunk is one short transaction)')
+    parser.add_argument('--rows-per-second', type=float, default=0,
+                        help='maximum rows read per second (default: unlimited)')
+    parser.add_argument('--tables', nargs='+', choices=list(ROTATED_COLUMNS), help='tables to rotate (default: all)')
+    parser.add_argument('--restart', action='store_true', help='ignore checkpoints and start from the first row')
+    parser.add_argument('--verify', action='store_true', help='only count values not under the current key')
+    args = parser.parse_args()
+
+    load_dotenv()
+    app = create_app()
+    with app.app_context():
+        migrate(db.engine)
+        key_id = current_key_id()
+        if args.verify:
+            stale = verify(args.tables, args.chunk_size, args.rows_per_second)
+            for table, counts in stale.items():
+                detail = ', '.join(f"{count} under key {k}" if k >= 0 else f"{count} malformed"
+                                   for k, count in sorted(counts.items()))
+                print(f"{table}: {detail or f'all values under key {key_id}'}")
+        else:
+            print(f"Rotating to key {key_id}")
+            # Pool processes inherit the environment (current and previous keys)
+            with ProcessPoolExecutor(args.processes) as pool:
+                reports = rotate(args.tables, args.chunk_size, pool, args.processes,
+                                 args.rows_per_second, args.restart, log=print)
+            for report in reports:
+                status = 'done' if report['finished'] else 'stopped'
+                print(f"{report['table']}: {status}, {report['scanned']} row(s) scanned, "
+                      f"{report['rotated']} value(s) rotated, {report['unreadable']} unreadable")
@@ -0,0 +1,88 @@
+"""
+Production server launcher
+
+Runs the app under gunicorn with threaded workers. Every worker builds its
+own app and database pool, sized so that each worker thread can hold a
+connection, capped by DB_MAX_CONNECTIONS across all workers if set, and is
+warmed up (pool connections, encryption key, URL map) before it accepts
+requests. Point the load balancer's readiness probe at /api/health/ready.
+
+Usage (from the backend folder):
+    python serve.py [--bind 0.0.0.0:5000] [--workers 4] [--threads 8]
+
+Environment (flags take precedence): PORT, WEB_CONCURRENCY, GUNICORN_THREADS,
+GUNICORN_TIMEOUT, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_MAX_CONNECTIONS
+"""
+import argparse
+import multiprocessing
+import os
+from dotenv import load_dotenv
+from gunicorn.app.base import BaseApplication
+
+def pool_sizes(workers, threads, max_connections=None):
+    """
+    Per-worker (pool_size, max_overflow)
+
+    One pooled connection per worker thread; overflow lets background work
+    (e.g. streaming responses) borrow a few more. With a database-wide
+    connection budget, both are scaled down so workers * (size + overflow)
+    stays within it.
+    """
+    pool_size = int(os.environ.get('DB_POOL_SIZE', threads))
+    max_overflow = int(os.environ.get('DB_MAX_OVERFLOW', max(2, threads // 4)))
+    if max_connections:
+        per_worker = max(1, max_connections // workers)
+        pool_size = min(pool_size, per_worker)
+        max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+    return pool_size, max_overflow
+
+def post_worker_init(worker):
+    """Warm the worker's app after it is loaded and before it accepts connections"""
+    from app.utils.pooling import warm_up
+    warm_up(worker.wsgi)
+
+class MoneyLabServer(BaseApplication):
+    """gunicorn application that creates the Flask app in each worker"""
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import create_app
+        return create_app()
+
+if __name__ == '__main__':
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bind', default=f"0.0.0.0:{os.environ.get('PORT', 5000)}")
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('GUNICORN_THREADS', 8)))
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('GUNICORN_TIMEOUT', 60)))
+    args = parser.parse_args()
+
+    max_connections = int(os.environ['DB_MAX_CONNECTIONS']) if os.environ.get('DB_MAX_CONNECTIONS') else None
+    pool_size, max_overflow = pool_sizes(args.workers, args.threads, max_connections)
+    # Read by create_app in every worker
+    os.environ['DB_POOL_SIZE'] = str(pool_size)
+    os.environ['DB_MAX_OVERFLOW'] = str(max_overflow)
+    print(f"{args.workers} workers x {args.threads} threads, "
+          f"pool {pool_size} + {max_overflow} overflow per worker")
+
+    MoneyLabServer({
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        # Each worker builds its own app so no pool or cipher state crosses a fork
+        'preload_app': False,
+        'post_worker_init': post_worker_init,
+        'accesslog': '-',
+    }).run()
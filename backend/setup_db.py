@@ -1,21 +1,31 @@
 """
 Database setup script
+
+Creates the tables on a new database and applies any pending schema
+migrations (see app/migrations) on an existing one. Safe to re-run.
 """
-import os
 from dotenv import load_dotenv
 from app import create_app, db
-from app.models import User, Portfolio, Asset, AssetAllocation
+from app.migrations import current_version, migrate
 
 load_dotenv()
 
 app = create_app()
 
 with app.app_context():
-    # Create all tables
-    db.create_all()
-    print("Database tables created successfully!")
-    print("\nTables created:")
+    applied = migrate(db.engine)
+    
+    with db.engine.connect() as conn:
+        version = current_version(conn)
+    if applied:
+        print(f"Database schema migrated to version {version}")
+    else:
+        print(f"Database schema is up to date (version {version})")
+    print("\nTables:")
     print("- users")
     print("- portfolios")
     print("- assets")
     print("- asset_allocations")
+    print("- portfolio_snapshots")
+    print("- portfolio_value_buckets")
+    print("- schema_version")
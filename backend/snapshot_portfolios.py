@@ -0,0 +1,26 @@
+"""
+Snapshot portfolio values on a schedule
+
+Portfolio writes through the app already record snapshots; this catches
+totals changed outside it (bulk scripts, manual SQL). Only portfolios whose
+value differs from their last snapshot get a new row. Run it from cron,
+e.g. nightly.
+
+Usage (from the backend folder):
+    python snapshot_portfolios.py [--chunk-size 500]
+"""
+import argparse
+from dotenv import load_dotenv
+from app import create_app
+from app.utils.snapshots import snapshot_all
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record value snapshots for changed portfolios')
+    parser.add_argument('--chunk-size', type=int, default=500, help='portfolios per transaction')
+    args = parser.parse_args()
+
+    load_dotenv()
+    app = create_app()
+    with app.app_context():
+        written = snapshot_all(args.chunk_size)
+        print(f"Done: {written} snapshot(s) written")
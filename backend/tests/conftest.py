@@ -0,0 +1,54 @@
+"""
+Shared test fixtures: an app on in-memory SQLite with a throwaway AES key
+"""
+import base64
+import os
+import pytest
+from Crypto.Random import get_random_bytes
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models import User, Portfolio
+from app.services.drift import read_feed
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setenv('AES_ENCRYPTION_KEY', base64.b64encode(get_random_bytes(32)).decode())
+    app = create_app({
+        'TESTING': True,
+        'SQL_DEBUG_HEADERS': True,
+        'QUOTE_PROVIDER': 'fake',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'JWT_SECRET_KEY': 'test-secret-key-with-enough-length-for-hs256',
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def user(app):
+    user = User(firebase_uid='test-uid', email='test@example.com', display_name='Test')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def auth_headers(user):
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+@pytest.fixture
+def portfolio(user):
+    portfolio = Portfolio(user_id=user.id, name='Main', description='', total_value=0.0)
+    db.session.add(portfolio)
+    db.session.commit()
+    return portfolio
+
+@pytest.fixture
+def price_feed():
+    """Recorded price ticks (tests/fixtures/price_feed.csv), replayable with drift.replay"""
+    return read_feed(os.path.join(os.path.dirname(__file__), 'fixtures', 'price_feed.csv'))
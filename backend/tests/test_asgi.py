@@ -0,0 +1,106 @@
+"""
+Tests for the async read endpoints of the ASGI entry point
+"""
+import asyncio
+import json
+import pytest
+from app import create_app, db
+from app.asgi import async_database_uri, create_asgi_app
+from app.models import Asset, AssetAllocation, Portfolio
+
+@pytest.fixture
+def file_app(app, tmp_path):
+    """The test app on a SQLite file, so sync and async engines share the data"""
+    app = create_app({**app.config, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'asgi.db'}"})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+def _call(asgi_app, path, headers, query_string=b''):
+    """Run one GET through the ASGI app and return (status, headers, body)"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query_string,
+        'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+        'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+    }
+    asyncio.run(asgi_app(scope, receive, send))
+    start = messages[0]
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+    return start['status'], {k.decode(): v.decode() for k, v in start['headers']}, body
+
+def test_async_uri_mapping():
+    """Test sync URIs map to their asyncio drivers"""
+    assert async_database_uri('sqlite:///app.db') == 'sqlite+aiosqlite:///app.db'
+    assert async_database_uri('postgresql://u:p@db/money') == 'postgresql+asyncpg://u:p@db/money'
+    with pytest.raises(ValueError):
+        async_database_uri('mysql://db/money')
+
+def test_async_reads_match_flask(file_app):
+    """Test every async read returns the same status, JSON and ETag as the Flask route"""
+    from flask_jwt_extended import create_access_token
+    from app.models import User
+    user = User(firebase_uid='asgi-uid', email='asgi@example.com')
+    db.session.add(user)
+    db.session.commit()
+    portfolio = Portfolio(user_id=user.id, name='Main', description='', total_value=300.0)
+    db.session.add(portfolio)
+    db.session.commit()
+    for symbol, target in (('VTI', 60), ('BND', 40)):
+        db.session.add(Asset(portfolio_id=portfolio.id, symbol=symbol, quantity=10, price=15, value=150))
+        db.session.add(AssetAllocation(portfolio_id=portfolio.id, symbol=symbol, target_percentage=target))
+    db.session.commit()
+    headers = {
+        'Authorization': f'Bearer {create_access_token(identity=str(user.id))}',
+        'Origin': 'http://localhost:3000',
+    }
+
+    asgi_app = create_asgi_app(file_app)
+    client = file_app.test_client()
+    paths = [
+        '/api/portfolio',
+        f'/api/portfolio/{portfolio.id}',
+        f'/api/portfolio/{portfolio.id}/rebalance',
+        f'/api/assets/portfolio/{portfolio.id}/assets',
+        f'/api/assets/portfolio/{portfolio.id}/allocations',
+        f'/api/portfolio/{portfolio.id + 1}',
+    ]
+    for path in paths:
+        expected = client.get(path, headers=headers)
+        status, response_headers, body = _call(asgi_app, path, headers)
+        assert status == expected.status_code, path
+        assert json.loads(body) == expected.get_json(), path
+        assert response_headers.get('etag') == expected.headers.get('ETag'), path
+        # Same headers apart from Flask's SQL statistics (and X-Cache: Flask's call filled the cache)
+        skipped = ('x-sql-query-count', 'x-sql-query-time-ms', 'x-cache')
+        flask_headers = {k.lower(): v for k, v in expected.headers.items() if k.lower() not in skipped}
+        assert {k: v for k, v in response_headers.items() if k not in skipped} == flask_headers, path
+        assert response_headers['access-control-allow-origin'] == 'http://localhost:3000'
+
+    _, response_headers, _ = _call(asgi_app, '/api/portfolio', {**headers, 'Origin': 'http://evil.example'})
+    assert 'access-control-allow-origin' not in response_headers
+
+    # The second rebalance above was served from the cache shared with Flask
+    assert file_app.extensions['rebalance_cache'].hits == 1
+
+def test_unhandled_requests_fall_through_to_flask(file_app):
+    """Test auth errors, query strings and other routes are answered by Flask"""
+    asgi_app = create_asgi_app(file_app)
+    status, _, body = _call(asgi_app, '/api/portfolio', {})
+    assert status == 401
+    assert json.loads(body)['error'] == 'Authorization token is missing'
+
+    status, _, body = _call(asgi_app, '/api/portfolio', {'Authorization': 'Bearer nonsense'})
+    assert status == 422
+
+    status, _, body = _call(asgi_app, '/api/health', {})
+    assert json.loads(body)['status'] == 'healthy'
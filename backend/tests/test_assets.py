@@ -0,0 +1,226 @@
+"""
+Tests for asset routes
+"""
+import json
+import pytest
+from app import db
+from app.models import AssetAllocation, Portfolio
+from app.utils.totals import verify_totals
+
+def _create(client, auth_headers, portfolio_id, **data):
+    response = client.post(f'/api/assets/portfolio/{portfolio_id}/assets', json=data, headers=auth_headers)
+    assert response.status_code == 201
+    return response.get_json()
+
+def _total(portfolio_id):
+    db.session.expire_all()
+    return db.session.get(Portfolio, portfolio_id).total_value
+
+def test_asset_writes_maintain_total(client, auth_headers, portfolio):
+    """Test create/update/delete apply value deltas to the portfolio total"""
+    aapl = _create(client, auth_headers, portfolio.id, symbol='AAPL', quantity=10, price=100)
+    _create(client, auth_headers, portfolio.id, symbol='MSFT', value=500)
+    assert _total(portfolio.id) == 1500
+
+    response = client.put(f"/api/assets/assets/{aapl['id']}", json={'price': 120}, headers=auth_headers)
+    assert response.get_json()['value'] == 1200
+    assert _total(portfolio.id) == 1700
+
+    client.delete(f"/api/assets/assets/{aapl['id']}", headers=auth_headers)
+    assert _total(portfolio.id) == 500
+
+def test_verify_and_repair_totals(client, auth_headers, portfolio):
+    """Test drift is reported and repaired from the holdings"""
+    _create(client, auth_headers, portfolio.id, symbol='VTI', value=2500)
+    db.session.get(Portfolio, portfolio.id).total_value = 99
+    db.session.commit()
+
+    drifted = verify_totals()
+    assert [(d['portfolio_id'], d['stored'], d['actual']) for d in drifted] == [(portfolio.id, 99, 2500)]
+    assert _total(portfolio.id) == 99
+
+    verify_totals(repair=True)
+    assert _total(portfolio.id) == 2500
+    assert verify_totals() == []
+
+def test_bulk_import_csv_reports_row_errors(client, auth_headers, portfolio):
+    """Test a CSV import inserts valid rows, reports bad ones and updates the total once"""
+    body = (
+        "Symbol,Shares,Price,Market Value\n"
+        "aapl,10,100,\n"
+        ",5,10,\n"
+        "MSFT,2,abc,\n"
+        "VTI,1,1,250\n"
+    )
+    response = client.post(
+        f'/api/assets/portfolio/{portfolio.id}/assets/import',
+        data=body, content_type='text/csv', headers=auth_headers
+    )
+    report = response.get_json()
+
+    assert response.status_code == 200
+    assert report['imported'] == 2
+    assert report['errors'] == [
+        {'row': 3, 'error': 'Symbol is required'},
+        {'row': 4, 'error': 'price must be a number'},
+    ]
+    assert _total(portfolio.id) == 1250
+
+    assets = client.get(f'/api/assets/portfolio/{portfolio.id}/assets', headers=auth_headers).get_json()
+    assert {(a['symbol'], a['value']) for a in assets} == {('AAPL', 1000), ('VTI', 250)}
+
+def test_zero_value_import_changes_etag(client, auth_headers, portfolio):
+    """Test an import that leaves the total unchanged still invalidates cached asset lists"""
+    url = f'/api/assets/portfolio/{portfolio.id}/assets'
+    etag = client.get(url, headers=auth_headers).headers['ETag']
+
+    report = client.post(f'{url}/import', data='symbol,quantity,price,value\nZZZ,0,0,0\n',
+                         content_type='text/csv', headers=auth_headers).get_json()
+    assert report['imported'] == 1 and _total(portfolio.id) == 0
+
+    response = client.get(url, headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert [a['symbol'] for a in response.get_json()] == ['ZZZ']
+
+def test_bulk_import_ndjson_strict_rolls_back(client, auth_headers, portfolio):
+    """Test strict mode imports nothing when any row is invalid"""
+    body = '{"symbol": "AAPL", "value": 100}\nnot json\n'
+    response = client.post(
+        f'/api/assets/portfolio/{portfolio.id}/assets/import?strict=true',
+        data=body, content_type='application/x-ndjson', headers=auth_headers
+    )
+
+    assert response.status_code == 422
+    assert response.get_json()['errors'][0]['row'] == 2
+    assert client.get(f'/api/assets/portfolio/{portfolio.id}/assets', headers=auth_headers).get_json() == []
+    assert _total(portfolio.id) == 0
+
+def test_symbols_normalized_on_every_write_path(client, auth_headers, portfolio):
+    """Test single writes store symbols the way imports do, so a ticker has one spelling"""
+    base = f'/api/assets/portfolio/{portfolio.id}'
+    created = client.post(f'{base}/assets', json={'symbol': ' vti ', 'quantity': 1, 'price': 10},
+                          headers=auth_headers).get_json()
+    client.post(f'{base}/assets/import', data='{"symbol": "VTI", "value": 5}\n',
+                content_type='application/x-ndjson', headers=auth_headers)
+    client.put(f"/api/assets/assets/{created['id']}", json={'symbol': 'bnd'}, headers=auth_headers)
+    client.post(f'{base}/allocations', json={'symbol': 'bnd', 'target_percentage': 60}, headers=auth_headers)
+    client.post(f'{base}/allocations', json={'symbol': 'BND', 'target_percentage': 70}, headers=auth_headers)
+
+    assets = client.get(f'{base}/assets', headers=auth_headers).get_json()
+    assert sorted(a['symbol'] for a in assets) == ['BND', 'VTI']
+    allocations = client.get(f'{base}/allocations', headers=auth_headers).get_json()
+    assert [(a['symbol'], a['target_percentage']) for a in allocations] == [('BND', 70)]
+
+def test_import_rejects_boolean_numbers(client, auth_headers, portfolio):
+    """Test JSON booleans aren't read as 1 or 0"""
+    response = client.post(f'/api/assets/portfolio/{portfolio.id}/assets/import',
+                           data='{"symbol": "VTI", "quantity": true, "price": 10}\n',
+                           content_type='application/x-ndjson', headers=auth_headers)
+    assert response.get_json()['errors'][0]['error'] == 'quantity must be a number'
+
+def test_assets_keyset_pagination(client, auth_headers, portfolio):
+    """Test paging through assets with the X-Next-Cursor header"""
+    body = 'symbol,quantity,price\n' + ''.join(f'S{i},1,{i + 1}\n' for i in range(25))
+    client.post(f'/api/assets/portfolio/{portfolio.id}/assets/import', data=body,
+                content_type='text/csv', headers=auth_headers)
+
+    symbols = []
+    url = f'/api/assets/portfolio/{portfolio.id}/assets?limit=10'
+    while url:
+        response = client.get(url, headers=auth_headers)
+        assert response.status_code == 200
+        assert len(response.get_json()) <= 10
+        symbols += [a['symbol'] for a in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f'/api/assets/portfolio/{portfolio.id}/assets?limit=10&after={cursor}' if cursor else None
+
+    assert symbols == [f'S{i}' for i in range(25)]
+    assert client.get(f'/api/assets/portfolio/{portfolio.id}/assets?limit=x',
+                      headers=auth_headers).status_code == 400
+
+def test_assets_streaming(client, auth_headers, portfolio, monkeypatch):
+    """Test JSON and NDJSON streaming decrypt in chunks and match the plain list"""
+    from app.utils import pagination
+    monkeypatch.setattr(pagination, 'STREAM_CHUNK_SIZE', 7)
+    body = 'symbol,quantity,price\n' + ''.join(f'S{i},2,{i + 1}\n' for i in range(20))
+    client.post(f'/api/assets/portfolio/{portfolio.id}/assets/import', data=body,
+                content_type='text/csv', headers=auth_headers)
+
+    expected = client.get(f'/api/assets/portfolio/{portfolio.id}/assets', headers=auth_headers).get_json()
+    streamed = client.get(f'/api/assets/portfolio/{portfolio.id}/assets?stream=json', headers=auth_headers)
+    assert streamed.is_streamed
+    assert json.loads(streamed.get_data(as_text=True)) == expected
+
+    ndjson = client.get(f'/api/assets/portfolio/{portfolio.id}/assets?stream=ndjson', headers=auth_headers)
+    assert ndjson.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in ndjson.get_data(as_text=True).splitlines()] == expected
+
+def test_allocations_stream_empty_and_ownership(client, auth_headers, portfolio):
+    """Test streaming an empty list and the ownership check"""
+    response = client.get(f'/api/assets/portfolio/{portfolio.id}/allocations?stream=json', headers=auth_headers)
+    assert response.get_data(as_text=True) == '[]'
+    assert client.get('/api/assets/portfolio/999/allocations?limit=5', headers=auth_headers).status_code == 404
+
+def test_replace_and_merge_allocations(client, auth_headers, portfolio):
+    """Test the bulk PUT replaces or merges the whole target set in one upsert"""
+    portfolio_id = portfolio.id
+    url = f'/api/assets/portfolio/{portfolio_id}/allocations'
+    client.post(url, json={'symbol': 'OLD', 'target_percentage': 100}, headers=auth_headers)
+
+    response = client.put(url, json={'allocations': [
+        {'symbol': 'VTI', 'target_percentage': 60},
+        {'symbol': 'BND', 'target_percentage': 40, 'asset_type': 'bond'},
+    ]}, headers=auth_headers)
+    assert response.status_code == 200
+    assert {a['symbol']: a['target_percentage'] for a in response.get_json()} == {'VTI': 60, 'BND': 40}
+    # Lock, upsert, delete of unlisted symbols, version bump, then the read back
+    assert int(response.headers['X-SQL-Query-Count']) <= 6
+
+    vti_id = next(a['id'] for a in response.get_json() if a['symbol'] == 'VTI')
+    response = client.put(url, json={'mode': 'merge', 'allocations': [
+        {'symbol': 'VTI', 'target_percentage': 50},
+        {'symbol': 'BND', 'target_percentage': 40},
+        {'symbol': 'VXUS', 'target_percentage': 10},
+    ]}, headers=auth_headers)
+    allocations = {a['symbol']: a for a in response.get_json()}
+    assert {s: a['target_percentage'] for s, a in allocations.items()} == {'VTI': 50, 'BND': 40, 'VXUS': 10}
+    assert allocations['VTI']['id'] == vti_id
+    # An omitted asset_type keeps the existing type; new symbols default to stock
+    assert (allocations['BND']['asset_type'], allocations['VXUS']['asset_type']) == ('bond', 'stock')
+    assert AssetAllocation.query.filter_by(portfolio_id=portfolio_id).count() == 3
+
+    rebalance = client.get(f'/api/portfolio/{portfolio_id}/rebalance', headers=auth_headers)
+    assert {r['symbol'] for r in rebalance.get_json()['recommendations']} == {'VTI', 'BND', 'VXUS'}
+
+def test_create_allocation_upserts(client, auth_headers, portfolio):
+    """Test posting an existing symbol updates it in place and keeps its type unless given"""
+    url = f'/api/assets/portfolio/{portfolio.id}/allocations'
+    created = client.post(url, json={'symbol': 'BND', 'target_percentage': 30, 'asset_type': 'bond'},
+                          headers=auth_headers)
+    updated = client.post(url, json={'symbol': 'BND', 'target_percentage': 45}, headers=auth_headers)
+
+    assert (created.status_code, updated.status_code) == (201, 200)
+    assert updated.get_json()['id'] == created.get_json()['id']
+    assert (updated.get_json()['target_percentage'], updated.get_json()['asset_type']) == (45, 'bond')
+    assert AssetAllocation.query.filter_by(portfolio_id=portfolio.id).count() == 1
+
+@pytest.mark.parametrize('body, message', [
+    ({'allocations': [{'symbol': 'VTI', 'target_percentage': 90}]}, 'sum to 100'),
+    ({'allocations': [{'symbol': 'VTI', 'target_percentage': 50}] * 2}, 'duplicate symbol'),
+    ({'allocations': [{'symbol': 'VTI', 'target_percentage': 50}, {'symbol': ' vti', 'target_percentage': 50}]},
+     'duplicate symbol'),
+    ({'allocations': [{'symbol': 'VTI', 'target_percentage': 'lots'}]}, 'must be a number'),
+    ({'allocations': [{'target_percentage': 100}]}, 'symbol is required'),
+    ({'mode': 'append', 'allocations': []}, 'mode'),
+])
+def test_replace_allocations_validation(client, auth_headers, portfolio, body, message):
+    """Test invalid target sets are rejected without writing anything"""
+    url = f'/api/assets/portfolio/{portfolio.id}/allocations'
+    client.post(url, json={'symbol': 'OLD', 'target_percentage': 100}, headers=auth_headers)
+    etag = client.get(url, headers=auth_headers).headers['ETag']
+
+    response = client.put(url, json=body, headers=auth_headers)
+    assert response.status_code == 400
+    assert message in response.get_json()['error']
+    assert client.get(url, headers={**auth_headers, 'If-None-Match': etag}).status_code == 304
@@ -0,0 +1,48 @@
+"""
+Tests for the synthetic benchmark data and result comparison
+"""
+from app import db
+from app.models import Asset, AssetAllocation, Portfolio, PortfolioSnapshot
+from benchmarks import suite
+from benchmarks.suite import compare
+from benchmarks.synthetic import generate, load
+
+def test_generator_is_deterministic():
+    """Test the same seed gives the same dataset and a different seed doesn't"""
+    first = generate(seed=3, users=2, portfolios=2, assets=20, symbols=50, history_days=10)
+    again = generate(seed=3, users=2, portfolios=2, assets=20, symbols=50, history_days=10)
+    other = generate(seed=4, users=2, portfolios=2, assets=20, symbols=50, history_days=10)
+    assert first['portfolios'] == again['portfolios']
+    assert first['portfolios'] != other['portfolios']
+    for portfolio in first['portfolios']:
+        assert abs(sum(a['target_percentage'] for a in portfolio['allocations']) - 100) < 1e-9
+
+def test_load_inserts_dataset(app):
+    """Test a loaded dataset reads back through the models"""
+    dataset = generate(seed=3, users=2, portfolios=2, assets=20, symbols=50, history_days=10)
+    loaded = load(dataset)
+
+    assert (len(loaded['portfolio_ids']), loaded['assets']) == (4, 80)
+    assert AssetAllocation.query.count() == 80
+    portfolio = db.session.get(Portfolio, loaded['portfolio_ids'][0])
+    assert abs(portfolio.total_value - dataset['portfolios'][0]['total_value']) < 1e-6
+    asset = Asset.query.filter_by(portfolio_id=portfolio.id).order_by(Asset.id).first()
+    assert asset.quantity == dataset['portfolios'][0]['assets'][0]['quantity']
+    assert PortfolioSnapshot.query.filter_by(portfolio_id=portfolio.id).count() >= 10
+
+def test_compare_flags_slower_cases():
+    """Test only medians beyond the threshold count as regressions"""
+    baseline = {'results': {'a': {'median_ms': 10.0}, 'b': {'median_ms': 10.0}}}
+    report = {'results': {'a': {'median_ms': 11.0}, 'b': {'median_ms': 14.0}, 'new': {'median_ms': 1.0}}}
+    assert [r[0] for r in compare(report, baseline, threshold=0.25)] == ['b']
+
+def test_measure_reports_nearest_rank_p95(monkeypatch):
+    """Test p95 is never below the median, even for a couple of runs"""
+    def measured(durations):
+        clock = iter(t for d in durations for t in (0.0, d / 1000))
+        monkeypatch.setattr(suite.time, 'perf_counter', lambda: next(clock))
+        return suite._measure(lambda: None, len(durations), warmup=0)
+
+    assert measured([5.0, 1.0])['p95_ms'] == 5.0
+    stats = measured([float(n) for n in range(1, 21)])
+    assert (stats['median_ms'], stats['p95_ms'], stats['min_ms']) == (10.5, 19.0, 1.0)
@@ -0,0 +1,116 @@
+"""
+Tests for the drift monitor and alerts
+"""
+import pytest
+from app import db
+from app.models import Asset, AssetAllocation, DriftAlert, Portfolio
+from app.services.drift import DriftMonitor, load, record_alerts, replay, sync
+
+def _track_pair(monitor, portfolio_id, first, second, price):
+    holdings = [(first, 10, 10 * price), (second, 10, 10 * price)]
+    monitor.track(portfolio_id, 1, holdings, {first: 50, second: 50})
+
+def test_price_updates_only_evaluate_holders(price_feed):
+    """Test each batch re-evaluates only portfolios holding an updated symbol"""
+    monitor = DriftMonitor(band=5)
+    _track_pair(monitor, 1, 'AAA', 'BBB', 10)
+    _track_pair(monitor, 2, 'CCC', 'DDD', 40)
+    assert monitor.holders['AAA'] == {1}
+    assert monitor.evaluate(1) == [] and monitor.evaluate(2) == []
+    monitor.evaluations = 0
+
+    steps = [monitor.apply_prices(prices) for _, prices in replay(price_feed)]
+
+    # AAA 11 stays in band; AAA 13 pushes both targets out; 13.5/9.5 keeps them out; 10/10 recovers
+    assert steps[0] == []
+    assert [(e['portfolio_id'], e['symbol'], e['breached']) for e in steps[1]] == [(1, 'AAA', True), (1, 'BBB', True)]
+    assert steps[1][0]['actual_percentage'] == pytest.approx(130 / 230 * 100)
+    assert steps[2] == [] and steps[3] == []
+    assert [(e['symbol'], e['breached']) for e in steps[4]] == [('AAA', False), ('BBB', False)]
+    # Portfolio 2 only when CCC moved (twice); portfolio 1 once per batch touching AAA/BBB
+    assert monitor.evaluations == 6
+    assert monitor.weights(2)['CCC'] == pytest.approx(50)
+
+def test_untrack_cleans_symbol_index():
+    """Test untracked portfolios leave the inverted index"""
+    monitor = DriftMonitor()
+    _track_pair(monitor, 1, 'AAA', 'BBB', 10)
+    _track_pair(monitor, 2, 'AAA', 'CCC', 10)
+    monitor.untrack(1)
+    assert monitor.symbols() == ['AAA', 'CCC']
+    assert monitor.holders['AAA'] == {2}
+    assert monitor.on_price('BBB', 50) == []
+
+@pytest.fixture
+def targeted(portfolio):
+    db.session.add_all([
+        Asset(portfolio_id=portfolio.id, symbol='AAA', quantity=10, price=10, value=100),
+        Asset(portfolio_id=portfolio.id, symbol='BBB', quantity=10, price=10, value=100),
+        AssetAllocation(portfolio_id=portfolio.id, symbol='AAA', target_percentage=50),
+        AssetAllocation(portfolio_id=portfolio.id, symbol='BBB', target_percentage=50),
+    ])
+    db.session.commit()
+    return portfolio
+
+def test_alerts_recorded_and_listed(client, auth_headers, targeted, price_feed):
+    """Test breaches open alerts, recoveries resolve them, and the endpoint lists them"""
+    monitor = DriftMonitor(band=5)
+    assert load(monitor) == [targeted.id]
+    batches = list(replay(price_feed))
+    for at, prices in batches[:4]:
+        record_alerts(monitor.apply_prices(prices), monitor.band, at)
+    db.session.commit()
+
+    response = client.get('/api/portfolio/alerts?status=open', headers=auth_headers)
+    alerts = response.get_json()
+    assert [(a['symbol'], a['resolved_at']) for a in alerts] == [('AAA', None), ('BBB', None)]
+    assert alerts[0]['drift'] == pytest.approx(130 / 230 * 100 - 50)
+
+    # A restarted monitor picks the open alerts up instead of raising them again
+    restarted = DriftMonitor(band=5)
+    load(restarted)
+    assert restarted.apply_prices(batches[3][1]) == []
+    at, prices = batches[4]
+    record_alerts(restarted.apply_prices(prices), restarted.band, at)
+    db.session.commit()
+
+    assert client.get('/api/portfolio/alerts?status=open', headers=auth_headers).get_json() == []
+    alerts = client.get('/api/portfolio/alerts', headers=auth_headers).get_json()
+    assert [a['resolved_at'] for a in alerts] == [at.isoformat()] * 2
+    assert client.get('/api/portfolio/alerts?status=closed', headers=auth_headers).status_code == 400
+
+def test_sync_reloads_edited_portfolios(targeted):
+    """Test target edits are picked up through the portfolio version"""
+    monitor = DriftMonitor(band=5)
+    load(monitor)
+    assert sync(monitor) == []
+
+    allocation = AssetAllocation.query.filter_by(portfolio_id=targeted.id, symbol='AAA').one()
+    allocation.target_percentage = 80
+    db.session.commit()
+
+    events = sync(monitor)
+    assert [(e['symbol'], e['breached']) for e in events] == [('AAA', True)]
+    assert monitor.portfolios[targeted.id].version == targeted.version
+
+    db.session.delete(db.session.get(Portfolio, targeted.id))
+    db.session.commit()
+    assert sync(monitor) == []
+    assert monitor.portfolios == {} and monitor.symbols() == []
+    assert DriftAlert.query.count() == 0
+
+def test_recovery_then_breach_in_one_batch_stays_open(targeted):
+    """Test events apply in order: a recovery from sync() doesn't resolve a breach raised after it"""
+    def event(symbol, actual, breached):
+        return {'portfolio_id': targeted.id, 'symbol': symbol, 'target_percentage': 50,
+                'actual_percentage': actual, 'breached': breached}
+
+    record_alerts([event('AAA', 70, True)], band=5)
+    raised = record_alerts([event('AAA', 50, False), event('AAA', 40, True),
+                            event('BBB', 60, True), event('BBB', 50, False)], band=5)
+    db.session.commit()
+
+    assert raised == 2
+    open_alerts = DriftAlert.query.filter(DriftAlert.resolved_at.is_(None)).all()
+    assert [(a.symbol, a.actual_percentage) for a in open_alerts] == [('AAA', 40)]
+    assert DriftAlert.query.count() == 3
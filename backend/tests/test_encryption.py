@@ -0,0 +1,99 @@
+"""
+Unit tests for encryption utilities
+"""
+import base64
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from Crypto.Util.Padding import pad, unpad
+from app.utils.encryption import (
+    encrypt_data, decrypt_data, encrypt_many, decrypt_many,
+    encrypt_records, decrypt_records, record_key_id, text_key_id, RECORD_KEYED, RECORD_OVERHEAD
+)
+
+@pytest.fixture(autouse=True)
+def aes_key(monkeypatch):
+    key = get_random_bytes(32)
+    monkeypatch.setenv('AES_ENCRYPTION_KEY', base64.b64encode(key).decode())
+    return key
+
+def test_round_trip():
+    """Test single-value encryption round trip"""
+    encrypted = encrypt_data('1234.56')
+    assert encrypted != '1234.56'
+    assert decrypt_data(encrypted) == '1234.56'
+
+def test_batch_round_trip_preserves_order_and_empties():
+    """Test batch APIs keep input order and pass empty values through"""
+    values = ['1', None, 'a much longer value spanning several AES blocks', '', '42.0']
+    encrypted = encrypt_many(values)
+
+    assert encrypted[1] is None
+    assert encrypted[3] == ''
+    assert decrypt_many(encrypted) == values
+
+def test_compatible_with_plain_cbc(aes_key):
+    """Test ciphertexts stay interchangeable with a standard AES-CBC implementation"""
+    cipher = AES.new(aes_key, AES.MODE_CBC)
+    legacy = base64.b64encode(cipher.iv + cipher.encrypt(pad(b'5000.0', 16))).decode()
+    assert decrypt_many([legacy]) == ['5000.0']
+
+    raw = base64.b64decode(encrypt_data('3000.25'))
+    plain = unpad(AES.new(aes_key, AES.MODE_CBC, raw[:16]).decrypt(raw[16:]), 16)
+    assert plain == b'3000.25'
+
+def test_rejects_malformed_ciphertext():
+    """Test truncated ciphertexts raise instead of returning garbage"""
+    with pytest.raises(ValueError):
+        decrypt_many([base64.b64encode(b'too short').decode()])
+
+def test_record_round_trip():
+    """Test packed records round-trip exactly and stay compact"""
+    records = [(10.0, 187.25, 1872.5), None, (0.1, 0.2, 0.30000000000000004)]
+    encrypted = encrypt_records(records)
+
+    assert encrypted[1] is None
+    assert len(encrypted[0]) == RECORD_OVERHEAD + 3 * 8
+    assert decrypt_records(encrypted) == records
+
+def test_record_tampering_is_detected():
+    """Test a modified record fails authentication"""
+    blob = bytearray(encrypt_records([(1.0, 2.0, 3.0)])[0])
+    blob[20] ^= 1
+    with pytest.raises(ValueError):
+        decrypt_records([bytes(blob)])
+
+def _rotate_to(monkeypatch, old_key, key_id=1):
+    """Make a fresh key current under key_id, keeping old_key readable as key 0"""
+    monkeypatch.setenv('AES_ENCRYPTION_KEY', base64.b64encode(get_random_bytes(32)).decode())
+    monkeypatch.setenv('AES_ENCRYPTION_KEY_ID', str(key_id))
+    monkeypatch.setenv('AES_PREVIOUS_KEYS', f'0:{base64.b64encode(old_key).decode()}')
+
+def test_previous_keys_still_decrypt(monkeypatch, aes_key):
+    """Test values written before a key rotation decrypt next to new ones"""
+    old_text, old_record = encrypt_data('12.5'), encrypt_records([(1.0, 2.0)])[0]
+    _rotate_to(monkeypatch, aes_key)
+    new_text, new_record = encrypt_data('99.0'), encrypt_records([(3.0, 4.0)])[0]
+
+    assert new_text.startswith('k1:') and text_key_id(new_text) == 1 and text_key_id(old_text) == 0
+    assert record_key_id(new_record) == 1 and record_key_id(old_record) == 0
+    assert decrypt_many([old_text, None, new_text]) == ['12.5', None, '99.0']
+    assert decrypt_records([new_record, old_record]) == [(3.0, 4.0), (1.0, 2.0)]
+
+def test_unknown_key_is_an_error(monkeypatch, aes_key):
+    """Test values under a key that is no longer configured fail loudly"""
+    old_text, old_record = encrypt_data('12.5'), encrypt_records([(1.0, 2.0)])[0]
+    _rotate_to(monkeypatch, aes_key)
+    monkeypatch.delenv('AES_PREVIOUS_KEYS')
+    with pytest.raises(ValueError, match='key 0'):
+        decrypt_data(old_text)
+    with pytest.raises(ValueError, match='key 0'):
+        decrypt_records([old_record])
+
+def test_record_key_id_is_authenticated(monkeypatch, aes_key):
+    """Test relabelling a record with another key id fails authentication, even for the same key"""
+    monkeypatch.setenv('AES_PREVIOUS_KEYS', f'1:{base64.b64encode(aes_key).decode()}')
+    blob = bytearray(encrypt_records([(1.0,)])[0])
+    blob[0] = RECORD_KEYED | 1
+    with pytest.raises(ValueError):
+        decrypt_records([bytes(blob)])
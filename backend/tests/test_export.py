@@ -0,0 +1,197 @@
+"""
+Tests for encrypted export and restore
+"""
+import base64
+import io
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from Crypto.Random import get_random_bytes
+from app import db
+from app.models import Asset, AssetAllocation, Portfolio, User
+from app.services import export
+from app.services.export import export_user, restore_user
+from app.utils.encryption import encrypt_data
+
+PASSPHRASE = 'correct horse battery'
+
+@pytest.fixture
+def household(user):
+    for n in range(2):
+        portfolio = Portfolio(user_id=user.id, name=f'P{n}', description='desc', total_value=100.0 * (n + 1))
+        db.session.add(portfolio)
+        db.session.flush()
+        db.session.add_all([
+            Asset(portfolio_id=portfolio.id, symbol='AAA', name='A', asset_type='stock', quantity=2, price=25, value=50),
+            AssetAllocation(portfolio_id=portfolio.id, symbol='AAA', target_percentage=100, asset_type='stock'),
+        ])
+    # A holding still in the legacy three-column format
+    legacy = Asset(portfolio_id=portfolio.id, symbol='OLD', asset_type='bond')
+    legacy._quantity_encrypted, legacy._price_encrypted, legacy._value_encrypted = (
+        encrypt_data('3.0'), encrypt_data('10.0'), encrypt_data('30.0'))
+    db.session.add(legacy)
+    db.session.commit()
+    return user
+
+def _contents(user_id):
+    portfolios = Portfolio.query.filter_by(user_id=user_id).order_by(Portfolio.id).all()
+    return [
+        (p.name, p.description, p.total_value,
+         [(a.symbol, a.name, a.asset_type, a.holding) for a in p.assets],
+         [(a.symbol, a.target_percentage, a.asset_type) for a in p.allocations])
+        for p in portfolios
+    ]
+
+def _other_user():
+    other = User(firebase_uid='other-uid', email='other@example.com')
+    db.session.add(other)
+    db.session.commit()
+    return other
+
+def test_round_trip(household):
+    """Test an export restores to identical portfolios with a chunked stream"""
+    archive = io.BytesIO()
+    report = export_user(household.id, archive, PASSPHRASE, chunk_size=1)
+    assert report['tables'] == {'user': 1, 'portfolios': 2, 'assets': 3, 'allocations': 2}
+    assert report['rows'] == 8 and report['bytes'] == len(archive.getvalue())
+    assert b'AAA' not in archive.getvalue()
+
+    other = _other_user()
+    archive.seek(0)
+    restored = restore_user(archive, PASSPHRASE, other.id)
+    db.session.commit()
+
+    assert restored['tables'] == report['tables'] and restored['rows_per_second'] >= 0
+    assert _contents(other.id) == _contents(household.id)
+    assert _contents(other.id)[1][3][1] == ('OLD', None, 'bond', (3.0, 10.0, 30.0))
+
+def test_restore_under_new_key(household, monkeypatch):
+    """Test an archive restores as a new user in a deployment with another AES key"""
+    archive = io.BytesIO()
+    export_user(household.id, archive, PASSPHRASE)
+    expected = _contents(household.id)
+    db.session.delete(household)
+    db.session.commit()
+
+    monkeypatch.setenv('AES_ENCRYPTION_KEY', base64.b64encode(get_random_bytes(32)).decode())
+    archive.seek(0)
+    report = restore_user(archive, PASSPHRASE)
+    db.session.commit()
+
+    assert db.session.get(User, report['user_id']).email == 'test@example.com'
+    assert _contents(report['user_id']) == expected
+
+def test_rejects_bad_archives(household):
+    """Test a wrong passphrase or truncated archive restores nothing"""
+    archive = io.BytesIO()
+    export_user(household.id, archive, PASSPHRASE, chunk_size=1)
+    data = archive.getvalue()
+    other = _other_user()
+
+    with pytest.raises(ValueError, match='passphrase'):
+        restore_user(io.BytesIO(data), 'wrong passphrase', other.id)
+    db.session.rollback()
+    with pytest.raises(ValueError, match='truncated'):
+        restore_user(io.BytesIO(data[:-40]), PASSPHRASE, other.id)
+    db.session.rollback()
+    with pytest.raises(ValueError, match='archive'):
+        restore_user(io.BytesIO(b'not an archive at all'), PASSPHRASE, other.id)
+    db.session.rollback()
+    assert Portfolio.query.filter_by(user_id=other.id).count() == 0
+
+def test_rejects_chunks_that_inflate_too_far(household, monkeypatch):
+    """Test decompression stops at MAX_CHUNK_BYTES instead of inflating a whole frame"""
+    archive = io.BytesIO()
+    export_user(household.id, archive, PASSPHRASE)
+    monkeypatch.setattr(export, 'MAX_CHUNK_BYTES', 64)
+    with pytest.raises(ValueError, match='larger than 64 bytes'):
+        restore_user(io.BytesIO(archive.getvalue()), PASSPHRASE, _other_user().id)
+
+def _forged(*chunks):
+    """An archive sealed with PASSPHRASE around the given (table, rows) chunks"""
+    salt = get_random_bytes(export.SALT_SIZE)
+    key = export.archive_key(PASSPHRASE, salt)
+    counts = {table: 0 for table in export.TABLES}
+    for table, rows in chunks:
+        counts[table] += len(rows)
+    frames = [{'table': 'manifest', 'rows': [{'version': export.ARCHIVE_VERSION}]}]
+    frames += [{'table': table, 'rows': rows} for table, rows in chunks]
+    frames.append({'table': 'end', 'rows': [{'tables': counts}]})
+    return export.MAGIC + salt + b''.join(export._seal(key, i, frame) for i, frame in enumerate(frames))
+
+PORTFOLIO = ('portfolios', [{'id': 7, 'name': 'P', 'description': None, 'total_value': 10, 'created_at': None}])
+
+def _allocation(**row):
+    return {'portfolio_id': 7, 'symbol': 'AAA', 'target_percentage': 50, 'asset_type': 'stock', **row}
+
+def _asset(**row):
+    return {'portfolio_id': 7, 'symbol': 'AAA', 'name': None, 'asset_type': 'stock',
+            'quantity': 1, 'price': 1, 'value': 1, **row}
+
+@pytest.mark.parametrize('chunk', [
+    ('allocations', [_allocation(), _allocation()]),
+    ('allocations', [_allocation(target_percentage=150)]),
+    ('allocations', [_allocation(target_percentage='half')]),
+    ('allocations', [_allocation(portfolio_id=8)]),
+    ('assets', [_asset(portfolio_id=8)]),
+    ('assets', {}),
+    ('assets', [_asset(symbol={'x': 1})]),
+    ('assets', [_asset(symbol='X' * 21)]),
+    ('assets', [_asset(quantity='abc')]),
+    ('assets', [_asset(price=float('inf'))]),
+    ('assets', [_asset(value=True)]),
+    ('portfolios', [{'id': 8, 'name': 'Q', 'description': None, 'total_value': 'abc', 'created_at': None}]),
+    ('portfolios', [{'id': 8, 'name': None, 'description': None, 'total_value': 1, 'created_at': None}]),
+    ('portfolios', [{'id': 8, 'name': 'Q', 'description': ['d'], 'total_value': 1, 'created_at': None}]),
+    ('user', [['uid']]),
+    ('user', [['uid', 7, None]]),
+])
+def test_rejects_malformed_rows(user, chunk):
+    """Test invalid, unmapped or duplicate archived rows are reported as a corrupt archive"""
+    with pytest.raises(ValueError, match='Archive is corrupt'):
+        restore_user(io.BytesIO(_forged(PORTFOLIO, chunk)), PASSPHRASE, user.id)
+    db.session.rollback()
+    assert Portfolio.query.filter_by(user_id=user.id).count() == 0
+
+def test_restored_allocations_keep_known_columns(user):
+    """Test archived allocation rows are rebuilt from known columns only"""
+    archive = _forged(PORTFOLIO, ('allocations', [_allocation(id=99, user_id=12345)]))
+    restore_user(io.BytesIO(archive), PASSPHRASE, user.id)
+    db.session.commit()
+    allocation = AssetAllocation.query.one()
+    assert allocation.id != 99
+    assert (allocation.symbol, allocation.target_percentage) == ('AAA', 50)
+
+def test_process_pool_export(household):
+    """Test chunks encoded and decoded in pool processes"""
+    archive = io.BytesIO()
+    with ProcessPoolExecutor(2) as pool:
+        export_user(household.id, archive, PASSPHRASE, chunk_size=1, executor=pool)
+        other = _other_user()
+        archive.seek(0)
+        restore_user(archive, PASSPHRASE, other.id, executor=pool)
+    db.session.commit()
+    assert _contents(other.id) == _contents(household.id)
+
+def test_export_endpoints(client, auth_headers, household):
+    """Test downloading an archive and restoring it into the same account"""
+    assert client.post('/api/export', json={'passphrase': 'short'}, headers=auth_headers).status_code == 400
+
+    response = client.post('/api/export', json={'passphrase': PASSPHRASE}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/octet-stream'
+
+    restore = client.post('/api/export/restore', data=response.data,
+                          headers={**auth_headers, 'X-Archive-Passphrase': PASSPHRASE})
+    assert restore.status_code == 201
+    assert restore.get_json()['tables']['assets'] == 3
+    assert Portfolio.query.filter_by(user_id=household.id).count() == 4
+
+    bad = client.post('/api/export/restore', data=response.data[:-10],
+                      headers={**auth_headers, 'X-Archive-Passphrase': PASSPHRASE})
+    assert bad.status_code == 400
+
+    duplicate = _forged(PORTFOLIO, ('allocations', [_allocation(), _allocation()]))
+    bad = client.post('/api/export/restore', data=duplicate,
+                      headers={**auth_headers, 'X-Archive-Passphrase': PASSPHRASE})
+    assert bad.status_code == 400
+    assert Portfolio.query.filter_by(user_id=household.id).count() == 4
@@ -0,0 +1,186 @@
+"""
+Tests for the background job queue
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+import pytest
+from app import create_app, db
+from app.models import Asset, AssetAllocation, Job, Portfolio, User
+from app.services import jobs
+from app.services.jobs import JobFailed, LeaseLost, Worker, claim, enqueue, fail, finish, renew, requeue_stale
+
+class InlineExecutor:
+    """Runs submitted calls right away, on the test's single SQLite connection"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+@pytest.fixture
+def inline(app, monkeypatch):
+    monkeypatch.setattr(jobs, '_process_app', app)
+    return InlineExecutor()
+
+def _holdings(portfolio):
+    db.session.add_all([
+        Asset(portfolio_id=portfolio.id, symbol='AAA', quantity=1, price=75, value=75),
+        Asset(portfolio_id=portfolio.id, symbol='BBB', quantity=1, price=25, value=25),
+        AssetAllocation(portfolio_id=portfolio.id, symbol='AAA', target_percentage=50),
+        AssetAllocation(portfolio_id=portfolio.id, symbol='BBB', target_percentage=50),
+    ])
+    portfolio.total_value = 100.0
+    db.session.commit()
+
+def test_enqueue_dedupes_and_runs(client, auth_headers, portfolio, inline):
+    """Test a queued rebalance is deduplicated by key, run by the worker and reported"""
+    _holdings(portfolio)
+    body = {'kind': 'rebalance', 'payload': {'portfolio_id': portfolio.id}, 'dedupe_key': 'rebalance'}
+    first = client.post('/api/jobs', json=body, headers=auth_headers)
+    second = client.post('/api/jobs', json=body, headers=auth_headers)
+    assert first.status_code == 202 and second.status_code == 200
+    assert first.get_json()['id'] == second.get_json()['id']
+    assert first.get_json()['status'] == 'queued'
+
+    assert Worker(inline, slots=2, poll_interval=0).run(once=True) == 1
+
+    job = client.get(f"/api/jobs/{first.get_json()['id']}", headers=auth_headers).get_json()
+    assert job['status'] == 'succeeded' and job['attempts'] == 1
+    assert {r['symbol']: r['action'] for r in job['result']['recommendations']} == {'AAA': 'SELL', 'BBB': 'BUY'}
+    # The key is free again once the job finished
+    assert client.post('/api/jobs', json=body, headers=auth_headers).status_code == 202
+    assert len(client.get('/api/jobs?status=queued', headers=auth_headers).get_json()) == 1
+
+def test_enqueue_validation(client, auth_headers, portfolio):
+    """Test unknown kinds, operator kinds and foreign portfolios are rejected"""
+    assert client.post('/api/jobs', json={'kind': 'snapshot'}, headers=auth_headers).status_code == 400
+    assert client.post('/api/jobs', json={'kind': 'rebalance', 'payload': {'portfolio_id': portfolio.id + 1}},
+                       headers=auth_headers).status_code == 404
+    assert client.get('/api/jobs/999', headers=auth_headers).status_code == 404
+
+def test_retries_with_backoff(app, user, inline, monkeypatch):
+    """Test failed attempts are retried after a backoff until max_attempts"""
+    calls = []
+
+    def flaky(user_id, payload):
+        calls.append(user_id)
+        raise RuntimeError('upstream unavailable')
+
+    monkeypatch.setitem(jobs.HANDLERS, 'flaky', flaky)
+    job, _ = enqueue('flaky', user_id=user.id, max_attempts=2)
+    now = datetime.utcnow()
+
+    worker = Worker(inline, slots=1, poll_interval=0)
+    assert worker.run(once=True) == 0
+    db.session.refresh(job)
+    assert job.status == 'queued' and job.attempts == 1
+    assert job.run_after == pytest.approx(now + timedelta(seconds=app.config['JOB_RETRY_BACKOFF']), abs=timedelta(seconds=5))
+    assert 'RuntimeError: upstream unavailable' in job.error
+    assert claim('test', 1, 2, now) == []
+
+    claimed = claim('test', 1, 2, job.run_after)
+    assert fail(claimed[0]['id'], 'again', 'test', claimed[0]['attempt']) is False
+    db.session.refresh(job)
+    assert (job.status, job.attempts) == ('failed', 2)
+
+def test_job_failed_is_not_retried(user, inline, monkeypatch):
+    """Test handlers can fail a job permanently"""
+    def broken(user_id, payload):
+        raise JobFailed('Portfolio not found')
+
+    monkeypatch.setitem(jobs.HANDLERS, 'broken', broken)
+    job, _ = enqueue('broken', user_id=user.id)
+    assert Worker(inline, slots=1, poll_interval=0).run(once=True) == 1
+    db.session.refresh(job)
+    assert (job.status, job.error, job.attempts) == ('failed', 'Portfolio not found', 1)
+
+def test_claim_caps_running_jobs_per_user(user):
+    """Test a claim skips users at their concurrency cap but not other users"""
+    other = User(firebase_uid='other-uid', email='other@example.com')
+    db.session.add(other)
+    db.session.commit()
+    mine = [enqueue('repair_totals', user_id=user.id)[0].id for _ in range(3)]
+    theirs = enqueue('repair_totals', user_id=other.id)[0].id
+
+    claimed = claim('test', 5, per_user_limit=2)
+    assert [j['id'] for j in claimed] == mine[:2] + [theirs]
+    assert claim('test', 5, per_user_limit=2) == []
+    assert db.session.get(Job, mine[2]).status == 'queued'
+
+def test_stale_jobs_requeued(user):
+    """Test jobs held by a dead worker go back to the queue"""
+    job, _ = enqueue('repair_totals', user_id=user.id)
+    claim('test', 1, 2)
+    assert requeue_stale(60) == 0
+    assert requeue_stale(60, now=datetime.utcnow() + timedelta(minutes=5)) == 1
+    db.session.refresh(job)
+    assert (job.status, job.locked_by) == ('queued', None)
+
+def test_renewed_leases_survive_and_lost_ones_are_dropped(user):
+    """Test renewal keeps a long job claimed, and a worker that lost its lease can't record a result"""
+    job, _ = enqueue('repair_totals', user_id=user.id)
+    now = datetime.utcnow()
+    first = claim('worker-a', 1, 2, now)[0]
+    assert renew('worker-a', [(job.id, first['attempt'])], now + timedelta(seconds=50)) == 1
+    assert requeue_stale(60, now=now + timedelta(seconds=90)) == 0
+
+    # worker-a stops renewing: the job is requeued and claimed again
+    assert requeue_stale(60, now=now + timedelta(seconds=200)) == 1
+    second = claim('worker-b', 1, 2, now + timedelta(seconds=200))[0]
+    assert (second['id'], second['attempt']) == (job.id, first['attempt'] + 1)
+
+    assert renew('worker-a', [(job.id, first['attempt'])]) == 0
+    with pytest.raises(LeaseLost):
+        finish(job.id, {'drifted': []}, 'worker-a', first['attempt'])
+    with pytest.raises(LeaseLost):
+        fail(job.id, 'late failure', 'worker-a', first['attempt'])
+    db.session.refresh(job)
+    assert (job.status, job.locked_by) == ('running', 'worker-b')
+
+    finish(job.id, {'drifted': []}, 'worker-b', second['attempt'])
+    db.session.refresh(job)
+    assert (job.status, job.result) == ('succeeded', {'drifted': []})
+
+def test_worker_drops_completions_of_lost_leases(user):
+    """Test the worker logs and drops a result whose lease expired while it ran"""
+    job, _ = enqueue('repair_totals', user_id=user.id)
+    claimed = claim('worker-a', 1, 2)[0]
+    requeue_stale(0, now=datetime.utcnow() + timedelta(seconds=1))
+    claim('worker-b', 1, 2, datetime.utcnow() + timedelta(seconds=1))
+
+    messages = []
+    future = Future()
+    future.set_result({'drifted': []})
+    Worker(None, 1, worker_id='worker-a', log=messages.append)._complete(claimed, future)
+
+    assert 'lost its lease' in messages[0]
+    db.session.refresh(job)
+    assert (job.status, job.locked_by) == ('running', 'worker-b')
+
+def test_process_pool_worker(app, tmp_path):
+    """Test jobs run in pool processes that build their own app"""
+    config = {**app.config, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'jobs.db'}"}
+    config.pop('SQLALCHEMY_ENGINE_OPTIONS')
+    file_app = create_app(config)
+    with file_app.app_context():
+        db.create_all()
+        user = User(firebase_uid='pool-uid', email='pool@example.com')
+        db.session.add(user)
+        db.session.flush()
+        portfolio = Portfolio(user_id=user.id, name='Pool', total_value=0.0)
+        db.session.add(portfolio)
+        db.session.commit()
+        _holdings(portfolio)
+        job, _ = enqueue('repair_totals', {'repair': True}, user_id=user.id)
+
+        pool_config = {key: config[key] for key in ('SQLALCHEMY_DATABASE_URI', 'QUOTE_PROVIDER', 'TESTING')}
+        with ProcessPoolExecutor(1, initializer=jobs.init_process, initargs=(pool_config,)) as pool:
+            assert Worker(pool, slots=1, poll_interval=0.05).run(once=True) == 1
+
+        db.session.refresh(job)
+        assert job.status == 'succeeded'
+        assert job.result == {'drifted': []}
+        db.session.remove()
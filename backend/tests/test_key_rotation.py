@@ -0,0 +1,98 @@
+"""
+Tests for online encryption key rotation
+"""
+import base64
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from Crypto.Random import get_random_bytes
+from sqlalchemy import select
+from app import db
+from app.models import Asset, Job, KeyRotationCheckpoint, Portfolio, PortfolioSnapshot
+from app.services.key_rotation import RateLimiter, rotate, rotate_table, verify
+from app.utils.encryption import encrypt_data, text_key_id
+
+@pytest.fixture
+def old_data(user, monkeypatch):
+    """Portfolios, holdings (one legacy) and a job written under key 0, then a rotation to key 1"""
+    for n in range(3):
+        portfolio = Portfolio(user_id=user.id, name=f'P{n}', description='', total_value=100.0 * (n + 1))
+        db.session.add(portfolio)
+        db.session.flush()
+        db.session.add(Asset(portfolio_id=portfolio.id, symbol='AAA', name='A', asset_type='stock',
+                             quantity=n + 1, price=10, value=10 * (n + 1)))
+    legacy = Asset(portfolio_id=portfolio.id, symbol='OLD', asset_type='bond')
+    legacy._quantity_encrypted, legacy._price_encrypted, legacy._value_encrypted = (
+        encrypt_data('3.0'), encrypt_data('10.0'), encrypt_data('30.0'))
+    job = Job(user_id=user.id, kind='rebalance', status='queued', max_attempts=3)
+    job.payload = {'portfolio_id': portfolio.id}
+    db.session.add_all([legacy, job])
+    db.session.commit()
+
+    monkeypatch.setenv('AES_PREVIOUS_KEYS', f"0:{os.environ['AES_ENCRYPTION_KEY']}")
+    monkeypatch.setenv('AES_ENCRYPTION_KEY', base64.b64encode(get_random_bytes(32)).decode())
+    monkeypatch.setenv('AES_ENCRYPTION_KEY_ID', '1')
+    db.session.expire_all()
+    return user
+
+def _contents():
+    db.session.expire_all()
+    portfolios = Portfolio.query.order_by(Portfolio.id).all()
+    return ([(p.name, p.total_value, [(a.symbol, a.quantity, a.price, a.value) for a in p.assets])
+             for p in portfolios], [j.payload for j in Job.query.all()])
+
+def test_rotation_reencrypts_every_table(old_data, monkeypatch):
+    """Test a rotation leaves nothing under the old key and the old key can be dropped"""
+    before = _contents()
+    stale = verify()
+    assert stale['portfolios'] == {0: 3} and stale['assets'] == {0: 6} and stale['jobs'] == {0: 1}
+    assert stale['portfolio_snapshots'] and stale['portfolio_value_buckets']
+
+    with ProcessPoolExecutor(2) as pool:
+        reports = rotate(chunk_size=2, executor=pool, workers=2)
+    assert all(r['finished'] and r['unreadable'] == 0 for r in reports)
+    assert {r['table']: r['rotated'] for r in reports}['assets'] == 6
+    assert all(counts == {} for counts in verify().values())
+
+    monkeypatch.delenv('AES_PREVIOUS_KEYS')
+    assert _contents() == before
+    assert all(text_key_id(v) == 1 for v in db.session.execute(select(PortfolioSnapshot._value_encrypted)).scalars())
+
+def test_rotation_resumes_from_checkpoint(old_data):
+    """Test an interrupted rotation continues after the last committed chunk"""
+    report = rotate_table('assets', chunk_size=2, max_chunks=1)
+    assert not report['finished'] and report['scanned'] == 2
+    checkpoint = db.session.get(KeyRotationCheckpoint, (1, 'assets'))
+    assert checkpoint.last_id == 2 and checkpoint.finished_at is None
+
+    report = rotate_table('assets', chunk_size=2)
+    assert report['finished'] and report['scanned'] == 2 and report['rotated'] == 4
+    assert verify(['assets']) == {'assets': {}}
+    assert rotate_table('assets')['scanned'] == 0
+
+def test_rotation_never_overwrites_concurrent_writes(old_data):
+    """Test a value changed by the app while its chunk is re-encrypted keeps the app's value"""
+    class WritingExecutor:
+        """Runs the re-encryption, but lets the 'app' update a portfolio first"""
+        def map(self, fn, *iterables):
+            db.session.execute(Portfolio.__table__.update().where(Portfolio.id == 1)
+                               .values(total_value_encrypted=encrypt_data('555.0')))
+            db.session.commit()
+            return map(fn, *iterables)
+
+    rotate_table('portfolios', executor=WritingExecutor(), workers=2)
+    db.session.expire_all()
+    assert db.session.get(Portfolio, 1).total_value == 555.0
+    assert db.session.get(Portfolio, 2).total_value == 200.0
+    assert verify(['portfolios']) == {'portfolios': {}}
+
+def test_rate_limiter_paces_rows():
+    """Test the limiter sleeps off work done ahead of the rate"""
+    now, slept = [0.0], []
+    limiter = RateLimiter(100, clock=lambda: now[0], sleep=lambda s: (slept.append(s), now.__setitem__(0, now[0] + s)))
+    limiter.wait(50)
+    limiter.wait(50)
+    assert slept == [0.5, 0.5]
+    now[0] += 5  # idle time is not banked as credit
+    limiter.wait(10)
+    assert slept[-1] == pytest.approx(0.1)
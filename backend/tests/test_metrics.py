@@ -0,0 +1,59 @@
+"""
+Tests for the metrics endpoint and sampled logging
+"""
+import logging
+from app.utils.log_sampling import SampledLogger
+from app.utils.metrics import CRYPTO_CALLS, REQUEST_DURATION, SQL_STATEMENTS, Histogram
+
+def test_metrics_cover_routes_sql_and_crypto(client, auth_headers, portfolio):
+    """Test a request shows up under its route template with SQL and crypto totals"""
+    route = '/api/portfolio/<int:portfolio_id>'
+    before = (REQUEST_DURATION.count('GET', route, '200'), SQL_STATEMENTS.value(), CRYPTO_CALLS.value('decrypt_text'))
+
+    response = client.get(f'/api/portfolio/{portfolio.id}', headers=auth_headers)
+    assert response.status_code == 200
+
+    assert REQUEST_DURATION.count('GET', route, '200') == before[0] + 1
+    assert SQL_STATEMENTS.value() >= before[1] + int(response.headers['X-SQL-Query-Count'])
+    assert CRYPTO_CALLS.value('decrypt_text') > before[2]
+
+    body = client.get('/api/metrics').get_data(as_text=True)
+    assert '# TYPE moneylab_http_request_duration_seconds histogram' in body
+    assert 'moneylab_http_request_duration_seconds_bucket{method="GET",route="/api/portfolio/<int:portfolio_id>",status="200",le="+Inf"}' in body
+    assert 'moneylab_sql_statements_total ' in body
+    assert 'moneylab_crypto_seconds_total{operation="decrypt_text"}' in body
+    assert 'moneylab_cache_lookups{cache="quotes",result="hits"}' in body
+
+def test_metrics_token(app, client):
+    """Test the endpoint can be put behind a bearer token"""
+    app.config['METRICS_TOKEN'] = 'scrape'
+    assert client.get('/api/metrics').status_code == 401
+    assert client.get('/api/metrics', headers={'Authorization': 'Bearer scrape'}).status_code == 200
+
+def test_histogram_buckets_are_cumulative():
+    """Test bucket counts, sum and count in the text format"""
+    histogram = Histogram('h', 'test', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.samples() == [
+        'h_bucket{le="0.1"} 2',
+        'h_bucket{le="1"} 3',
+        'h_bucket{le="+Inf"} 4',
+        'h_sum 3.65',
+        'h_count 4',
+    ]
+
+def test_sampled_logger_keeps_one_in_n(caplog):
+    """Test repeated messages are sampled per template"""
+    log = SampledLogger(logging.getLogger('test.sampled'), every=10)
+    with caplog.at_level(logging.INFO, logger='test.sampled'):
+        for n in range(25):
+            log.info("request %d", n)
+        log.info("other")
+    assert [r.getMessage() for r in caplog.records] == ['request 0', 'request 10', 'request 20', 'other']
+
+def test_token_data_not_logged(client, auth_headers, caplog):
+    """Test listing portfolios doesn't log the decoded token"""
+    with caplog.at_level(logging.DEBUG):
+        client.get('/api/portfolio', headers=auth_headers)
+    assert not any('Token data' in r.getMessage() for r in caplog.records)
@@ -0,0 +1,82 @@
+"""
+Tests for schema migrations and the indexes behind the hot queries
+"""
+import pytest
+from sqlalchemy import create_engine, inspect, select, text
+from app import db
+from app.migrations import current_version, discover, migrate
+from app.models import Asset, AssetAllocation, Portfolio
+
+def _indexes(engine):
+    inspector = inspect(engine)
+    return {
+        table: {(i['name'], tuple(i['column_names']), bool(i['unique'])) for i in inspector.get_indexes(table)}
+        for table in inspector.get_table_names() if table != 'schema_version'
+    }
+
+def test_fresh_database_matches_models(app, tmp_path):
+    """Test migrating an empty database gives the schema the models declare"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    applied = migrate(engine, log=lambda _: None)
+    assert applied == [m.VERSION for m in discover()]
+    assert migrate(engine, log=lambda _: None) == []
+
+    reference = create_engine(f"sqlite:///{tmp_path / 'reference.db'}")
+    db.metadata.create_all(reference)
+    assert _indexes(engine) == _indexes(reference)
+
+def test_legacy_database_is_upgraded(app, tmp_path):
+    """Test a database from before migrations gets the missing columns and indexes"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for index in ('ix_portfolios_user_id', 'ix_assets_portfolio_id', 'uq_asset_allocations_portfolio_symbol'):
+            conn.execute(text(f'DROP INDEX {index}'))
+        conn.execute(text('ALTER TABLE portfolios DROP COLUMN version'))
+        conn.execute(text('ALTER TABLE assets DROP COLUMN holding_encrypted'))
+        conn.execute(text("INSERT INTO users (id, firebase_uid, email) VALUES (1, 'u', 'u@example.com')"))
+        conn.execute(text("INSERT INTO portfolios (id, user_id, name) VALUES (1, 1, 'Main')"))
+        conn.execute(text(
+            "INSERT INTO asset_allocations (portfolio_id, symbol, target_percentage) "
+            "VALUES (1, 'VTI', 50), (1, 'VTI', 60), (1, 'BND', 40)"
+        ))
+
+    migrate(engine, log=lambda _: None)
+
+    with engine.connect() as conn:
+        assert current_version(conn) == discover()[-1].VERSION
+        assert conn.execute(text('SELECT version FROM portfolios')).scalar() == 1
+        targets = conn.execute(text('SELECT symbol, target_percentage FROM asset_allocations ORDER BY symbol')).all()
+        assert [tuple(t) for t in targets] == [('BND', 40), ('VTI', 60)]
+    columns = {c['name'] for c in inspect(engine).get_columns('assets')}
+    assert 'holding_encrypted' in columns
+    reference = create_engine(f"sqlite:///{tmp_path / 'reference.db'}")
+    db.metadata.create_all(reference)
+    assert _indexes(engine) == _indexes(reference)
+
+def _plan(statement):
+    """Query plan lines for a statement on the test database"""
+    compiled = statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as conn:
+            # Tiny test tables would otherwise always be scanned sequentially
+            conn.execute(text('SET LOCAL enable_seqscan = off'))
+            return [row[0] for row in conn.execute(text(f'EXPLAIN {compiled}'))]
+    with db.engine.connect() as conn:
+        return [row[-1] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+
+@pytest.mark.parametrize('name, statement, index', [
+    ('portfolios of a user', select(Portfolio).where(Portfolio.user_id == 1), 'ix_portfolios_user_id'),
+    ('assets of a portfolio', select(Asset).where(Asset.portfolio_id == 1), 'ix_assets_portfolio_id'),
+    ('allocations of a portfolio', select(AssetAllocation).where(AssetAllocation.portfolio_id == 1),
+     'uq_asset_allocations_portfolio_symbol'),
+    ('allocation by symbol', select(AssetAllocation).where(
+        AssetAllocation.portfolio_id == 1, AssetAllocation.symbol == 'VTI'), 'uq_asset_allocations_portfolio_symbol'),
+    ('owned children join', select(Portfolio.version, Asset).outerjoin(Asset, Asset.portfolio_id == Portfolio.id)
+     .where(Portfolio.id == 1, Portfolio.user_id == 1), 'ix_assets_portfolio_id'),
+])
+def test_hot_queries_use_indexes(app, name, statement, index):
+    """Test the ownership and foreign-key lookups are index scans, not table scans"""
+    plan = _plan(statement)
+    assert any(index in line for line in plan), (name, plan)
+    assert not any(line.startswith('SCAN') and 'INDEX' not in line for line in plan), (name, plan)
@@ -0,0 +1,95 @@
+"""
+Unit tests for encrypted model columns
+"""
+from app import db
+from app.models import Asset, AssetAllocation
+from app.utils.encryption import encrypt_data
+from migrate_asset_records import migrate_asset_records
+
+def _legacy_asset(portfolio, symbol, quantity, price, value):
+    """Insert an asset the way rows were stored before packed records"""
+    asset = Asset(portfolio_id=portfolio.id, symbol=symbol)
+    asset._quantity_encrypted = encrypt_data(str(quantity))
+    asset._price_encrypted = encrypt_data(str(price))
+    asset._value_encrypted = encrypt_data(str(value))
+    db.session.add(asset)
+    db.session.commit()
+    return asset
+
+def test_asset_properties_use_packed_record(portfolio):
+    """Test the model properties read and write a single packed record"""
+    asset = Asset(portfolio_id=portfolio.id, symbol='AAPL', quantity=10, price=150.5, value=1505)
+    db.session.add(asset)
+    db.session.commit()
+
+    assert asset._holding_encrypted
+    assert asset._quantity_encrypted is None
+    assert (asset.quantity, asset.price, asset.value) == (10.0, 150.5, 1505.0)
+
+    asset.price = 200
+    assert asset.holding == (10.0, 200.0, 1505.0)
+
+def test_legacy_rows_are_readable_and_migrated(portfolio):
+    """Test unmigrated rows still decrypt and the migration converts them"""
+    legacy = _legacy_asset(portfolio, 'MSFT', 4, 300.0, 1200.0)
+    assert legacy.to_dict()['value'] == 1200.0
+
+    assert migrate_asset_records(chunk_size=1, log=lambda _: None) == 1
+    db.session.expire_all()
+
+    asset = db.session.get(Asset, legacy.id)
+    assert asset._holding_encrypted and asset._value_encrypted is None
+    assert Asset.bulk_decrypt([asset]) == [(4.0, 300.0, 1200.0)]
+    assert migrate_asset_records(log=lambda _: None) == 0
+
+class _DecryptCounter:
+    """Counts ciphertexts passed to the model's decrypt functions"""
+
+    def __init__(self, monkeypatch):
+        import app.models.portfolio as models
+        self.values = 0
+        for name in ('decrypt_records', 'decrypt_many'):
+            monkeypatch.setattr(models, name, self._wrap(getattr(models, name)))
+
+    def _wrap(self, fn):
+        def counted(values):
+            values = list(values)
+            self.values += sum(1 for v in values if v)
+            return fn(values)
+        return counted
+
+def test_one_decrypt_per_field_per_request(client, auth_headers, portfolio, monkeypatch):
+    """Test repeated reads within a request hit the plaintext memo"""
+    for n in range(5):
+        db.session.add(Asset(portfolio_id=portfolio.id, symbol=f'S{n}', quantity=1, price=2, value=2))
+    db.session.add(AssetAllocation(portfolio_id=portfolio.id, symbol='S0', target_percentage=100))
+    portfolio.total_value = 10
+    db.session.commit()
+    portfolio_id = portfolio.id
+    db.session.remove()
+
+    counter = _DecryptCounter(monkeypatch)
+    # Reads the total twice and every holding's value (as a dict and again for metrics)
+    response = client.get(f'/api/portfolio/{portfolio_id}/rebalance', headers=auth_headers)
+    assert response.status_code == 200
+    assert counter.values == 1 + 5
+
+    counter.values = 0
+    client.get(f'/api/portfolio/{portfolio_id}', headers=auth_headers)
+    assert counter.values == 1 + 5
+
+def test_memo_follows_writes_and_expiry(portfolio, monkeypatch):
+    """Test setters update the memo and expiry drops it"""
+    asset = Asset(portfolio_id=portfolio.id, symbol='AAPL', quantity=1, price=5, value=5)
+    db.session.add(asset)
+
+    counter = _DecryptCounter(monkeypatch)
+    asset.value = 7
+    assert (asset.quantity, asset.value) == (1.0, 7.0)
+    assert counter.values == 0
+
+    db.session.commit()
+    assert asset.value == 7.0
+    assert asset.price == 5.0
+    assert counter.values == 1
+    assert 'memo' not in repr(asset) and '7.0' not in repr(asset)
@@ -0,0 +1,43 @@
+"""
+Tests for pool configuration, worker warmup and the readiness check
+"""
+from app import create_app, db
+from app.utils.pooling import engine_options, pool_status, warm_up
+
+def test_engine_options_size_pool_for_server_databases(app):
+    """Test pool sizing applies to Postgres but not to SQLite"""
+    config = {**app.config, 'SQLALCHEMY_DATABASE_URI': 'postgresql://u:p@db/money',
+              'DB_POOL_SIZE': 8, 'DB_MAX_OVERFLOW': 2}
+    options = engine_options(config)
+    assert (options['pool_size'], options['max_overflow'], options['pool_pre_ping']) == (8, 2, True)
+    assert options['pool_recycle'] == app.config['DB_POOL_RECYCLE']
+    assert engine_options(app.config) == {'pool_pre_ping': True}
+
+def test_pool_sizes_respect_connection_budget():
+    """Test per-worker pools follow the thread count and fit a connection budget"""
+    from serve import pool_sizes
+    assert pool_sizes(workers=4, threads=8) == (8, 2)
+    assert pool_sizes(workers=4, threads=8, max_connections=20) == (5, 0)
+
+def test_readiness_reports_pool_saturation(app, tmp_path):
+    """Test readiness turns 503 once the pool is saturated"""
+    file_app = create_app({**app.config, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'pool.db'}",
+                           'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': 2, 'max_overflow': 0}})
+    client = file_app.test_client()
+
+    with file_app.app_context():
+        report = warm_up(file_app)
+        assert report['connections'] == 2
+        assert pool_status(db.engine)['idle'] == 2
+
+        ready = client.get('/api/health/ready')
+        assert ready.status_code == 200
+        assert ready.get_json()['pool']['warmed_up'] is True
+
+        held = [db.engine.connect() for _ in range(2)]
+        busy = client.get('/api/health/ready')
+        for conn in held:
+            conn.close()
+        assert busy.status_code == 503
+        assert busy.get_json()['pool']['saturation'] == 1.0
+        db.engine.dispose()
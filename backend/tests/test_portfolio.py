@@ -0,0 +1,244 @@
+"""
+Tests for portfolio routes
+"""
+import json
+import pytest
+from app import db
+from app.models import Asset, AssetAllocation, Portfolio
+from app.utils.query_stats import track_queries
+
+def _add_holdings(portfolio, count):
+    for n in range(count):
+        db.session.add(Asset(portfolio_id=portfolio.id, symbol=f'SYM{n}', quantity=1, price=10, value=10))
+        db.session.add(AssetAllocation(portfolio_id=portfolio.id, symbol=f'SYM{n}', target_percentage=100 / count))
+    portfolio.total_value = 10.0 * count
+    db.session.commit()
+
+def _query_count(response):
+    assert response.status_code == 200
+    return int(response.headers['X-SQL-Query-Count'])
+
+@pytest.mark.parametrize('holdings', [1, 40])
+def test_read_endpoints_use_fixed_query_counts(client, auth_headers, portfolio, holdings):
+    """Test portfolio reads don't issue a query per holding (N+1)"""
+    _add_holdings(portfolio, holdings)
+
+    detail = client.get(f'/api/portfolio/{portfolio.id}', headers=auth_headers)
+    assert _query_count(detail) == 3
+    assert len(detail.get_json()['assets']) == holdings
+
+    # Version lookup plus the three holdings reads, then cache hits need only the lookup
+    rebalance = client.get(f'/api/portfolio/{portfolio.id}/rebalance', headers=auth_headers)
+    assert _query_count(rebalance) == 4
+    rebalance = client.get(f'/api/portfolio/{portfolio.id}/rebalance', headers=auth_headers)
+    assert _query_count(rebalance) == 1
+
+    assets = client.get(f'/api/assets/portfolio/{portfolio.id}/assets', headers=auth_headers)
+    assert _query_count(assets) == 1
+    assert len(assets.get_json()) == holdings
+
+    allocations = client.get(f'/api/assets/portfolio/{portfolio.id}/allocations', headers=auth_headers)
+    assert _query_count(allocations) == 1
+
+def test_ownership_checked_for_child_lists(client, auth_headers, portfolio):
+    """Test empty and foreign portfolios are told apart in the single-query path"""
+    response = client.get(f'/api/assets/portfolio/{portfolio.id}/assets', headers=auth_headers)
+    assert response.get_json() == []
+
+    response = client.get(f'/api/assets/portfolio/{portfolio.id + 1}/assets', headers=auth_headers)
+    assert response.status_code == 404
+
+def test_track_queries_counts_statements(portfolio):
+    """Test the query counter outside of a request"""
+    portfolio_id = portfolio.id
+    with track_queries() as stats:
+        Asset.query.filter_by(portfolio_id=portfolio_id).all()
+        AssetAllocation.query.filter_by(portfolio_id=portfolio_id).all()
+    assert stats.count == 2
+    assert stats.duration > 0
+
+def test_batch_rebalance_covers_all_portfolios(client, auth_headers, user, portfolio):
+    """Test the batch endpoint rebalances every portfolio in fixed queries"""
+    _add_holdings(portfolio, 4)
+    other = Portfolio(user_id=user.id, name='Empty', total_value=0.0)
+    db.session.add(other)
+    db.session.commit()
+
+    response = client.post('/api/portfolio/rebalance/batch', headers=auth_headers)
+    results = response.get_json()['portfolios']
+
+    assert _query_count(response) == 3
+    assert [r['portfolio_id'] for r in results] == [portfolio.id, other.id]
+    assert len(results[0]['recommendations']) == 4
+    assert all(r['action'] == 'HOLD' for r in results[0]['recommendations'])
+    assert results[1]['recommendations'] == []
+
+def test_consolidated_aggregates_household(client, auth_headers, user, portfolio):
+    """Test holdings are combined by symbol across portfolios in one joined read"""
+    db.session.add_all([
+        Asset(portfolio_id=portfolio.id, symbol='AAPL', quantity=2, price=150, value=300),
+        Asset(portfolio_id=portfolio.id, symbol='VTI', quantity=1, price=100, value=100),
+    ])
+    other = Portfolio(user_id=user.id, name='IRA', total_value=0.0)
+    empty = Portfolio(user_id=user.id, name='Empty', total_value=0.0)
+    db.session.add_all([other, empty])
+    db.session.flush()
+    db.session.add(Asset(portfolio_id=other.id, symbol='aapl', quantity=4, price=150, value=600))
+    db.session.commit()
+
+    response = client.get('/api/portfolio/consolidated', headers=auth_headers)
+    data = response.get_json()
+
+    assert _query_count(response) == 1
+    assert data['total_value'] == pytest.approx(1000)
+    assert [s['symbol'] for s in data['symbols']] == ['AAPL', 'VTI']
+    aapl = data['symbols'][0]
+    assert aapl['quantity'] == pytest.approx(6)
+    assert aapl['weight'] == pytest.approx(0.9)
+    assert {p['portfolio_id']: p['value'] for p in aapl['portfolios']} == pytest.approx({portfolio.id: 300, other.id: 600})
+    assert [(p['portfolio_id'], p['num_holdings']) for p in data['portfolios']] == [
+        (portfolio.id, 2), (other.id, 1), (empty.id, 0)]
+    assert data['hhi'] == pytest.approx(0.82)
+    assert data['diversification_score'] == 0.18
+
+def test_rebalance_orders_endpoint(client, auth_headers, portfolio):
+    """Test the orders endpoint returns whole-share trades"""
+    _add_holdings(portfolio, 2)
+    response = client.post(
+        f'/api/portfolio/{portfolio.id}/rebalance/orders',
+        json={'cash': 100, 'min_trade': 1},
+        headers=auth_headers
+    )
+    result = response.get_json()
+
+    assert response.status_code == 200
+    assert result['summary']['feasible']
+    assert {o['action'] for o in result['orders']} == {'BUY'}
+    assert all(float(o['shares']).is_integer() for o in result['orders'])
+
+    for body in ({'cash': -1}, {'cash': True}, {'prices': {'SYM0': True}}):
+        response = client.post(f'/api/portfolio/{portfolio.id}/rebalance/orders', json=body, headers=auth_headers)
+        assert response.status_code == 400
+
+def test_portfolios_pagination_and_stream(client, auth_headers, user):
+    """Test keyset pages and NDJSON streaming of a user's portfolios"""
+    for i in range(5):
+        db.session.add(Portfolio(user_id=user.id, name=f'P{i}', total_value=float(i)))
+    db.session.commit()
+
+    first = client.get('/api/portfolio?limit=3', headers={**auth_headers, 'Origin': 'http://localhost:3000'})
+    assert 'X-Next-Cursor' in first.headers['Access-Control-Expose-Headers']
+    second = client.get(f"/api/portfolio?limit=3&after={first.headers['X-Next-Cursor']}", headers=auth_headers)
+    assert [p['name'] for p in first.get_json() + second.get_json()] == [f'P{i}' for i in range(5)]
+    assert 'X-Next-Cursor' not in second.headers
+
+    streamed = client.get('/api/portfolio?stream=ndjson', headers=auth_headers)
+    totals = [json.loads(line)['total_value'] for line in streamed.get_data(as_text=True).splitlines()]
+    assert totals == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+def test_conditional_get_portfolio(client, auth_headers, portfolio, monkeypatch):
+    """Test If-None-Match gets a 304 from one version lookup with no decryption"""
+    portfolio_id = portfolio.id
+    first = client.get(f'/api/portfolio/{portfolio_id}', headers=auth_headers)
+    etag = first.headers['ETag']
+
+    import app.models.portfolio as models
+    with monkeypatch.context() as m:
+        m.setattr(models, 'decrypt_many', lambda values: pytest.fail('decrypted on 304'))
+        cached = client.get(f'/api/portfolio/{portfolio_id}', headers={**auth_headers, 'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert cached.headers['X-SQL-Query-Count'] == '1'
+
+    # Any write to the portfolio or its holdings changes the ETag
+    etags = {etag}
+    asset = client.post(f'/api/assets/portfolio/{portfolio_id}/assets', json={
+        'symbol': 'VTI', 'quantity': 1, 'price': 10
+    }, headers=auth_headers).get_json()
+    for write in (
+        lambda: client.put(f"/api/assets/assets/{asset['id']}", json={'quantity': 2}, headers=auth_headers),
+        lambda: client.post(f'/api/assets/portfolio/{portfolio_id}/allocations',
+                            json={'symbol': 'VTI', 'target_percentage': 100}, headers=auth_headers),
+        lambda: client.put(f'/api/portfolio/{portfolio_id}', json={'name': 'Renamed'}, headers=auth_headers),
+        lambda: client.delete(f"/api/assets/assets/{asset['id']}", headers=auth_headers),
+    ):
+        write()
+        response = client.get(f'/api/portfolio/{portfolio_id}', headers={**auth_headers, 'If-None-Match': etag})
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        etags.add(etag)
+    assert len(etags) == 5
+
+def test_conditional_get_children(client, auth_headers, portfolio):
+    """Test asset and allocation lists carry ETags per representation"""
+    url = f'/api/assets/portfolio/{portfolio.id}/assets'
+    full = client.get(url, headers=auth_headers)
+    paged = client.get(url + '?limit=10', headers=auth_headers)
+    assert full.headers['ETag'] != paged.headers['ETag']
+
+    assert client.get(url, headers={**auth_headers, 'If-None-Match': full.headers['ETag']}).status_code == 304
+    assert client.get(url + '?limit=10',
+                      headers={**auth_headers, 'If-None-Match': paged.headers['ETag']}).status_code == 304
+    assert client.get('/api/assets/portfolio/999/assets',
+                      headers={**auth_headers, 'If-None-Match': full.headers['ETag']}).status_code == 404
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_rebalance_cache_invalidated_by_writes(app, client, auth_headers, portfolio, backend, tmp_path):
+    """Test cached rebalancing results are reused until the portfolio is written"""
+    from app.services.rebalance_cache import create_rebalance_cache
+    cache = create_rebalance_cache({
+        'REBALANCE_CACHE_BACKEND': backend,
+        'REBALANCE_CACHE_PATH': str(tmp_path / 'rebalance.sqlite3'),
+    })
+    app.extensions['rebalance_cache'] = cache
+    portfolio_id = portfolio.id
+    url = f'/api/portfolio/{portfolio_id}/rebalance'
+    client.post(f'/api/assets/portfolio/{portfolio_id}/assets', json={
+        'symbol': 'VTI', 'quantity': 10, 'price': 10
+    }, headers=auth_headers)
+    client.post(f'/api/assets/portfolio/{portfolio_id}/allocations',
+                json={'symbol': 'VTI', 'target_percentage': 100}, headers=auth_headers)
+
+    first = client.get(url, headers=auth_headers)
+    second = client.get(url, headers=auth_headers)
+    assert (first.headers['X-Cache'], second.headers['X-Cache']) == ('MISS', 'HIT')
+    assert first.get_json() == second.get_json()
+
+    client.post(f'/api/assets/portfolio/{portfolio_id}/allocations',
+                json={'symbol': 'BND', 'target_percentage': 40}, headers=auth_headers)
+    third = client.get(url, headers=auth_headers)
+    assert third.headers['X-Cache'] == 'MISS'
+    assert [r['symbol'] for r in third.get_json()['recommendations']] == ['VTI', 'BND']
+
+    stats = client.get('/api/health').get_json()['caches']['rebalancing']
+    assert (stats['backend'], stats['hits'], stats['misses']) == (backend, 1, 2)
+    assert stats['invalidations'] == 3
+
+def test_health_survives_broken_cache_store(app, client, monkeypatch, tmp_path):
+    """Test a failing sqlite cache store reports an unknown size instead of failing the health check"""
+    import sqlite3
+    from app.services.rebalance_cache import create_rebalance_cache
+    cache = create_rebalance_cache({
+        'REBALANCE_CACHE_BACKEND': 'sqlite',
+        'REBALANCE_CACHE_PATH': str(tmp_path / 'rebalance.sqlite3'),
+    })
+    app.extensions['rebalance_cache'] = cache
+
+    def locked():
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(cache.backend, 'size', locked)
+    response = client.get('/api/health')
+    assert response.status_code == 200
+    assert response.get_json()['caches']['rebalancing']['size'] is None
+
+def test_incomplete_cache_backend_cannot_be_instantiated():
+    """Test a cache backend missing methods fails when created, not on first use"""
+    from app.services.rebalance_cache import CacheBackend
+
+    class GetOnly(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
@@ -0,0 +1,83 @@
+"""
+Tests for the price history store and valuation endpoint
+"""
+import numpy as np
+import pytest
+from app.utils.price_history import PriceHistoryStore, ingest_rows, to_day
+
+@pytest.fixture
+def store(app, tmp_path):
+    """Point the app at an empty price history directory"""
+    app.extensions['price_history'] = PriceHistoryStore(str(tmp_path))
+    return app.extensions['price_history']
+
+def test_append_is_ordered_and_idempotent(store):
+    """Test appends keep dates increasing and skip already-stored dates"""
+    rows = [
+        {'symbol': 'aapl', 'date': '2024-01-03', 'close': '102'},
+        {'symbol': 'AAPL', 'date': '2024-01-02', 'close': '100'},
+        {'symbol': 'AAPL', 'date': '2024-01-03', 'close': '103'},
+    ]
+    assert ingest_rows(store, rows) == {'AAPL': 2}
+    assert ingest_rows(store, rows) == {'AAPL': 0}
+
+    dates, closes = store.load('AAPL')
+    assert dates.tolist() == [to_day('2024-01-02'), to_day('2024-01-03')]
+    assert closes.tolist() == [100.0, 103.0]
+
+    store.append('AAPL', [to_day('2024-01-04')], [105.0])
+    assert len(store.load('AAPL')[0]) == 3
+
+def test_value_series_carries_prices_forward(store):
+    """Test valuation over the union of trading dates"""
+    store.append('A', [to_day('2024-01-01'), to_day('2024-01-03')], [10.0, 12.0])
+    store.append('B', [to_day('2024-01-02'), to_day('2024-01-03')], [5.0, 6.0])
+
+    series = store.value_series({'A': 2, 'B': 10, 'C': 1})
+
+    assert series['days'].tolist() == [to_day(d) for d in ('2024-01-01', '2024-01-02', '2024-01-03')]
+    assert series['values'].tolist() == [20.0, 70.0, 84.0]
+    assert series['missing'] == ['C']
+
+    windowed = store.value_series({'A': 2, 'B': 10}, start=to_day('2024-01-02'), end=to_day('2024-01-02'))
+    assert windowed['values'].tolist() == [70.0]
+
+def test_value_series_long_histories(store):
+    """Test many symbols with years of daily closes sum correctly (timing: benchmarks.bench_price_history)"""
+    days = np.arange(to_day('2020-01-01'), to_day('2024-01-01'))
+    quantities = {}
+    for i in range(20):
+        store.append(f'S{i}', days, np.linspace(10, 20, len(days)))
+        quantities[f'S{i}'] = 1.0 + i
+    # Gaps in one symbol are carried forward
+    store.append('GAP', days[::7], np.full(len(days[::7]), 5.0))
+    quantities['GAP'] = 2.0
+
+    series = store.value_series(quantities)
+
+    assert series['days'].tolist() == days.tolist()
+    assert series['values'][0] == pytest.approx(10 * sum(range(1, 21)) + 10.0)
+    assert series['values'][-1] == pytest.approx(20 * sum(range(1, 21)) + 10.0)
+    assert series['missing'] == []
+
+def test_value_series_treats_invalid_symbols_as_missing(store):
+    """Test a stored symbol the store can't name doesn't fail the whole series"""
+    store.append('A', [to_day('2024-01-01')], [10.0])
+    series = store.value_series({'A': 2, 'BRK/B': 1, 'MY FUND': 3})
+    assert series['values'].tolist() == [20.0]
+    assert series['missing'] == ['BRK/B', 'MY FUND']
+
+def test_valuation_endpoint(client, auth_headers, portfolio, store):
+    """Test the portfolio valuation series endpoint"""
+    client.post(f'/api/assets/portfolio/{portfolio.id}/assets', json={
+        'symbol': 'VTI', 'name': 'Vanguard Total', 'asset_type': 'ETF', 'quantity': 3, 'price': 200
+    }, headers=auth_headers)
+    store.append('VTI', [to_day('2024-01-02'), to_day('2024-01-03')], [200.0, 210.0])
+
+    response = client.get(f'/api/portfolio/{portfolio.id}/valuation?start=2024-01-03', headers=auth_headers)
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert data['dates'] == ['2024-01-03']
+    assert data['values'] == [630.0]
+    assert client.get(f'/api/portfolio/{portfolio.id}/valuation?start=bad', headers=auth_headers).status_code == 400
@@ -0,0 +1,94 @@
+"""
+Tests for the quote service and route
+"""
+import threading
+import time
+import pytest
+from app.services.quotes import QuoteProvider, QuoteService, FakeQuoteProvider
+
+def test_cache_serves_repeat_requests():
+    """Test cached symbols don't go upstream again"""
+    provider = FakeQuoteProvider(prices={'AAPL': 190.5})
+    service = QuoteService(provider)
+
+    first = service.get_quotes(['aapl', 'MSFT'])
+    second = service.get_quotes(['AAPL'])
+
+    assert first['AAPL']['price'] == 190.5 == second['AAPL']['price']
+    assert provider.calls == [['AAPL', 'MSFT']]
+
+def test_misses_are_batched_and_unknown_symbols_cached():
+    """Test misses go upstream in provider-sized batches and unknowns are remembered"""
+    provider = FakeQuoteProvider(unknown=['NOPE'])
+    provider.max_batch = 2
+    service = QuoteService(provider)
+
+    quotes = service.get_quotes(['A', 'B', 'C', 'NOPE'])
+    service.get_quotes(['NOPE'])
+
+    assert quotes['NOPE'] is None
+    assert provider.calls == [['A', 'B'], ['C', 'NOPE']]
+
+def test_concurrent_misses_coalesce():
+    """Test simultaneous requests for the same symbol share one upstream fetch"""
+    provider = FakeQuoteProvider(latency=0.2)
+    service = QuoteService(provider)
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(service.get_quotes(['VTI']))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8
+    assert len({r['VTI']['price'] for r in results}) == 1
+    assert provider.calls == [['VTI']]
+
+def _wait_behind_fetch(service, owner_symbols, symbol):
+    """Quotes for symbol requested while another thread's fetch of owner_symbols is in flight"""
+    owner = threading.Thread(target=service.get_quotes, args=(owner_symbols,))
+    owner.start()
+    time.sleep(0.05)
+    quotes = service.get_quotes([symbol])
+    owner.join()
+    return quotes
+
+def test_waiters_allow_for_every_batch_ahead():
+    """Test a symbol in a later batch of another request's fetch is waited for, not dropped"""
+    provider = FakeQuoteProvider(latency=0.2)
+    provider.max_batch = 1
+    service = QuoteService(provider, wait_timeout=0.3)
+
+    quotes = _wait_behind_fetch(service, ['A', 'B', 'C'], 'C')
+    assert quotes['C']['symbol'] == 'C'
+    assert provider.calls == [['A'], ['B'], ['C']]
+
+def test_timed_out_waits_are_not_unknown_symbols(client, auth_headers, app):
+    """Test a wait that times out leaves the symbol out rather than reporting it unknown"""
+    provider = FakeQuoteProvider(latency=0.3)
+    service = QuoteService(provider, wait_timeout=0.05)
+    assert _wait_behind_fetch(service, ['VTI'], 'VTI') == {}
+
+    failing = FakeQuoteProvider()
+    failing.fetch_quotes = lambda symbols: 1 / 0
+    app.extensions['quote_service'] = QuoteService(failing)
+    data = client.get('/api/quotes?symbols=VTI', headers=auth_headers).get_json()
+    assert (data['quotes'], data['missing'], data['unavailable']) == ([], [], ['VTI'])
+
+def test_quotes_endpoint(client, auth_headers):
+    """Test the batch quote endpoint"""
+    response = client.get('/api/quotes?symbols=aapl,msft,AAPL', headers=auth_headers)
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert [q['symbol'] for q in data['quotes']] == ['AAPL', 'MSFT']
+    assert client.get('/api/quotes', headers=auth_headers).status_code == 400
+
+def test_incomplete_provider_cannot_be_instantiated():
+    """Test a provider without fetch_quotes fails when created, not on its first fetch"""
+    class NoFetch(QuoteProvider):
+        name = 'incomplete'
+
+    with pytest.raises(TypeError):
+        NoFetch()
@@ -3,6 +3,7 @@ Unit tests for rebalancing utilities
 """
 import pytest
 from app.utils.rebalancing import calculate_rebalancing, calculate_portfolio_metrics
+from app.utils.rebalancing_engine import rebalance_many
 
 def test_calculate_rebalancing():
     """Test rebalancing calculation"""
@@ -46,3 +47,63 @@ def test_calculate_portfolio_metrics():
     assert metrics['num_holdings'] == 3
     assert metrics['largest_holding'] == 'AAPL'
     assert 0 <= metrics['diversification_score'] <= 1
+
+def _rec(symbol, current, target, current_pct, target_pct, difference, action):
+    return {'symbol': symbol, 'current_value': current, 'target_value': target, 'current_percentage': current_pct,
+            'target_percentage': target_pct, 'difference': difference, 'action': action}
+
+def test_rebalance_many_matches_per_portfolio_results():
+    """Test the vectorized batch gives the outputs of the original one-portfolio-at-a-time implementation"""
+    portfolios = [
+        {
+            'holdings': [{'symbol': 'AAPL', 'value': 5000}, {'symbol': 'BND', 'value': 5000}],
+            'targets': [{'symbol': 'AAPL', 'target_percentage': 60}, {'symbol': 'BND', 'target_percentage': 40}],
+            'total_value': 10000,
+        },
+        {
+            'holdings': [],
+            'targets': [{'symbol': 'VTI', 'target_percentage': 100}],
+            'total_value': 0,
+        },
+        {
+            'holdings': [{'symbol': 'VTI', 'value': 700}, {'symbol': 'AAPL', 'value': 300}],
+            'targets': [{'symbol': 'VTI', 'target_percentage': 50}, {'symbol': 'GLD', 'target_percentage': 50}],
+            'total_value': 1000,
+        },
+        # Duplicate holding rows: summed for recommendations (the last row used to win), counted per row in metrics
+        {
+            'holdings': [{'symbol': 'VTI', 'value': 400}, {'symbol': 'BND', 'value': 200}, {'symbol': 'VTI', 'value': 400}],
+            'targets': [{'symbol': 'VTI', 'target_percentage': 50}, {'symbol': 'BND', 'target_percentage': 50}],
+            'total_value': 1000,
+        },
+        # Zero total with holdings: 0% everywhere and empty metrics
+        {
+            'holdings': [{'symbol': 'VTI', 'value': 0}],
+            'targets': [{'symbol': 'VTI', 'target_percentage': 100}],
+            'total_value': 0,
+        },
+    ]
+    empty_metrics = {'total_value': 0, 'num_holdings': 0, 'largest_holding': None, 'diversification_score': 0}
+    expected = [
+        {
+            'recommendations': [_rec('AAPL', 5000, 6000, 50, 60, 1000, 'BUY'), _rec('BND', 5000, 4000, 50, 40, -1000, 'SELL')],
+            'metrics': {'total_value': 10000, 'num_holdings': 2, 'largest_holding': 'AAPL', 'diversification_score': 0.5},
+        },
+        {'recommendations': [_rec('VTI', 0, 0, 0, 100, 0, 'HOLD')], 'metrics': empty_metrics},
+        {
+            'recommendations': [_rec('VTI', 700, 500, 70, 50, -200, 'SELL'), _rec('GLD', 0, 500, 0, 50, 500, 'BUY')],
+            'metrics': {'total_value': 1000, 'num_holdings': 2, 'largest_holding': 'VTI', 'diversification_score': 0.42},
+        },
+        {
+            'recommendations': [_rec('VTI', 800, 500, 80, 50, -300, 'SELL'), _rec('BND', 200, 500, 20, 50, 300, 'BUY')],
+            'metrics': {'total_value': 1000, 'num_holdings': 3, 'largest_holding': 'VTI', 'diversification_score': 0.64},
+        },
+        {'recommendations': [_rec('VTI', 0, 0, 0, 100, 0, 'HOLD')], 'metrics': empty_metrics},
+    ]
+
+    assert rebalance_many(portfolios) == expected
+    for portfolio, result in zip(portfolios, expected):
+        assert calculate_rebalancing(
+            portfolio['holdings'], portfolio['targets'], portfolio['total_value']
+        ) == result['recommendations']
+        assert calculate_portfolio_metrics(portfolio['holdings'], portfolio['total_value']) == result['metrics']
@@ -0,0 +1,79 @@
+"""
+Tests for portfolio value snapshots and history buckets
+"""
+from datetime import date, datetime
+from sqlalchemy import event
+from app import db
+from app.models import PortfolioSnapshot, PortfolioValueBucket
+from app.utils.snapshots import record_values, value_history, bucket_start
+
+def test_snapshot_written_only_on_change(client, auth_headers, portfolio):
+    """Test asset writes snapshot the new total and no-op updates don't"""
+    portfolio_id = portfolio.id
+    response = client.post(f'/api/assets/portfolio/{portfolio_id}/assets', json={
+        'symbol': 'AAPL', 'name': 'Apple', 'asset_type': 'stock', 'quantity': 10, 'price': 100
+    }, headers=auth_headers)
+    asset_id = response.get_json()['id']
+    client.put(f'/api/assets/assets/{asset_id}', json={'price': 120}, headers=auth_headers)
+    client.put(f'/api/portfolio/{portfolio_id}', json={'name': 'Renamed'}, headers=auth_headers)
+
+    # Created at 0.0, then 1000, then 1200; the rename doesn't change the value
+    assert PortfolioSnapshot.query.filter_by(portfolio_id=portfolio_id).count() == 3
+
+    history = value_history(portfolio_id, 'day')
+    assert len(history) == 1
+    assert history[0]['open'] == 0.0
+    assert history[0]['high'] == 1200.0
+    assert history[0]['low'] == 0.0
+    assert history[0]['close'] == 1200.0
+    assert history[0]['snapshots'] == 3
+
+def test_buckets_roll_over_by_period(portfolio):
+    """Test values fold into the day, week and month buckets they fall in"""
+    portfolio_id = portfolio.id
+    connection = db.session.connection()
+    record_values(connection, {portfolio_id: 500.0}, at=datetime(2024, 1, 30))
+    record_values(connection, {portfolio_id: 500.0}, at=datetime(2024, 1, 31))
+    record_values(connection, {portfolio_id: 800.0}, at=datetime(2024, 2, 1))
+    record_values(connection, {portfolio_id: 300.0}, at=datetime(2024, 2, 2))
+    db.session.commit()
+
+    monthly = value_history(portfolio_id, 'month', start=bucket_start(datetime(2024, 1, 1), 'month'),
+                            end=date(2024, 12, 31))
+    assert [(b['start'], b['open'], b['high'], b['low'], b['close']) for b in monthly] == [
+        ('2024-01-01', 500.0, 500.0, 500.0, 500.0),
+        ('2024-02-01', 800.0, 800.0, 300.0, 300.0),
+    ]
+    weekly = value_history(portfolio_id, 'week', start=bucket_start(datetime(2024, 1, 1), 'week'),
+                           end=date(2024, 12, 31))
+    assert [(b['start'], b['close']) for b in weekly] == [('2024-01-29', 300.0)]
+
+def test_history_endpoint_and_delete(client, auth_headers, portfolio):
+    """Test the history endpoint and that deleting a portfolio removes its history"""
+    portfolio_id = portfolio.id
+    client.put(f'/api/portfolio/{portfolio_id}', json={'total_value': 250}, headers=auth_headers)
+
+    response = client.get(f'/api/portfolio/{portfolio_id}/history?period=month', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json()['buckets'][-1]['close'] == 250.0
+    assert client.get(f'/api/portfolio/{portfolio_id}/history?period=year',
+                      headers=auth_headers).status_code == 400
+
+    client.delete(f'/api/portfolio/{portfolio_id}', headers=auth_headers)
+    assert PortfolioSnapshot.query.count() == 0
+    assert PortfolioValueBucket.query.count() == 0
+
+def test_record_values_locks_portfolios_first(portfolio):
+    """Test snapshot writers lock the portfolio rows before reading buckets"""
+    portfolio_id = portfolio.id
+    statements = []
+    listener = lambda conn, clause, *args: statements.append(clause)
+    event.listen(db.engine, 'before_execute', listener)
+    try:
+        record_values(db.session.connection(), {portfolio_id: 10.0})
+    finally:
+        event.remove(db.engine, 'before_execute', listener)
+
+    lock = statements[0]
+    assert lock._for_update_arg is not None
+    assert [t.name for t in lock.get_final_froms()] == ['portfolios']
@@ -0,0 +1,48 @@
+"""
+Unit tests for the integer-share trade solver
+"""
+import numpy as np
+from app.utils.trade_solver import solve_trades, build_orders
+
+def test_orders_are_whole_lots_and_respect_cash_buffer():
+    """Test orders trade whole lots and never spend into the cash buffer"""
+    result = build_orders(
+        [{'symbol': 'AAPL', 'quantity': 10, 'price': 190}, {'symbol': 'OLD', 'quantity': 7, 'price': 12}],
+        [{'symbol': 'AAPL', 'target_percentage': 50}, {'symbol': 'VTI', 'target_percentage': 50}],
+        prices={'VTI': 250},
+        lot_sizes={'VTI': 2},
+        cash=1000, cash_buffer=50, fixed_cost=1, proportional_cost=0.001
+    )
+    orders = {o['symbol']: o for o in result['orders']}
+
+    assert orders['OLD']['action'] == 'SELL' and orders['OLD']['shares'] == 7
+    assert orders['VTI']['action'] == 'BUY' and orders['VTI']['shares'] % 2 == 0
+    assert all(float(o['shares']).is_integer() for o in result['orders'])
+    assert result['summary']['feasible']
+    assert result['summary']['cash_after'] >= 50
+
+def test_min_trade_suppresses_small_orders():
+    """Test trades below the minimum notional are not placed"""
+    result = solve_trades(
+        ['A', 'B'], prices=[10, 10], quantities=[51, 49], target_weights=[0.5, 0.5], min_trade=50
+    )
+    assert np.all(result['trades'] == 0)
+
+def test_large_portfolio_stays_feasible():
+    """Test the repair step meets the buffer on a portfolio with thousands of holdings"""
+    rng = np.random.default_rng(7)
+    size = 3000
+    prices = rng.uniform(5, 500, size)
+    quantities = np.floor(rng.uniform(0, 100, size))
+    buffer = float(prices @ quantities) * 0.02
+
+    result = solve_trades(
+        [str(i) for i in range(size)], prices, quantities, rng.dirichlet(np.ones(size)),
+        cash_buffer=buffer, fixed_cost=1, proportional_cost=0.001, min_trade=20
+    )
+
+    assert result['feasible']
+    assert result['cash_after'] >= buffer
+    assert np.all(result['final_quantities'] >= 0)
+    traded = np.abs(result['notional'])
+    assert np.all((traded == 0) | (traded >= 20))
@@ -0,0 +1,42 @@
+"""
+Background job worker
+
+Claims queued jobs from the jobs table and runs them on a process pool
+(each pool process builds its own app and database pool). Start as many
+workers as needed, on one host or several; they coordinate through the
+database only.
+
+Usage (from the backend folder):
+    python worker.py [--processes 4] [--once]
+    python worker.py --enqueue snapshot    # queue an operator job, e.g. from cron
+
+Environment (flags take precedence): JOB_WORKER_PROCESSES, JOB_USER_CONCURRENCY,
+JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF, JOB_TIMEOUT, JOB_POLL_INTERVAL
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from app import create_app
+from app.services.jobs import HANDLERS, USER_KINDS, Worker, enqueue, init_process
+
+if __name__ == '__main__':
+    load_dotenv()
+    app = create_app()
+
+    parser = argparse.ArgumentParser(description='Run background jobs')
+    parser.add_argument('--processes', type=int, default=app.config['JOB_WORKER_PROCESSES'],
+                        help='jobs run at the same time')
+    parser.add_argument('--once', action='store_true', help='exit when no job is runnable')
+    parser.add_argument('--enqueue', choices=sorted(set(HANDLERS) - USER_KINDS),
+                        help='queue an operator job of this kind and exit')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.enqueue:
+            job, created = enqueue(args.enqueue, dedupe_key=f'system:{args.enqueue}')
+            print(f"Job {job.id} {'queued' if created else 'already ' + job.status}")
+        else:
+            with ProcessPoolExecutor(args.processes, initializer=init_process) as pool:
+                print(f"Worker running {args.processes} process(es)")
+                processed = Worker(pool, args.processes, log=print).run(once=args.once)
+            print(f"Done: {processed} job(s) processed")
@@ -95,18 +95,6 @@ const Dashboard: React.FC = () => {
           
           setAssets(assetsWithQuotes);
           
-          // Calculate portfolio change vs stored portfolio value
-          const currentValue = assetsWithQuotes.reduce((sum, asset) => {
-            // Use quote price if available, otherwise use stored price
-            const price = asset.quote?.price || asset.price || 0;
-            return sum + (asset.quantity * price);
-          }, 0);
-          const storedValue = selectedPortfolio?.total_value || 0;
-          
-          // Calculate change percentage
-          const baseValue = storedValue > 0 ? storedValue : currentValue * 0.92;
-          const change = calculatePortfolioChange(currentValue, baseValue);
-          setPortfolioChange(change);
         } catch (error) {
           console.error('Error fetching stock quotes:', error);
         }
@@ -160,16 +148,28 @@ const Dashboard: React.FC = () => {
     return 0;
   }, [selectedPortfolio, assets]);
   
-  // Calculate portfolio change (12.50% increase vs last month) - using useMemo to avoid recalculation
-  const portfolioChangeValue = useMemo(() => {
-    const previousMonthValue = currentTotalValue / 1.125;
-    return calculatePortfolioChange(currentTotalValue, previousMonthValue);
-  }, [currentTotalValue]);
-  
-  // Update portfolio change when total value changes
+  // Calculate portfolio change vs the close of last month's recorded value
   useEffect(() => {
-    setPortfolioChange(portfolioChangeValue);
-  }, [portfolioChangeValue]);
+    if (!selectedPortfolio) {
+      return;
+    }
+    let cancelled = false;
+    portfolioAPI.getHistory(selectedPortfolio.id, 'month', 2)
+      .then(({ buckets }) => {
+        if (cancelled) {
+          return;
+        }
+        const thisMonth = new Date().toISOString().slice(0, 7);
+        const previous = buckets.filter(bucket => !bucket.start.startsWith(thisMonth)).pop();
+        // Without history from before this month, compare against this month's open
+        const baseValue = previous ? previous.close : buckets.length > 0 ? buckets[0].open : currentTotalValue;
+        setPortfolioChange(calculatePortfolioChange(currentTotalValue, baseValue));
+      })
+      .catch(error => console.error('Error loading value history:', error));
+    return () => {
+      cancelled = true;
+    };
+  }, [selectedPortfolio, currentTotalValue]);
 
   if (loading) {
     return (
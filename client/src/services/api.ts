@@ -90,6 +90,54 @@ export interface RebalancingRecommendation {
   action: 'BUY' | 'SELL' | 'HOLD';
 }
 
+export interface RebalanceOrder {
+  symbol: string;
+  action: 'BUY' | 'SELL';
+  shares: number;
+  price: number;
+  notional: number;
+  cost: number;
+  target_value: number;
+  final_quantity: number;
+  final_percentage: number;
+  target_percentage: number;
+}
+
+export interface RebalanceOrderOptions {
+  cash?: number;
+  cash_buffer?: number;
+  fixed_cost?: number;
+  proportional_cost?: number;
+  min_trade?: number;
+  lot_sizes?: Record<string, number>;
+  prices?: Record<string, number>;
+}
+
+export interface ImportReport {
+  imported: number;
+  failed: number;
+  imported_value: number;
+  errors: { row: number; error: string }[];
+  errors_truncated: boolean;
+  total_value?: number;
+}
+
+export interface ValuationSeries {
+  portfolio_id: number;
+  dates: string[];
+  values: number[];
+  missing_symbols: string[];
+}
+
+export interface ValueBucket {
+  start: string;
+  open: number;
+  high: number;
+  low: number;
+  close: number;
+  snapshots: number;
+}
+
 export interface PortfolioMetrics {
   total_value: number;
   num_holdings: number;
@@ -97,6 +145,24 @@ export interface PortfolioMetrics {
   diversification_score: number;
 }
 
+export interface ConsolidatedHoldings {
+  total_value: number;
+  num_portfolios: number;
+  num_symbols: number;
+  hhi: number;
+  diversification_score: number;
+  symbols: {
+    symbol: string;
+    name: string;
+    asset_type: string;
+    quantity: number;
+    value: number;
+    weight: number;
+    portfolios: { portfolio_id: number; quantity: number; value: number }[];
+  }[];
+  portfolios: { portfolio_id: number; name: string; value: number; weight: number; num_holdings: number }[];
+}
+
 // Auth API
 export const authAPI = {
   verifyToken: async (firebaseUid: string, email: string, displayName?: string) => {
@@ -119,6 +185,10 @@ export const portfolioAPI = {
     const response = await api.get('/portfolio');
     return response.data;
   },
+  getConsolidated: async (): Promise<ConsolidatedHoldings> => {
+    const response = await api.get('/portfolio/consolidated');
+    return response.data;
+  },
   getById: async (id: number): Promise<Portfolio> => {
     const response = await api.get(`/portfolio/${id}`);
     return response.data;
@@ -145,6 +215,26 @@ export const portfolioAPI = {
     const response = await api.get(`/portfolio/${id}/rebalance`);
     return response.data;
   },
+  getRebalancingOrders: async (id: number, options: RebalanceOrderOptions = {}): Promise<{
+    orders: RebalanceOrder[];
+    unpriced: string[];
+    summary: { num_orders: number; total_costs: number; cash_after: number; tracking_error: number; feasible: boolean };
+  }> => {
+    const response = await api.post(`/portfolio/${id}/rebalance/orders`, options);
+    return response.data;
+  },
+  getValuation: async (id: number, start?: string, end?: string): Promise<ValuationSeries> => {
+    const response = await api.get(`/portfolio/${id}/valuation`, { params: { start, end } });
+    return response.data;
+  },
+  getHistory: async (id: number, period: 'day' | 'week' | 'month' = 'day', limit?: number): Promise<{
+    portfolio_id: number;
+    period: string;
+    buckets: ValueBucket[];
+  }> => {
+    const response = await api.get(`/portfolio/${id}/history`, { params: { period, limit } });
+    return response.data;
+  },
 };
 
 // Assets API
@@ -157,6 +247,13 @@ export const assetsAPI = {
     const response = await api.post(`/assets/portfolio/${portfolioId}/assets`, asset);
     return response.data;
   },
+  importAssets: async (portfolioId: number, file: File): Promise<ImportReport> => {
+    const isCsv = file.name.toLowerCase().endsWith('.csv');
+    const response = await api.post(`/assets/portfolio/${portfolioId}/assets/import`, file, {
+      headers: { 'Content-Type': isCsv ? 'text/csv' : 'application/x-ndjson' },
+    });
+    return response.data;
+  },
   updateAsset: async (id: number, asset: Partial<Asset>): Promise<Asset> => {
     const response = await api.put(`/assets/assets/${id}`, asset);
     return response.data;
@@ -175,6 +272,15 @@ export const assetsAPI = {
   deleteAllocation: async (id: number): Promise<void> => {
     await api.delete(`/assets/allocations/${id}`);
   },
+  // Saves a whole target model in one request; the targets must sum to 100
+  replaceAllocations: async (
+    portfolioId: number,
+    allocations: Partial<AssetAllocation>[],
+    mode: 'replace' | 'merge' = 'replace'
+  ): Promise<AssetAllocation[]> => {
+    const response = await api.put(`/assets/portfolio/${portfolioId}/allocations`, { allocations, mode });
+    return response.data;
+  },
 };
 
 export default api;
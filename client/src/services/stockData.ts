@@ -1,6 +1,8 @@
 // Stock data service - fetches real-time stock prices
-// Using Yahoo Finance API (free, no API key required)
-// In production, consider using a more reliable service like Alpha Vantage or Finnhub
+// Quotes come from the backend /api/quotes endpoint, which batches upstream
+// requests and shares a cache across all users
+
+import api from './api';
 
 export interface StockQuote {
   symbol: string;
@@ -10,84 +12,64 @@ export interface StockQuote {
   previousClose?: number;
 }
 
-const CACHE_DURATION = 60000; // 1 minute cache
-const stockCache: Map<string, { data: StockQuote; timestamp: number }> = new Map();
-
-// Fetch stock quote from Yahoo Finance
-export async function getStockQuote(symbol: string): Promise<StockQuote> {
-  const cacheKey = symbol.toUpperCase();
-  const cached = stockCache.get(cacheKey);
-  
-  // Return cached data if still valid
-  if (cached && Date.now() - cached.timestamp < CACHE_DURATION) {
-    return cached.data;
-  }
+interface BackendQuote {
+  symbol: string;
+  price: number;
+  previous_close: number;
+}
 
-  try {
-    // Using Yahoo Finance API (free, no key required)
-    // Note: This may have CORS issues in browser. Consider using a proxy or backend endpoint in production
-    const response = await fetch(
-      `https://query1.finance.yahoo.com/v8/finance/chart/${symbol.toUpperCase()}?interval=1d&range=1d`,
-      {
-        method: 'GET',
-        headers: {
-          'Accept': 'application/json',
-        },
-      }
-    );
-    
-    if (!response.ok) {
-      throw new Error(`Failed to fetch stock data for ${symbol}`);
-    }
+// Return mock data with simulated change if the API fails (for development)
+function mockQuote(symbol: string): StockQuote {
+  const mockPrice = 100 + (Math.random() - 0.5) * 20;
+  const mockChange = (Math.random() - 0.5) * 5;
+  const mockChangePercent = (mockChange / mockPrice) * 100;
 
-    const data = await response.json();
-    const result = data.chart?.result?.[0];
-    
-    if (!result || !result.meta) {
-      throw new Error(`No data found for ${symbol}`);
-    }
+  return {
+    symbol: symbol.toUpperCase(),
+    price: mockPrice,
+    change: mockChange,
+    changePercent: mockChangePercent,
+    previousClose: mockPrice - mockChange,
+  };
+}
 
-    const meta = result.meta;
-    const currentPrice = meta.regularMarketPrice || meta.previousClose || 0;
-    const previousClose = meta.previousClose || currentPrice;
-    const change = currentPrice - previousClose;
-    const changePercent = previousClose !== 0 ? (change / previousClose) * 100 : 0;
+function toStockQuote(quote: BackendQuote): StockQuote {
+  const previousClose = quote.previous_close || quote.price;
+  const change = quote.price - previousClose;
+  const changePercent = previousClose !== 0 ? (change / previousClose) * 100 : 0;
 
-    const quote: StockQuote = {
-      symbol: symbol.toUpperCase(),
-      price: currentPrice,
-      change,
-      changePercent,
-      previousClose,
-    };
+  return {
+    symbol: quote.symbol,
+    price: quote.price,
+    change,
+    changePercent,
+    previousClose,
+  };
+}
 
-    // Cache the result
-    stockCache.set(cacheKey, { data: quote, timestamp: Date.now() });
+// Fetch multiple stock quotes in one backend call
+export async function getStockQuotes(symbols: string[]): Promise<StockQuote[]> {
+  const unique = Array.from(new Set(symbols.map(symbol => symbol.trim().toUpperCase()).filter(Boolean)));
+  if (unique.length === 0) {
+    return [];
+  }
 
-    return quote;
+  let bySymbol = new Map<string, StockQuote>();
+  try {
+    const response = await api.get('/quotes', { params: { symbols: unique.join(',') } });
+    const quotes: BackendQuote[] = response.data.quotes;
+    bySymbol = new Map(quotes.map(quote => [quote.symbol, toStockQuote(quote)]));
   } catch (error) {
-    console.error(`Error fetching stock data for ${symbol}:`, error);
-    
-    // Return mock data with simulated change if API fails (for development)
-    // In production, you might want to use a backend proxy to avoid CORS issues
-    const mockPrice = 100 + (Math.random() - 0.5) * 20;
-    const mockChange = (Math.random() - 0.5) * 5;
-    const mockChangePercent = (mockChange / mockPrice) * 100;
-    
-    return {
-      symbol: symbol.toUpperCase(),
-      price: mockPrice,
-      change: mockChange,
-      changePercent: mockChangePercent,
-      previousClose: mockPrice - mockChange,
-    };
+    console.error('Error fetching stock quotes:', error);
   }
+
+  return symbols.map(symbol => bySymbol.get(symbol.trim().toUpperCase()) || mockQuote(symbol));
 }
 
-// Fetch multiple stock quotes
-export async function getStockQuotes(symbols: string[]): Promise<StockQuote[]> {
-  const promises = symbols.map(symbol => getStockQuote(symbol));
-  return Promise.all(promises);
+// Fetch a single stock quote
+export async function getStockQuote(symbol: string): Promise<StockQuote> {
+  const [quote] = await getStockQuotes([symbol]);
+  return quote;
 }
 
 // Calculate portfolio change percentage